@@ -0,0 +1,18 @@
+from rest_framework.authentication import (BaseAuthentication,
+                                           TokenAuthentication)
+
+
+class BatchSubrequestAuthentication(BaseAuthentication):
+    """Автор пакетного запроса для его подзапросов (api.views.BatchView).
+
+    BatchView сохраняет (user, auth) пакетного запроса в batch_auth
+    подзапроса, поэтому подзапросы не проверяют токен повторно.
+    Остальные запросы аутентифицируются следующими классами.
+    """
+
+    def authenticate(self, request):
+        return getattr(request, 'batch_auth', None)
+
+    def authenticate_header(self, request):
+        # первый класс задает заголовок ответа 401
+        return TokenAuthentication.keyword
@@ -0,0 +1,86 @@
+"""Условные GET-запросы: ETag и ответ 304 без сериализации данных."""
+import hashlib
+
+from django.utils.cache import parse_etags, patch_vary_headers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+from core.versions import get_model_key, get_user_state_key, get_versions
+
+
+class NotModified(APIException):
+    status_code = status.HTTP_304_NOT_MODIFIED
+
+
+class ConditionalGetMixin:
+    """ETag и ответ 304 Not Modified для действий из etag_actions.
+
+    ETag строится из адреса запроса, формата ответа и версий данных
+    (core.versions) моделей etag_models, а при etag_per_user - и версии
+    состояния пользователя (избранное, список покупок, подписки).
+    Проверка If-None-Match - один запрос к таблице версий. Прочитанные
+    версии сохраняются в request.data_versions ({ключ: версия}) для
+    кэшей, зависящих от тех же данных (recipes.tag_bits).
+    """
+
+    etag_actions = ('list', 'retrieve')
+    etag_models = ()
+    etag_per_user = True
+
+    def get_etag_keys(self):
+        keys = [get_model_key(model) for model in self.etag_models]
+        user = self.request.user
+        if self.etag_per_user and user.is_authenticated:
+            keys.append(get_user_state_key(user.pk))
+        return keys
+
+    def get_etag_versions(self, keys):
+        """Значения для ETag, None - ETag не выдается."""
+        return get_versions(keys)
+
+    def get_etag(self):
+        keys = self.get_etag_keys()
+        versions = self.get_etag_versions(keys)
+        if versions is None:
+            return None
+        self.request.data_versions = dict(zip(keys, versions))
+        # версии данных ответа без адреса: ими помечаются кэши,
+        # общие для разных страниц и форматов (api.paginator)
+        self.data_version = '|'.join(map(str, (*keys, *versions)))
+        value = '|'.join(map(str, (
+            self.request.build_absolute_uri(),
+            self.request.accepted_media_type, *keys, *versions)))
+        return '"{}"'.format(
+            hashlib.blake2b(value.encode(), digest_size=16).hexdigest())
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = None
+        self.data_version = None
+        if request.method not in ('GET', 'HEAD') or (
+                self.action not in self.etag_actions):
+            return
+        self.etag = self.get_etag()
+        if self.etag is None:
+            return
+        # сжатые ответы получают слабый ETag, см. CompressionMiddleware
+        etags = [etag[2:] if etag.startswith('W/') else etag
+                 for etag in parse_etags(
+                     request.META.get('HTTP_IF_NONE_MATCH', ''))]
+        if self.etag in etags or '*' in etags:
+            raise NotModified()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        if getattr(self, 'etag', None) and response.status_code in (
+                status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = self.etag
+            patch_vary_headers(response, ('Authorization',))
+        return response
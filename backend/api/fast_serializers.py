@@ -0,0 +1,263 @@
+"""Быстрый вывод рецептов и подписок без сериализаторов DRF.
+
+Сериализаторы DRF на каждую строку выдачи создают вложенные
+сериализаторы и обходят поля, что для списков рецептов стоит дороже
+самих запросов к БД. Здесь ответ собирается из строк values() (теги и
+ингредиенты - из Recipe.snapshot) и словарей связей, загруженных одним
+запросом на связь: запросов столько же, сколько у сериализаторов, а
+вывод совпадает с выводом RecipeReadSerializer,
+RecipeShortenInfoSerializer и UserSubscribeSerializer байт в байт
+(golden-тест в api/tests.py). Функции вывода выбранных полей
+подбираются один раз на запрос.
+
+Загрузка связей (load) и сборка ответа (build) разделены, чтобы
+стоимость сборки можно было замерить отдельно от запросов.
+
+NormalizedRecipeSerializer выводит нормализованное представление
+(representation=normalized), у которого нет аналога среди
+сериализаторов DRF.
+"""
+from collections import defaultdict
+
+from rest_framework import serializers
+
+from .serializers import (RecipeReadSerializer, RecipeShortenInfoSerializer,
+                          UserSubscribeSerializer, get_followed_ids)
+from recipes.models import (SNAPSHOT_INGREDIENT_FIELDS, SNAPSHOT_TAG_FIELDS,
+                            Recipe)
+
+AUTHOR_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name')
+RECIPE_COLUMNS = ('image', 'name', 'text', 'cooking_time')
+SNAPSHOT_FIELDS = ('tags', 'ingredients')
+USER_FLAGS = ('is_favorited', 'is_in_shopping_cart')
+IMAGE_STORAGE = Recipe._meta.get_field('image').storage
+
+
+def is_authenticated(request):
+    return request is not None and not request.user.is_anonymous
+
+
+class FastRecipeSerializer:
+    """Вывод рецептов из строк Recipe.objects.values().
+
+    fields - выводимые поля RecipeReadSerializer в порядке его
+    Meta.fields. Без request ссылки на картинки относительные, а
+    is_favorited и is_in_shopping_cart ложны, как у сериализатора DRF
+    без контекста. При user_flags=False у автора нет is_subscribed.
+    """
+
+    def __init__(self, request=None, fields=RecipeReadSerializer.Meta.fields,
+                 user_flags=True):
+        self.request = request
+        self.fields = fields
+        self.user_flags = user_flags
+        self.authenticated = is_authenticated(request)
+        self.builders = tuple(
+            (name, getattr(self, f'build_{name}')) for name in fields)
+        self.followed_ids = frozenset()
+
+    def get_columns(self):
+        columns = {'id'}
+        for name in self.fields:
+            if name == 'author':
+                columns.add('author_id')
+                columns.update(f'author__{field}' for field in AUTHOR_FIELDS
+                               if field != 'id')
+            elif name in RECIPE_COLUMNS:
+                columns.add(name)
+            elif name in SNAPSHOT_FIELDS:
+                columns.add('snapshot')
+            elif name in USER_FLAGS and self.authenticated:
+                # аннотации RecipeQuerySet.with_user_flags
+                columns.add(name)
+        return columns
+
+    def get_rows(self, queryset, *extra_columns):
+        """Строки queryset с колонками, нужными выбранным полям."""
+        return queryset.values(*self.get_columns(), *extra_columns)
+
+    def serialize(self, rows):
+        rows = list(rows)
+        self.load(rows)
+        return self.build(rows)
+
+    def load(self, rows):
+        """Загрузка связей рецептов rows: не больше запроса на связь."""
+        if rows and 'author' in self.fields and self.authenticated and (
+                self.user_flags):
+            self.followed_ids = get_followed_ids(self.request)
+
+    def build(self, rows):
+        """Словари ответа по строкам rows и загруженным связям."""
+        builders = self.builders
+        return [{name: build(row) for name, build in builders}
+                for row in rows]
+
+    def build_id(self, row):
+        return row['id']
+
+    def build_author(self, row):
+        author = {
+            'email': row['author__email'],
+            'id': row['author_id'],
+            'username': row['author__username'],
+            'first_name': row['author__first_name'],
+            'last_name': row['author__last_name'],
+        }
+        if self.user_flags:
+            author['is_subscribed'] = row['author_id'] in self.followed_ids
+        return author
+
+    def build_ingredients(self, row):
+        return [dict(zip(SNAPSHOT_INGREDIENT_FIELDS, values))
+                for values in row['snapshot']['ingredients']]
+
+    def build_tags(self, row):
+        return [dict(zip(SNAPSHOT_TAG_FIELDS, values))
+                for values in row['snapshot']['tags']]
+
+    def build_image(self, row):
+        """Ссылка на картинку, как у serializers.ImageField."""
+        if not row['image']:
+            return None
+        url = IMAGE_STORAGE.url(row['image'])
+        if self.request is None:
+            return url
+        return self.request.build_absolute_uri(url)
+
+    def build_name(self, row):
+        return row['name']
+
+    def build_text(self, row):
+        return row['text']
+
+    def build_cooking_time(self, row):
+        return row['cooking_time']
+
+    def build_is_favorited(self, row):
+        return self.authenticated and row['is_favorited']
+
+    def build_is_in_shopping_cart(self, row):
+        return self.authenticated and row['is_in_shopping_cart']
+
+
+class NormalizedRecipeSerializer(FastRecipeSerializer):
+    """Вывод рецептов со ссылками на авторов, теги и ингредиенты по id.
+
+    Автор рецепта - id пользователя, теги - список id, ингредиенты -
+    id и количество. Каждый автор, тег и ингредиент выводится один раз
+    в разделе included (get_included), как в выводе FastRecipeSerializer.
+    """
+
+    INCLUDED = {'author': 'users', 'tags': 'tags',
+                'ingredients': 'ingredients'}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.included = {kind: {} for name, kind in self.INCLUDED.items()
+                         if name in self.fields}
+
+    def build_tags(self, row):
+        included = self.included['tags']
+        tag_ids = []
+        for values in row['snapshot']['tags']:
+            tag_id = values[0]
+            tag_ids.append(tag_id)
+            if tag_id not in included:
+                included[tag_id] = dict(zip(SNAPSHOT_TAG_FIELDS, values))
+        return tag_ids
+
+    def build_ingredients(self, row):
+        included = self.included['ingredients']
+        ingredients = []
+        for ingredient_id, name, unit, amount in (
+                row['snapshot']['ingredients']):
+            ingredients.append({'id': ingredient_id, 'amount': amount})
+            if ingredient_id not in included:
+                included[ingredient_id] = {
+                    'id': ingredient_id, 'name': name,
+                    'measurement_unit': unit}
+        return ingredients
+
+    def build_author(self, row):
+        author_id = row['author_id']
+        users = self.included['users']
+        if author_id not in users:
+            users[author_id] = super().build_author(row)
+        return author_id
+
+    def get_included(self):
+        """Связанные объекты по разделам, в каждом - по возрастанию id."""
+        return {kind: [objects[pk] for pk in sorted(objects)]
+                for kind, objects in self.included.items()}
+
+
+class FastSubscriptionSerializer:
+    """Вывод подписок из строк User.objects.values().
+
+    fields - выводимые поля UserSubscribeSerializer. Рецепты авторов
+    выводятся как RecipeShortenInfoSerializer без контекста запроса.
+    """
+
+    def __init__(self, request,
+                 fields=UserSubscribeSerializer.Meta.fields):
+        self.request = request
+        self.fields = fields
+        self.recipe_serializer = FastRecipeSerializer(
+            fields=RecipeShortenInfoSerializer.Meta.fields)
+        self.recipes = {}
+        self.followed_ids = frozenset()
+
+    def get_rows(self, queryset):
+        # recipes_count - аннотация FoodgramUserViewSet.get_queryset
+        return queryset.values('id', *(
+            name for name in AUTHOR_FIELDS + ('recipes_count',)
+            if name in self.fields and name != 'id'))
+
+    def serialize(self, rows):
+        rows = list(rows)
+        self.load(rows)
+        return self.build(rows)
+
+    def get_recipes_limit(self):
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if not recipes_limit:
+            return None
+        try:
+            return int(recipes_limit)
+        except ValueError as exc:
+            raise serializers.ValidationError(
+                'Значение recipes_limit должно быть числом!') from exc
+
+    def load(self, rows):
+        if not rows:
+            return
+        if 'is_subscribed' in self.fields and is_authenticated(
+                self.request):
+            self.followed_ids = get_followed_ids(self.request)
+        if 'recipes' in self.fields:
+            recipes_limit = self.get_recipes_limit()
+            recipe_rows = defaultdict(list)
+            for recipe_row in self.recipe_serializer.get_rows(
+                    Recipe.objects.filter(
+                        author_id__in=[row['id'] for row in rows]),
+                    'author_id'):
+                recipe_rows[recipe_row['author_id']].append(recipe_row)
+            self.recipes = {
+                author_id: author_rows[:recipes_limit]
+                for author_id, author_rows in recipe_rows.items()}
+
+    def build(self, rows):
+        data = []
+        for row in rows:
+            user = {}
+            for name in self.fields:
+                if name == 'is_subscribed':
+                    user[name] = row['id'] in self.followed_ids
+                elif name == 'recipes':
+                    user[name] = self.recipe_serializer.build(
+                        self.recipes.get(row['id'], ()))
+                else:
+                    user[name] = row[name]
+            data.append(user)
+        return data
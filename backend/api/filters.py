@@ -1,19 +1,49 @@
-from django_filters import AllValuesMultipleFilter, CharFilter
+from functools import partial
+
+from django_filters import CharFilter, MultipleChoiceFilter
 from django_filters.rest_framework import FilterSet
 
-from recipes.models import Recipe, Ingredient
+from core.versions import get_model_key
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.tag_bits import get_tag_bits, get_tags_mask
+
+
+def get_tag_version(request):
+    """Версия тегов, прочитанная для ETag запроса, или None."""
+    versions = getattr(request, 'data_versions', None) or {}
+    return versions.get(get_model_key(Tag))
+
+
+def get_tag_choices(version=None):
+    return [(slug, slug) for slug in get_tag_bits(version)]
 
 
 class RecipeFilter(FilterSet):
-    tags = AllValuesMultipleFilter(field_name='tags__slug')
+    # выбор по маске тегов рецепта: без соединений и дублей рецептов
+    tags = MultipleChoiceFilter(choices=get_tag_choices,
+                                method='filter_tags')
     # BooleanFilter на SQLite не обрабатывает 0 и 1, только true и false
     # поэтому выбран менее очевидный тип CharFilter
     is_favorited = CharFilter(method='filter_is_favorited')
     is_in_shopping_cart = CharFilter(method='filter_is_in_cart')
+    # остальные значения ordering игнорируются, как до появления
+    # рейтинга: клиенты передают, например, ordering=-pub_date
+    ordering = CharFilter(method='order_by_trending')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+                  'ordering')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # слаги тегов той версии, по которой построен ETag ответа
+        self.filters['tags'].extra['choices'] = partial(
+            get_tag_choices, get_tag_version(self.request))
+
+    def filter_tags(self, queryset, name, slugs):
+        return queryset.with_any_tag(
+            get_tags_mask(slugs, get_tag_version(self.request)))
 
     def filter_is_favorited(self, queryset, name, is_favorite):
         user = self.request.user
@@ -33,6 +63,13 @@ class RecipeFilter(FilterSet):
                 return queryset.filter(carts__user=user)
         return queryset
 
+    def order_by_trending(self, queryset, name, ordering):
+        """Рецепты из рейтинга популярных в порядке мест."""
+        if ordering != 'trending':
+            return queryset
+        return queryset.filter(trending__isnull=False).order_by(
+            'trending__position')
+
     def transform_to_int_filter_param(self, param_name, param_value):
         try:
             param_value = int(param_value)
@@ -0,0 +1,45 @@
+"""Компактная запись множеств id для /api/users/me/state/.
+
+delta - id по возрастанию, первый как есть, остальные разностью с
+предыдущим: небольшие числа, хорошо сжимаемые gzip и brotli.
+bitset - битовая маска в base64: бит i (байт i // 8, разряд i % 8,
+младшие разряды первыми) выставлен, если id i входит в множество.
+"""
+import base64
+
+
+def encode_delta(ids):
+    encoded = []
+    previous = 0
+    for pk in sorted(ids):
+        encoded.append(pk - previous)
+        previous = pk
+    return encoded
+
+
+def decode_delta(encoded):
+    ids = []
+    previous = 0
+    for delta in encoded:
+        previous += delta
+        ids.append(previous)
+    return ids
+
+
+def encode_bitset(ids):
+    mask = 0
+    for pk in ids:
+        mask |= 1 << pk
+    return base64.b64encode(
+        mask.to_bytes((mask.bit_length() + 7) // 8, 'little')).decode()
+
+
+def decode_bitset(encoded):
+    mask = int.from_bytes(base64.b64decode(encoded), 'little')
+    return [pk for pk in range(mask.bit_length()) if mask >> pk & 1]
+
+
+ENCODERS = {
+    'delta': encode_delta,
+    'bitset': encode_bitset,
+}
@@ -1,5 +1,238 @@
-from rest_framework.pagination import PageNumberPagination
+"""Пагинация списков API.
 
+Наличие следующей страницы определяется по одной лишней записи,
+загруженной вместе со страницей, а количество записей (count) -
+функцией get_count: из кэша, по оценке планировщика PostgreSQL для
+больших выборок или через COUNT(*). На последней странице количество
+известно без запроса, а с параметром count=0 не считается вовсе (в
+ответе count равен null).
+"""
+import hashlib
+import json
 
-class RecipePagination(PageNumberPagination):
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import (EmptyPage, InvalidPage, Page,
+                                   PageNotAnInteger, Paginator)
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (LimitOffsetPagination,
+                                       PageNumberPagination)
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from core.metrics import record_cache_access
+
+COUNT_CACHE_PREFIX = 'api:count:'
+
+
+def get_count_query(queryset):
+    """Выборка для подсчета: без сортировки и лишних колонок."""
+    return queryset.order_by().values('pk').query
+
+
+def estimate_count(queryset):
+    """Оценка количества записей планировщиком PostgreSQL.
+
+    Для выборки без фильтров - из статистики таблицы (pg_class), для
+    остальных - из плана запроса. None - оценки нет.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    query = get_count_query(queryset)
+    with connection.cursor() as cursor:
+        if not query.where and not query.distinct:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table])
+            estimate, = cursor.fetchone()
+            # -1 - таблица еще не анализировалась
+            return int(estimate) if estimate >= 0 else None
+        sql, params = query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan, = cursor.fetchone()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+def get_count(queryset, version=None):
+    """Количество записей queryset для ответа со страницей.
+
+    Кэшируется на PAGINATION_COUNT_CACHE_TIMEOUT секунд по SQL выборки
+    (фильтры запроса, включая пользователя) и version - версиям данных
+    ответа (ConditionalGetMixin.data_version), с которыми кэш
+    сбрасывается при изменениях. Начиная с
+    PAGINATION_COUNT_ESTIMATE_THRESHOLD записей количество берется из
+    оценки планировщика: точное число на таких объемах не нужно.
+    """
+    if not isinstance(queryset, QuerySet):
+        return len(queryset)
+    try:
+        sql, params = get_count_query(queryset).sql_with_params()
+    except EmptyResultSet:
+        return 0
+    value = '|'.join(map(str, (sql, params, version)))
+    key = COUNT_CACHE_PREFIX + hashlib.blake2b(
+        value.encode(), digest_size=16).hexdigest()
+    count = cache.get(key)
+    record_cache_access('pagination_count', count is not None)
+    if count is None:
+        count = estimate_count(queryset)
+        if count is None or (
+                count < settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD):
+            count = queryset.count()
+        cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+class LookaheadPage(Page):
+
+    def __init__(self, object_list, number, paginator, next_exists):
+        super().__init__(object_list, number, paginator)
+        self.next_exists = next_exists
+
+    def has_next(self):
+        return self.next_exists
+
+
+class LookaheadPaginator(Paginator):
+    """Paginator, которому для страницы и ссылок не нужен count."""
+
+    def __init__(self, object_list, per_page, version=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.version = version
+        self.last_count = None
+
+    @cached_property
+    def count(self):
+        if self.last_count is not None:
+            return self.last_count
+        return get_count(self.object_list, self.version)
+
+    def validate_number(self, number):
+        # номер за пределами выборки дает пустую страницу в page()
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы должен быть числом')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('На этой странице нет результатов')
+        next_exists = len(rows) > self.per_page
+        if not next_exists:
+            self.last_count = bottom + len(rows)
+        return LookaheadPage(rows[:self.per_page], number, self, next_exists)
+
+
+class CountMixin:
+    """Параметр count=0: ответ без количества записей."""
+
+    count_query_param = 'count'
+
+    def count_requested(self, request):
+        return request.query_params.get(self.count_query_param) not in (
+            '0', 'false')
+
+
+class RecipePagination(CountMixin, PageNumberPagination):
+    django_paginator_class = LookaheadPaginator
     page_size_query_param = 'limit'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        self.request = request
+        self.with_count = self.count_requested(request)
+        paginator = self.django_paginator_class(
+            queryset, page_size, getattr(view, 'data_version', None))
+        page_number = request.query_params.get(self.page_query_param, 1)
+        if page_number in self.last_page_strings:
+            page_number = paginator.num_pages
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)))
+        if self.with_count and self.template is not None and (
+                paginator.num_pages > 1):
+            self.display_page_controls = True
+        return list(self.page)
+
+    def get_paginated_response(self, data):
+        count = self.page.paginator.count if self.with_count else None
+        return Response({
+            'count': count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class UserPagination(CountMixin, LimitOffsetPagination):
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        self.request = request
+        rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.next_exists = len(rows) > self.limit
+        self.count = None
+        if self.count_requested(request):
+            if self.next_exists or (self.offset and not rows):
+                self.count = get_count(
+                    queryset, getattr(view, 'data_version', None))
+            else:
+                # последняя страница
+                self.count = self.offset + len(rows)
+            if self.template is not None and self.count > self.limit:
+                self.display_page_controls = True
+        return rows[:self.limit]
+
+    def get_next_link(self):
+        if not self.next_exists:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(
+            url, self.offset_query_param, self.offset + self.limit)
+
+
+class FeedPagination:
+    """Пагинация ленты подписок курсором по ключу (pub_date, id)."""
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+    def get_cursor(self, request):
+        return request.query_params.get(self.cursor_query_param)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return settings.REST_FRAMEWORK['PAGE_SIZE']
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_paginated_response(self, request, data, next_cursor):
+        next_url = None
+        if next_cursor is not None:
+            next_url = replace_query_param(request.build_absolute_uri(),
+                                           self.cursor_query_param,
+                                           next_cursor)
+        return Response({'next': next_url, 'results': data})
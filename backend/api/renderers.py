@@ -0,0 +1,47 @@
+"""Быстрые рендереры ответов API: orjson и MessagePack.
+
+Типы, которые orjson и msgpack не сериализуют сами (Decimal, ленивые
+строки переводов, QuerySet и т.п.), преобразуются так же, как в
+стандартном JSONRenderer DRF.
+"""
+import msgpack
+import orjson
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# даты - как в JSONRenderer DRF (миллисекунды, Z для UTC)
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+default = JSONEncoder().default
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        options = ORJSON_OPTIONS
+        # отступы запрашивает браузерный API
+        # или клиент в Accept: application/json; indent=2
+        renderer_context = renderer_context or {}
+        if renderer_context.get('indent') or 'indent' in (
+                accepted_media_type or ''):
+            options |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=default, option=options)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Ответ в MessagePack по заголовку Accept: application/msgpack."""
+
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=default)
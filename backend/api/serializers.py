@@ -3,18 +3,76 @@ import base64
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import check_password
 from django.core.files.base import ContentFile
-from django.db.models import F
+from django.db import transaction
 from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from djoser.serializers import UserCreateSerializer
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
-from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+from core.changes import record_change
+from core.models import Change
+from core.versions import bump_model_versions
+from recipes.feed import backfill_feed
+from recipes.jobs import process_recipe_change
+from recipes.models import (SNAPSHOT_INGREDIENT_FIELDS, SNAPSHOT_TAG_FIELDS,
+                            Favorite, Ingredient, Recipe, ShoppingCart,
                             Tag, TagRecipe, IngredientRecipe)
 from users.models import Follow
 
 User = get_user_model()
+# признаки пользователя в выдаче: с параметром user_flags=0 не выводятся,
+# клиент берет их из /api/users/me/state/
+USER_FLAGS = ('is_favorited', 'is_in_shopping_cart', 'is_subscribed')
+
+
+def get_request_cache(request):
+    """Словарь данных, запоминаемых до конца обработки запроса.
+
+    Хранится в HttpRequest: подзапросы /api/batch/ получают словарь
+    пакетного запроса.
+    """
+    request = getattr(request, '_request', request)
+    if not hasattr(request, 'request_cache'):
+        request.request_cache = {}
+    return request.request_cache
+
+
+def get_followed_ids(request):
+    """Id авторов, на которых подписан автор запроса.
+
+    Выбираются одним запросом и запоминаются до конца обработки запроса.
+    """
+    request_cache = get_request_cache(request)
+    if 'followed_ids' not in request_cache:
+        request_cache['followed_ids'] = set(
+            request.user.subscriber.values_list('following_id', flat=True))
+    return request_cache['followed_ids']
+
+
+class SparseFieldsMixin:
+    """Вывод только перечисленных в аргументе fields полей.
+
+    Список полей формирует SparseFieldsetMixin представления по
+    параметрам запроса fields= и omit=. При user_flags=False признаки
+    пользователя убираются и из вложенных сериализаторов.
+    """
+
+    def __init__(self, *args, fields=None, user_flags=True, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        if not user_flags:
+            self.omit_user_flags()
+
+    def omit_user_flags(self):
+        for name in USER_FLAGS:
+            self.fields.pop(name, None)
+        for field in self.fields.values():
+            if isinstance(field, SparseFieldsMixin):
+                field.omit_user_flags()
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -28,7 +86,7 @@ class TagSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Tag
-        fields = '__all__'
+        fields = ('id', 'name', 'color', 'slug')
 
 
 class APIUserCreateSerializer(serializers.ModelSerializer):
@@ -58,7 +116,7 @@ class ResetPasswordeSerializer(serializers.Serializer):
         return current_password
 
 
-class APIUserSerializer(serializers.ModelSerializer):
+class APIUserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -76,13 +134,13 @@ class APIUserSerializer(serializers.ModelSerializer):
         if user.is_anonymous or user_obj.is_anonymous:
             return False
 
-        return user.subscriber.filter(following=user_obj).exists()
+        return user_obj.pk in get_followed_ids(request)
 
 
 class UserSubscribeSerializer(APIUserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(source='recipes.count',
-                                             read_only=True)
+    # аннотируется в FoodgramUserViewSet.get_queryset
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta(APIUserSerializer.Meta):
         fields = ('email', 'id', 'username', 'first_name', 'last_name',
@@ -94,6 +152,8 @@ class UserSubscribeSerializer(APIUserSerializer):
 
         if recipes_limit:
             recipes_limit = self.validate_recipes_limit(recipes_limit)
+        # рецепты подгружаются заранее через prefetch_related,
+        # срез выполняется над загруженным списком
         recipes = user.recipes.all()[:recipes_limit]
         serializer = RecipeShortenInfoSerializer(recipes, many=True)
         return serializer.data
@@ -118,12 +178,13 @@ class Base64ImageField(serializers.ImageField):
         return super().to_internal_value(data)
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализатор для вывода полной информации о рецепте."""
 
     author = APIUserSerializer()
+    # теги и ингредиенты - из Recipe.snapshot, без запросов к связям
     ingredients = serializers.SerializerMethodField()
-    tags = TagSerializer(many=True)
+    tags = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -134,16 +195,27 @@ class RecipeReadSerializer(serializers.ModelSerializer):
                   'is_in_shopping_cart')
 
     def get_ingredients(self, recipe):
-        return recipe.ingredients.values('id', 'name', 'measurement_unit',
-                                         amount=F('ingredient_recipe__amount'))
+        return [dict(zip(SNAPSHOT_INGREDIENT_FIELDS, values))
+                for values in recipe.snapshot['ingredients']]
+
+    def get_tags(self, recipe):
+        return [dict(zip(SNAPSHOT_TAG_FIELDS, values))
+                for values in recipe.snapshot['tags']]
 
     def get_is_favorited(self, recipe):
-        return self.get_additional_fields(recipe.favorites)
+        return self.get_additional_fields(recipe, 'is_favorited',
+                                          recipe.favorites)
 
     def get_is_in_shopping_cart(self, recipe):
-        return self.get_additional_fields(recipe.carts)
+        return self.get_additional_fields(recipe, 'is_in_shopping_cart',
+                                          recipe.carts)
 
-    def get_additional_fields(self, recipe_related_manager_obj):
+    def get_additional_fields(self, recipe, annotation_name,
+                              recipe_related_manager_obj):
+        """Значение из аннотации RecipeQuerySet.with_user_flags.
+
+        Если рецепт получен без аннотации, выполняется отдельный запрос.
+        """
         request = self.context.get('request')
         if request is None:
             return False
@@ -152,9 +224,9 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         if user.is_anonymous:
             return False
 
-        return user.pk in list(
-            recipe_related_manager_obj.values_list('user__pk', flat=True)
-        )
+        if hasattr(recipe, annotation_name):
+            return getattr(recipe, annotation_name)
+        return recipe_related_manager_obj.filter(user=user).exists()
 
 
 class RecipeShortenInfoSerializer(RecipeReadSerializer):
@@ -201,7 +273,12 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
                   'name', 'text', 'cooking_time')
 
     def to_representation(self, instance):
-        """Формирование данных для вывода."""
+        """Формирование данных для вывода.
+
+        Рецепт перечитывается из БД: после update() объект instance
+        содержит старые значения полей.
+        """
+        instance = Recipe.objects.with_related().get(pk=instance.pk)
         serializer = RecipeReadSerializer(instance, many=False)
         return serializer.data
 
@@ -210,11 +287,16 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
 
-        recipe = Recipe.objects.create(
-            **validated_data, author=self.context.get('request').user)
+        # читатели видят рецепт, его версию и связи только целиком
+        with transaction.atomic():
+            recipe = Recipe.objects.create(
+                **validated_data, author=self.context.get('request').user)
 
-        self.ingredient_recipe_bulk_create(recipe, ingredients)
-        self.tag_recipe_bulk_create(recipe, tags)
+            self.ingredient_recipe_bulk_create(recipe, ingredients)
+            self.tag_recipe_bulk_create(recipe, tags)
+            Recipe.objects.filter(pk=recipe.pk).refresh_snapshots()
+            # похожие рецепты и ленты подписчиков обновит воркер
+            process_recipe_change.delay(recipe.pk, created=True)
 
         return recipe
 
@@ -223,16 +305,22 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
 
-        Recipe.objects.filter(pk=recipe.pk).update(
-            **validated_data, author=self.context.get('request').user)
+        with transaction.atomic():
+            Recipe.objects.filter(pk=recipe.pk).update(
+                **validated_data, author=self.context.get('request').user,
+                updated_at=timezone.now())
+            bump_model_versions(Recipe)
+            record_change(Change.KIND_RECIPE, recipe.pk)
 
-        # метод clear() доступен для RelatedManager объектов
-        # только для полей с атрибутом null=True
-        recipe.ingredient_recipe.clear()
-        self.ingredient_recipe_bulk_create(recipe, ingredients)
+            # метод clear() доступен для RelatedManager объектов
+            # только для полей с атрибутом null=True
+            recipe.ingredient_recipe.clear()
+            self.ingredient_recipe_bulk_create(recipe, ingredients)
 
-        recipe.tag_recipe.clear()
-        self.tag_recipe_bulk_create(recipe, tags)
+            recipe.tag_recipe.clear()
+            self.tag_recipe_bulk_create(recipe, tags)
+            Recipe.objects.filter(pk=recipe.pk).refresh_snapshots()
+            process_recipe_change.delay(recipe.pk)
 
         return recipe
 
@@ -291,11 +379,13 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         )
 
     def tag_recipe_bulk_create(self, recipe, tags):
-        """Создание записей в таблице TagRecipe."""
+        """Создание записей в таблице TagRecipe и обновление маски тегов."""
         TagRecipe.objects.bulk_create(
             TagRecipe(tag_id=tag.pk, recipe=recipe)
             for tag in tags
         )
+        recipe.tags_mask = sum({1 << tag.bit for tag in tags})
+        Recipe.objects.filter(pk=recipe.pk).update(tags_mask=recipe.tags_mask)
 
 
 class FavoriteShoppingCartAddSerializer(serializers.ModelSerializer):
@@ -362,7 +452,9 @@ class SubscriptionAddSerializer(FavoriteShoppingCartAddSerializer):
         return data
 
     def create(self, validated_data):
-        return Follow.objects.create(**validated_data)
+        follow = Follow.objects.create(**validated_data)
+        backfill_feed(follow.user, follow.following)
+        return follow
 
 
 class APIAuthTokenSerializer(serializers.Serializer):
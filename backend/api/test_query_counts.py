@@ -0,0 +1,271 @@
+"""Фиксированные бюджеты SQL-запросов для эндпоинтов API.
+
+Каждый GET-запрос проверяется на двух размерах страницы: при появлении
+запросов на строку выдачи (N+1) количество запросов разойдется с бюджетом.
+"""
+import base64
+import json
+import tempfile
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from rest_framework.authtoken.models import Token
+
+from core.datagen import DEFAULT_PASSWORD, PLACEHOLDER_IMAGE, generate
+from recipes.catalogue import build_catalogue
+from recipes.feed import backfill_feed
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.pantry import build_index
+from recipes.similarity import rebuild_similar
+from recipes.tag_bits import get_tag_bits
+from recipes.trending import rebuild_trending
+from users.models import Follow
+
+User = get_user_model()
+
+PAGE_SIZES = (2, 6)
+MEDIA_ROOT = tempfile.mkdtemp()
+
+# (адрес, бюджет для анонима, бюджет для авторизованного пользователя),
+# {limit} заменяется размером страницы, {ids} - списком id рецептов
+# такой же длины, {recipe} - id рецепта и т.д.
+GET_BUDGETS = (
+    ('/api/recipes/?limit={limit}', 3, 5),
+    ('/api/recipes/?limit={limit}&author={author}', 4, 6),
+    ('/api/recipes/?limit={limit}&tags={tag}', 3, 5),
+    ('/api/recipes/?limit={limit}&ordering=trending', 3, 5),
+    ('/api/recipes/?limit={limit}&ordering=trending&tags={tag}', 3, 5),
+    ('/api/recipes/?limit={limit}&tags={tag}&tags={other_tag}', 3, 5),
+    ('/api/recipes/?limit={limit}&is_favorited=1', 3, 5),
+    ('/api/recipes/?limit={limit}&is_in_shopping_cart=1', 3, 5),
+    ('/api/recipes/?limit={limit}&is_favorited=1&is_in_shopping_cart=1'
+     '&tags={tag}', 3, 5),
+    ('/api/recipes/?limit={limit}&facets=tags', 4, 6),
+    ('/api/recipes/?limit={limit}&facets=tags&is_favorited=1&tags={tag}',
+     4, 6),
+    ('/api/recipes/?limit={limit}&fields=id,name,image,cooking_time', 3, 4),
+    ('/api/recipes/?limit={limit}&omit=ingredients,is_in_shopping_cart',
+     3, 5),
+    ('/api/recipes/?limit={limit}&user_flags=0', 3, 4),
+    ('/api/recipes/?limit={limit}&count=0', 2, 4),
+    ('/api/recipes/?ids={ids}', 2, 4),
+    ('/api/recipes/?ids={ids}&representation=short', 2, 3),
+    ('/api/recipes/?limit={limit}&representation=normalized', 3, 5),
+    ('/api/recipes/{recipe}/', 2, 4),
+    ('/api/recipes/{recipe}/?fields=id,name,tags', 2, 3),
+    ('/api/recipes/{recipe}/similar/', 1, 2),
+    ('/api/recipes/pantry/?limit={limit}&ingredients={pantry}', 2, 3),
+    ('/api/tags/', 2, 3),
+    ('/api/tags/{tag_id}/', 2, 3),
+    ('/api/ingredients/', 1, 2),
+    ('/api/ingredients/?name={ingredient_prefix}', 1, 2),
+    ('/api/ingredients/{ingredient}/', 1, 2),
+    ('/api/users/?limit={limit}', 3, 5),
+    ('/api/users/{author}/', 2, 4),
+    ('/api/users/?limit={limit}&omit=is_subscribed', 3, 4),
+    ('/api/users/?limit={limit}&user_flags=0', 3, 4),
+    ('/api/users/?limit={limit}&count=0', 2, 4),
+)
+AUTH_GET_BUDGETS = (
+    ('/api/users/me/', 3),
+    ('/api/users/me/state/', 3),
+    ('/api/users/me/state/?encoding=bitset', 3),
+    ('/api/users/subscriptions/?limit={limit}', 6),
+    ('/api/users/subscriptions/?limit={limit}&recipes_limit=1', 6),
+    ('/api/users/subscriptions/?limit={limit}&fields=id,username', 4),
+    ('/api/recipes/feed/?limit={limit}&fields=id,name', 5),
+    ('/api/recipes/download_shopping_cart/', 2),
+    ('/api/recipes/feed/?limit={limit}', 6),
+    ('/api/recipes/feed/?limit={limit}&representation=normalized', 6),
+)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT,
+                   PANTRY_INDEX_DIR=tempfile.mkdtemp())
+class QueryCountTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # версии, увеличенные при подготовке данных, записываются, как
+        # после фиксации транзакций
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.create_test_data()
+        # снимок каталога - с версией ингредиентов после подготовки
+        build_catalogue()
+
+    @classmethod
+    def create_test_data(cls):
+        user_pks = generate(users=10, recipes=40, favorites=80, carts=30,
+                            follows=30, seed=1)
+        cls.user = User.objects.get(pk=user_pks[0])
+        cls.token = Token.objects.create(user=cls.user)
+        recipes = list(Recipe.objects.all()[:10])
+        for model in (Favorite, ShoppingCart):
+            model.objects.bulk_create(
+                (model(user=cls.user, recipe=recipe) for recipe in recipes),
+                ignore_conflicts=True)
+        # подписок больше самой большой страницы: у списка подписок
+        # всегда есть следующая страница
+        authors = User.objects.exclude(pk=cls.user.pk).filter(
+            recipes__isnull=False).distinct()[:PAGE_SIZES[-1] + 1]
+        Follow.objects.bulk_create(
+            (Follow(user=cls.user, following=author) for author in authors),
+            ignore_conflicts=True)
+        for author in authors:
+            backfill_feed(cls.user, author)
+        # рецепты одного из авторов подмешиваются в ленту при чтении
+        User.objects.filter(pk=authors[0].pk).update(feed_pull=True)
+        cls.own_recipe = Recipe.objects.create(
+            author=cls.user, name='Свой рецепт', text='Текст',
+            image=PLACEHOLDER_IMAGE.format(0), cooking_time=10)
+        cls.own_recipe.tags.set(Tag.objects.all())
+        Recipe.objects.filter(pk=cls.own_recipe.pk).update_tags_mask()
+        rebuild_trending()
+        rebuild_similar()
+        build_index()
+
+        tags = list(Tag.objects.all())
+        ingredient = Ingredient.objects.first()
+        cls.recipe_ids = list(Recipe.objects.order_by('?').values_list(
+            'pk', flat=True)[:PAGE_SIZES[-1]])
+        cls.url_params = {
+            'recipe': recipes[0].pk,
+            'author': authors[0].pk,
+            'tag': tags[0].slug,
+            'other_tag': tags[1].slug,
+            'tag_id': tags[0].pk,
+            'ingredient': ingredient.pk,
+            'ingredient_prefix': ingredient.name[:3],
+            'pantry': ','.join(map(str, Ingredient.objects.filter(
+                ingredient_recipe__recipe__in=recipes[:3]).values_list(
+                    'pk', flat=True))),
+        }
+
+    def setUp(self):
+        self.reset_cache()
+        self.guest_client = Client()
+        self.auth_client = Client(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def reset_cache(self):
+        # слаги тегов в кэше, количества записей - нет: бюджеты не
+        # зависят от порядка тестов и запросов
+        cache.clear()
+        get_tag_bits()
+
+    def assert_get_budget(self, client, url, budget):
+        for limit in PAGE_SIZES:
+            self.reset_cache()
+            with self.subTest(url=url, limit=limit):
+                with self.assertNumQueries(budget):
+                    response = client.get(url.format(
+                        limit=limit,
+                        ids=','.join(map(str, self.recipe_ids[:limit])),
+                        **self.url_params))
+                self.assertEqual(response.status_code, 200)
+
+    def test_anonymous_get_budgets(self):
+        """Бюджеты GET-запросов анонимного пользователя."""
+        for url, budget, _ in GET_BUDGETS:
+            self.assert_get_budget(self.guest_client, url, budget)
+
+    def test_authorized_get_budgets(self):
+        """Бюджеты GET-запросов авторизованного пользователя."""
+        for url, _, budget in GET_BUDGETS:
+            self.assert_get_budget(self.auth_client, url, budget)
+        for url, budget in AUTH_GET_BUDGETS:
+            self.assert_get_budget(self.auth_client, url, budget)
+
+    def test_not_modified_budgets(self):
+        """Ответ 304 по ETag - один запрос (и запрос токена)."""
+        urls = ('/api/recipes/?limit=6', '/api/recipes/{recipe}/',
+                '/api/tags/', '/api/users/{author}/')
+        auth_urls = ('/api/recipes/feed/', '/api/users/subscriptions/')
+        for client, budget, client_urls in (
+                (self.guest_client, 1, urls),
+                (self.auth_client, 2, urls + auth_urls)):
+            for url in client_urls:
+                url = url.format(**self.url_params)
+                etag = client.get(url)['ETag']
+                with self.subTest(url=url, budget=budget):
+                    with self.assertNumQueries(budget):
+                        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+                    self.assertEqual(response.status_code, 304)
+
+    def recipe_data(self, name):
+        image = Path(MEDIA_ROOT, PLACEHOLDER_IMAGE.format(0)).read_bytes()
+        return json.dumps({
+            'ingredients': [
+                {'id': pk, 'amount': 10}
+                for pk in Ingredient.objects.values_list('pk', flat=True)[:3]
+            ],
+            'tags': list(Tag.objects.values_list('pk', flat=True)[:2]),
+            'image': 'data:image/png;base64,{}'.format(
+                base64.b64encode(image).decode()),
+            'name': name,
+            'text': 'Описание',
+            'cooking_time': 5,
+        })
+
+    def assert_budget(self, budget, status_code, method, url, data=None):
+        with self.subTest(method=method, url=url):
+            # в бюджет входит и увеличение версий после фиксации
+            with self.assertNumQueries(budget), \
+                    self.captureOnCommitCallbacks(execute=True):
+                response = self.auth_client.generic(
+                    method, url, data or '', 'application/json')
+            self.assertEqual(response.status_code, status_code,
+                             response.content)
+
+    def test_recipe_write_budgets(self):
+        """Бюджеты создания, изменения и удаления рецепта."""
+        self.assert_budget(21, 201, 'POST', '/api/recipes/',
+                           self.recipe_data('Новый рецепт'))
+        url = f'/api/recipes/{self.own_recipe.pk}/'
+        self.assert_budget(25, 200, 'PATCH', url,
+                           self.recipe_data('Измененный рецепт'))
+        self.assert_budget(13, 204, 'DELETE', url)
+
+    def test_batch_budget(self):
+        """Бюджет пакета запросов при загрузке страницы: токен и подписки
+        выбираются один раз (отдельными запросами - 3 + 3 + 5 + 6)."""
+        self.assert_budget(12, 200, 'POST', '/api/batch/', json.dumps({
+            'requests': [{'url': url} for url in (
+                '/api/users/me/', '/api/tags/', '/api/recipes/?page=1',
+                '/api/users/subscriptions/')]}))
+
+    def test_favorite_and_cart_write_budgets(self):
+        """Бюджеты добавления в избранное и список покупок и удаления."""
+        recipe = Recipe.objects.exclude(favorites__user=self.user).exclude(
+            carts__user=self.user).first()
+        for url_path in ('favorite', 'shopping_cart'):
+            url = f'/api/recipes/{recipe.pk}/{url_path}/'
+            self.assert_budget(10, 201, 'POST', url)
+            self.assert_budget(6, 204, 'DELETE', url)
+
+    def test_subscription_write_budgets(self):
+        """Бюджеты подписки на автора и отписки."""
+        author = User.objects.exclude(pk=self.user.pk).exclude(
+            following__user=self.user).first()
+        url = f'/api/users/{author.pk}/subscribe/'
+        self.assert_budget(14, 201, 'POST', url)
+        self.assert_budget(10, 204, 'DELETE', url)
+
+    def test_user_write_budgets(self):
+        """Бюджеты регистрации, смены пароля и получения токена."""
+        self.assert_budget(5, 201, 'POST', '/api/users/', json.dumps({
+            'email': 'new@foodgram.ru', 'username': 'new',
+            'first_name': 'Имя', 'last_name': 'Фамилия',
+            'password': 'new-password-123',
+        }))
+        self.user.password = make_password(DEFAULT_PASSWORD)
+        self.user.save()
+        self.assert_budget(3, 204, 'POST', '/api/users/set_password/',
+                           json.dumps({'current_password': DEFAULT_PASSWORD,
+                                       'new_password': 'other-password'}))
+        self.assert_budget(4, 200, 'POST', '/api/auth/token/login/',
+                           json.dumps({'email': self.user.email,
+                                       'password': 'other-password'}))
+        self.assert_budget(2, 204, 'POST', '/api/auth/token/logout/')
@@ -1,6 +1,67 @@
+import base64
+import gzip
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
 from http import HTTPStatus
+from pathlib import Path
+from unittest import mock, skipUnless
 
-from django.test import Client, TestCase
+import brotli
+import msgpack
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.test import (Client, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from prometheus_client import REGISTRY
+from rest_framework.authtoken.models import Token
+
+from benchmarks.runner import (BenchmarkContext, TestClientTransport,
+                               run_scenario)
+from benchmarks.scenarios import get_scenarios
+from core.datagen import (BATCH_SIZE, ZipfSampler, generate, generate_pairs,
+                          insert_rows)
+from core.db_routing import (PIN_COOKIE_NAME, ReplicaRouter, ReplicaRouting,
+                             get_routing, mark_unhealthy, replica_routing)
+from .id_sets import decode_bitset, decode_delta
+from core.changes import compact_changes
+from core.jobs import job, requeue_stale_jobs
+from core.models import Change, Job, RequestProfile
+from core.versions import bump_model_versions, get_model_key, get_versions
+from recipes.feed import backfill_feed, fan_out_recipe
+from recipes.jobs import process_recipe_change, rebuild_pantry_index
+from recipes.models import (FeedItem, Favorite, Ingredient, IngredientRecipe,
+                            Recipe, ShoppingCart, SimilarRecipe, Tag,
+                            TagRecipe)
+from recipes.pantry import build_index, get_current_generation
+from recipes.similarity import rebuild_similar, refresh_similar
+from users.models import Follow
+
+User = get_user_model()
+PROFILES_DIR = tempfile.mkdtemp()
+MEDIA_ROOT = tempfile.mkdtemp()
+JOB_CALLS = []
+
+
+@job
+def record_call(value):
+    JOB_CALLS.append(value)
+
+
+@job(max_attempts=2)
+def failing_job():
+    raise ValueError('Ошибка задачи')
 
 
 class FoodgramAPITestCase(TestCase):
@@ -12,3 +73,1565 @@ class FoodgramAPITestCase(TestCase):
         """Проверка доступности списка рецептов."""
         response = self.guest_client.get('/api/recipes/')
         self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_exposed(self):
+        """Проверка выдачи метрик в формате Prometheus."""
+        self.guest_client.get('/api/recipes/')
+        response = self.guest_client.get(
+            '/api/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn(
+            'foodgram_requests_total{method="GET",status="200",'
+            'view="RecipeViewSet.list"}',
+            response.content.decode()
+        )
+
+    def test_gunicorn_conf_enables_multiprocess_metrics(self):
+        """gunicorn.conf.py включает сбор метрик воркеров до импорта
+        prometheus_client."""
+        env = {key: value for key, value in os.environ.items()
+               if key.upper() != 'PROMETHEUS_MULTIPROC_DIR'}
+        conf = str(settings.BASE_DIR / 'gunicorn.conf.py')
+        script = (
+            f'import runpy\nrunpy.run_path({conf!r})\n'
+            'from prometheus_client import values\n'
+            'print(values.ValueClass is values.MutexValue)\n')
+        result = subprocess.run(
+            [sys.executable, '-c', script], env=env, capture_output=True,
+            text=True, check=True)
+        self.assertEqual(result.stdout.strip(), 'False')
+
+    def test_metrics_token_required(self):
+        """Без токена, с неверным токеном или без METRICS_TOKEN - 403."""
+        for token, header in (('secret', ''), ('secret', 'Bearer wrong'),
+                              ('', ''), ('', 'Bearer ')):
+            with self.subTest(token=token, header=header):
+                with self.settings(METRICS_TOKEN=token):
+                    response = self.guest_client.get(
+                        '/api/metrics', HTTP_AUTHORIZATION=header)
+                self.assertEqual(response.status_code, HTTPStatus.FORBIDDEN)
+
+
+@override_settings(PROFILES_DIR=PROFILES_DIR, PROFILES_MAX_COUNT=2)
+class ProfilingTestCase(TestCase):
+
+    def setUp(self):
+        self.staff = User.objects.create(
+            username='staff', email='staff@foodgram.ru', is_staff=True)
+        self.user = User.objects.create(
+            username='user', email='user@foodgram.ru')
+        staff_token = Token.objects.create(user=self.staff)
+        user_token = Token.objects.create(user=self.user)
+        self.staff_client = Client(HTTP_AUTHORIZATION=f'Token {staff_token}')
+        self.user_client = Client(HTTP_AUTHORIZATION=f'Token {user_token}')
+
+    def test_staff_request_profiled(self):
+        """Профиль снимается для staff-пользователя и сохраняется на диск."""
+        for mode in ('sample', 'cprofile'):
+            with self.subTest(mode=mode):
+                response = self.staff_client.get('/api/recipes/',
+                                                 HTTP_X_PROFILE=mode)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                profile = RequestProfile.objects.get(
+                    pk=response['X-Profile-Id'])
+                self.assertEqual(profile.mode, mode)
+                self.assertEqual(profile.user, self.staff)
+                sql = Path(PROFILES_DIR, profile.sql_file)
+                self.assertIn('recipes_recipe', sql.read_text())
+
+    def test_profiles_rotated(self):
+        """Хранится не более PROFILES_MAX_COUNT профилей."""
+        for _ in range(3):
+            self.staff_client.get('/api/tags/?_profile=sample')
+        self.assertEqual(RequestProfile.objects.count(), 2)
+
+    def test_not_staff_request_not_profiled(self):
+        """Запросы обычных пользователей не профилируются."""
+        response = self.user_client.get('/api/recipes/', HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+
+class BenchmarkTestCase(TestCase):
+
+    def test_benchmark_scenarios_succeed(self):
+        """Все сценарии замера выполняются без ошибок."""
+        output = Path(tempfile.mkdtemp(), 'benchmark.json')
+        with override_settings(MEDIA_ROOT=tempfile.mkdtemp()):
+            call_command('benchmark', '--use-current-db', '--users', 5,
+                         '--recipes', 30, '--iterations', 1, '-o', output,
+                         '--serialization',
+                         stdout=open(tempfile.mktemp(), 'w'))
+        results = json.loads(output.read_text(encoding='utf-8'))
+        self.assertIn('ingredient_list[orjson]', results['serialization'])
+        self.assertIn('recipe_list[fast]', results['row_serialization'])
+        self.assertIn('recipe_list[normalized, limit=50]',
+                      results['normalized'])
+
+        for name, result in results['scenarios'].items():
+            with self.subTest(scenario=name):
+                self.assertTrue(all(
+                    code.startswith('2') for code in result['status_codes']
+                ), result['status_codes'])
+
+    def test_recipe_patch_without_own_recipe(self):
+        """Пользователю замера без рецептов рецепт создается."""
+        with override_settings(MEDIA_ROOT=tempfile.mkdtemp()):
+            generate(3, 10)
+            user = User.objects.create_user(
+                username='bench-empty', email='bench-empty@example.com',
+                password='password')
+            context = BenchmarkContext(user)
+            scenario, = (scenario for scenario in get_scenarios()
+                         if scenario.name == 'recipe_patch')
+            result = run_scenario(TestClientTransport(), scenario, context,
+                                  iterations=1)
+
+        self.assertTrue(
+            user.recipes.filter(pk=context.own_recipe_id).exists())
+        self.assertEqual(result['status_codes'], {'200': 1})
+
+
+class GenerateDatasetTestCase(TestCase):
+
+    def test_dataset_generated(self):
+        """Создается запрошенное количество записей."""
+        with override_settings(MEDIA_ROOT=tempfile.mkdtemp()):
+            call_command('generate_dataset', '--users', 20, '--recipes', 50,
+                         '--favorites', 300, '--carts', 40, '--follows', 60,
+                         stdout=open(tempfile.mktemp(), 'w'))
+
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Recipe.objects.count(), 50)
+        self.assertEqual(Favorite.objects.count(), 300)
+        self.assertEqual(ShoppingCart.objects.count(), 40)
+        self.assertEqual(Follow.objects.count(), 60)
+        self.assertFalse(
+            Recipe.objects.filter(ingredient_recipe__isnull=True).exists())
+        self.assertFalse(
+            Recipe.objects.filter(tag_recipe__isnull=True).exists())
+
+        # ленты заполнены так же, как при подписке через API
+        expected = set()
+        for follow in Follow.objects.select_related('following'):
+            self.assertFalse(follow.following.feed_pull)
+            backfill = follow.following.recipes.order_by(
+                '-pub_date', '-pk').values_list('pk', flat=True)
+            expected.update(
+                (follow.user_id, recipe_pk)
+                for recipe_pk in backfill[:settings.FEED_BACKFILL_LIMIT])
+        self.assertTrue(expected)
+        self.assertEqual(
+            set(FeedItem.objects.values_list('user', 'recipe')), expected)
+
+    def test_rows_cover_required_fields(self):
+        """Вставка строк перечисляет все обязательные поля: для COPY на
+        PostgreSQL значения по умолчанию Django не применяются."""
+        calls = []
+
+        def record_insert(model, fields, rows, batch_size=BATCH_SIZE):
+            calls.append((model, fields))
+            insert_rows(model, fields, rows, batch_size)
+
+        with override_settings(MEDIA_ROOT=tempfile.mkdtemp()), \
+                mock.patch('core.datagen.insert_rows', record_insert):
+            generate(5, 10, favorites=5, carts=5, follows=5)
+
+        self.assertTrue(calls)
+        for model, fields in calls:
+            with self.subTest(model=model.__name__):
+                required = {
+                    field.attname for field in model._meta.concrete_fields
+                    if not field.null and not field.primary_key}
+                self.assertLessEqual(required, set(fields))
+
+    def test_existing_rows_ignored(self):
+        """Существующие записи не попадают в набор, префикс не повторяется."""
+        with override_settings(MEDIA_ROOT=tempfile.mkdtemp()):
+            first = generate(3, 5, prefix='first')
+            User.objects.create(username='second_admin',
+                                email='second_admin@foodgram.ru')
+            second = generate(3, 5, prefix='second')
+            with self.assertRaises(CommandError):
+                call_command('generate_dataset', '--prefix', 'second',
+                             stdout=open(tempfile.mktemp(), 'w'))
+
+        self.assertEqual(len(second), 3)
+        self.assertFalse(set(first) & set(second))
+        self.assertEqual(
+            list(User.objects.filter(pk__in=second).values_list(
+                'username', flat=True)), ['second0', 'second1', 'second2'])
+
+    def test_dense_pairs(self):
+        """Почти все возможные пары выбираются без бесконечного цикла."""
+        rnd = random.Random(0)
+        items = list(range(30))
+        pairs = generate_pairs(ZipfSampler(items, 3, rnd),
+                               ZipfSampler(items, 3, rnd), 30 * 29 - 1,
+                               exclude_self=True)
+        self.assertEqual(len(set(pairs)), 30 * 29 - 1)
+        self.assertFalse(any(left == right for left, right in pairs))
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+    def test_popular_authors_feed_pull(self):
+        """Рецепты популярных авторов не раскладываются по лентам."""
+        with override_settings(MEDIA_ROOT=tempfile.mkdtemp()):
+            generate(10, 30, follows=30)
+
+        pull_authors = set(User.objects.filter(
+            feed_pull=True).values_list('pk', flat=True))
+        self.assertTrue(pull_authors)
+        self.assertFalse(
+            FeedItem.objects.filter(author__in=pull_authors).exists())
+
+
+class FeedTestCase(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create(
+            username='author', email='author@foodgram.ru')
+        self.user = User.objects.create(
+            username='user', email='user@foodgram.ru')
+        token = Token.objects.create(user=self.user)
+        self.user_client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+
+    def create_recipe(self, number):
+        recipe = Recipe.objects.create(
+            author=self.author, name=f'Рецепт {number}', text='Описание',
+            cooking_time=10, image='recipes/images/temp.png')
+        fan_out_recipe(recipe)
+        return recipe
+
+    def get_feed_ids(self, url='/api/recipes/feed/'):
+        response = self.user_client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        data = response.json()
+        return [recipe['id'] for recipe in data['results']], data['next']
+
+    def test_feed_backfilled_and_paginated(self):
+        """Подписка заполняет ленту, лента листается курсором."""
+        recipes = [self.create_recipe(number) for number in range(3)]
+        self.user_client.post(f'/api/users/{self.author.pk}/subscribe/')
+        newest = self.create_recipe(3)
+
+        first_page, next_url = self.get_feed_ids('/api/recipes/feed/?limit=3')
+        self.assertEqual(first_page,
+                         [newest.pk, recipes[2].pk, recipes[1].pk])
+        second_page, next_url = self.get_feed_ids(next_url)
+        self.assertEqual(second_page, [recipes[0].pk])
+        self.assertIsNone(next_url)
+
+        self.user_client.delete(f'/api/users/{self.author.pk}/subscribe/')
+        self.assertEqual(self.get_feed_ids()[0], [])
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_popular_author_recipes_merged_on_read(self):
+        """Рецепты популярного автора подмешиваются при чтении ленты."""
+        old_recipe = self.create_recipe(0)
+        Follow.objects.create(user=self.user, following=self.author)
+        backfill_feed(self.user, self.author)
+        recipe = self.create_recipe(1)
+
+        self.author.refresh_from_db()
+        self.assertTrue(self.author.feed_pull)
+        self.assertFalse(FeedItem.objects.filter(recipe=recipe).exists())
+        self.assertEqual(self.get_feed_ids()[0], [recipe.pk, old_recipe.pk])
+
+
+class TrendingTestCase(TestCase):
+
+    def test_trending_ordering(self):
+        """Рейтинг учитывает недавние добавления в избранное и корзину."""
+        author = User.objects.create(
+            username='author', email='author@foodgram.ru')
+        fans = [User.objects.create(username=f'fan{number}',
+                                    email=f'fan{number}@foodgram.ru')
+                for number in range(3)]
+        recipes = [Recipe.objects.create(
+            author=author, name=f'Рецепт {number}', text='Описание',
+            cooking_time=10, image='recipes/images/temp.png')
+            for number in range(3)]
+        Recipe.objects.update(pub_date=timezone.now() - timedelta(days=60))
+        month_ago = timezone.now() - timedelta(days=30)
+        Favorite.objects.bulk_create(
+            Favorite(user=fan, recipe=recipes[0], created=month_ago)
+            for fan in fans)
+        Favorite.objects.create(user=fans[0], recipe=recipes[1])
+        ShoppingCart.objects.create(user=fans[0], recipe=recipes[2])
+        Favorite.objects.create(user=fans[1], recipe=recipes[2])
+
+        call_command('compute_trending', stdout=open(tempfile.mktemp(), 'w'))
+
+        response = self.client.get('/api/recipes/?ordering=trending')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            [recipes[2].pk, recipes[1].pk])
+        # прочие значения ordering не меняют порядок по умолчанию
+        default = self.client.get('/api/recipes/').json()['results']
+        for ordering in ('name', '-pub_date'):
+            response = self.client.get(f'/api/recipes/?ordering={ordering}')
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            self.assertEqual(response.json()['results'], default)
+
+
+class TagMaskTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create(
+            username='author', email='author@foodgram.ru')
+        self.tags = [Tag.objects.create(name=slug, color=color, slug=slug)
+                     for slug, color in (('breakfast', '#E26C2D'),
+                                         ('lunch', '#49B64E'),
+                                         ('dinner', '#8775D2'))]
+        self.recipes = []
+        for number, tags in enumerate(
+                (self.tags[:1], self.tags[:2], self.tags[2:])):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10, image='recipes/images/temp.png')
+            recipe.tags.set(tags)
+            self.recipes.append(recipe)
+        Recipe.objects.update_tags_mask()
+
+    def get_recipe_ids(self, query):
+        response = self.client.get(f'/api/recipes/?{query}')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return sorted(recipe['id'] for recipe in response.json()['results'])
+
+    def test_filter_by_tags_mask(self):
+        """Рецепты с любым из тегов, без повторов."""
+        self.assertEqual(
+            self.get_recipe_ids('tags=breakfast&tags=lunch'),
+            [self.recipes[0].pk, self.recipes[1].pk])
+        self.assertEqual(self.get_recipe_ids('tags=dinner'),
+                         [self.recipes[2].pk])
+        response = self.client.get('/api/recipes/?tags=brunch')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_tag_facets(self):
+        """Количество рецептов по тегам не зависит от фильтра tags."""
+        response = self.client.get(
+            f'/api/recipes/?facets=tags&tags=dinner'
+            f'&author={self.recipes[0].author_id}')
+        self.assertEqual(response.json()['facets'],
+                         {'tags': {'breakfast': 2, 'lunch': 1, 'dinner': 1}})
+        self.assertEqual(response.json()['count'], 1)
+        response = self.client.get('/api/recipes/?facets=author')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_deleted_tag_bit_cleared(self):
+        """Бит удаленного тега снимается и достается новому тегу."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tags[0].delete()
+        self.recipes[0].refresh_from_db()
+        self.assertEqual(self.recipes[0].tags_mask, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = Tag.objects.create(name='brunch', color='#000000',
+                                     slug='brunch')
+        self.assertEqual(tag.bit, self.tags[0].bit)
+        self.assertEqual(self.get_recipe_ids('tags=brunch'), [])
+
+    def test_tag_bits_follow_tag_version(self):
+        """Кэш слагов обновляется по версии тегов, без сброса кэша
+        воркера, изменившего теги."""
+        self.get_recipe_ids('tags=dinner')
+        # транзакция теста не фиксируется: версия тегов пока прежняя
+        Tag.objects.create(name='brunch', color='#000000', slug='brunch')
+        Tag.objects.filter(slug='dinner').update(slug='supper')
+        response = self.client.get('/api/recipes/?tags=brunch')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_model_versions(Tag)
+        self.assertEqual(self.get_recipe_ids('tags=brunch'), [])
+        self.assertEqual(self.get_recipe_ids('tags=supper'),
+                         [self.recipes[2].pk])
+        response = self.client.get('/api/recipes/?tags=dinner')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+
+@override_settings(SIMILAR_RECIPES_COUNT=2)
+class SimilarRecipesTestCase(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create(
+            username='author', email='author@foodgram.ru')
+        self.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(6)]
+
+    def create_recipe(self, number, ingredient_numbers):
+        recipe = Recipe.objects.create(
+            author=self.author, name=f'Рецепт {number}', text='Описание',
+            cooking_time=10, image='recipes/images/temp.png')
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe,
+                             ingredient=self.ingredients[ingredient_number],
+                             amount=1)
+            for ingredient_number in ingredient_numbers)
+        return recipe
+
+    def get_similar_ids(self, recipe):
+        response = self.client.get(f'/api/recipes/{recipe.pk}/similar/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [similar['id'] for similar in response.json()]
+
+    def test_similar_recipes(self):
+        """Полный и инкрементальный пересчет дают одинаковых соседей."""
+        base = self.create_recipe(0, (0, 1, 2, 3))
+        close = self.create_recipe(1, (0, 1, 2))
+        far = self.create_recipe(2, (3, 4, 5))
+        self.create_recipe(3, (5,))
+        call_command('build_similar_recipes',
+                     stdout=open(tempfile.mktemp(), 'w'))
+        self.assertEqual(self.get_similar_ids(base), [close.pk, far.pk])
+
+        closest = self.create_recipe(4, (0, 1, 2, 3, 4))
+        refresh_similar(closest)
+        self.assertEqual(self.get_similar_ids(closest), [base.pk, close.pk])
+        self.assertEqual(self.get_similar_ids(base), [closest.pk, close.pk])
+        incremental = list(SimilarRecipe.objects.values_list(
+            'recipe', 'similar', 'position'))
+        rebuild_similar()
+        self.assertEqual(
+            incremental,
+            list(SimilarRecipe.objects.values_list(
+                'recipe', 'similar', 'position')))
+
+        for pk in ('0', 'abc'):
+            response = self.client.get(f'/api/recipes/{pk}/similar/')
+            self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class PantryTestCase(TestCase):
+
+    def setUp(self):
+        author = User.objects.create(
+            username='author', email='author@foodgram.ru')
+        self.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(5)]
+        self.recipes = []
+        for number, ingredient_numbers in enumerate(
+                ((0, 1), (0, 1, 2, 3), (0, 1, 2), (4,))):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10, image='recipes/images/temp.png')
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(recipe=recipe, amount=1,
+                                 ingredient=self.ingredients[ingredient])
+                for ingredient in ingredient_numbers)
+            self.recipes.append(recipe)
+
+    def get_pantry_ids(self, *ingredient_numbers):
+        ingredient_ids = ','.join(str(self.ingredients[number].pk)
+                                  for number in ingredient_numbers)
+        response = self.client.get(
+            f'/api/recipes/pantry/?ingredients={ingredient_ids}')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_pantry_ranking_follows_edits(self):
+        """Ранжирование по доле имеющихся ингредиентов с учетом правок."""
+        with override_settings(PANTRY_INDEX_DIR=tempfile.mkdtemp()):
+            call_command('build_pantry_index',
+                         stdout=open(tempfile.mktemp(), 'w'))
+            self.assertEqual(
+                self.get_pantry_ids(0, 1, 2),
+                [self.recipes[2].pk, self.recipes[0].pk, self.recipes[1].pk])
+
+            # рецепт 0 теперь требует ингредиент, которого нет
+            IngredientRecipe.objects.create(
+                recipe=self.recipes[0], ingredient=self.ingredients[4],
+                amount=1)
+            self.recipes[0].save()
+            self.recipes[2].delete()
+            self.assertEqual(self.get_pantry_ids(0, 1, 2),
+                             [self.recipes[1].pk, self.recipes[0].pk])
+            self.assertEqual(self.get_pantry_ids(4),
+                             [self.recipes[3].pk, self.recipes[0].pk])
+
+        response = self.client.get('/api/recipes/pantry/?ingredients=a')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    @override_settings(PANTRY_REBUILD_THRESHOLD=1)
+    def test_many_changes_rebuild_index(self):
+        """Много измененных рецептов - пересборка индекса задачей."""
+        with override_settings(PANTRY_INDEX_DIR=tempfile.mkdtemp()):
+            build_index()
+            generation = get_current_generation()
+            IngredientRecipe.objects.create(
+                recipe=self.recipes[0], ingredient=self.ingredients[4],
+                amount=1)
+            Recipe.objects.filter(
+                pk__in=[self.recipes[0].pk, self.recipes[3].pk]).touch()
+            for _ in range(2):
+                # до пересборки выдача идет по индексу
+                self.assertEqual(self.get_pantry_ids(4),
+                                 [self.recipes[3].pk])
+            self.assertEqual(
+                Job.objects.filter(
+                    name=rebuild_pantry_index.job_name).count(), 1)
+
+            call_command('run_worker', burst=True,
+                         stdout=open(tempfile.mktemp(), 'w'))
+            self.assertNotEqual(get_current_generation(), generation)
+            self.assertEqual(self.get_pantry_ids(4),
+                             [self.recipes[3].pk, self.recipes[0].pk])
+
+    @override_settings(PANTRY_INGREDIENTS_MAX=2)
+    def test_ingredients_limit(self):
+        """Не больше PANTRY_INGREDIENTS_MAX ингредиентов за запрос."""
+        response = self.client.get(
+            '/api/recipes/pantry/?ingredients=1,2,3')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+
+class RenderersTestCase(TestCase):
+    # с фильтром список сериализуется, а не отдается из снимка
+    INGREDIENTS_URL = '/api/ingredients/?name=Ингредиент'
+
+    def setUp(self):
+        for number in range(30):
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+
+    def test_msgpack_negotiated_by_accept(self):
+        """MessagePack выдается по Accept, по умолчанию - JSON."""
+        response = self.client.get(self.INGREDIENTS_URL)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        packed = self.client.get(self.INGREDIENTS_URL,
+                                 HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(packed['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(packed.content), response.json())
+
+    def test_msgpack_and_invalid_json_bodies(self):
+        """Тело запроса в MessagePack разбирается, битый JSON - 400."""
+        data = {'email': 'user@foodgram.ru', 'username': 'user',
+                'first_name': 'Имя', 'last_name': 'Фамилия',
+                'password': 'Pa$$w0rd-123'}
+        response = self.client.post('/api/users/', msgpack.packb(data),
+                                    content_type='application/msgpack')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(response.json()['username'], 'user')
+
+        response = self.client.post('/api/users/', '{"email": ',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    @override_settings(COMPRESSION_MIN_SIZE=100)
+    def test_responses_compressed(self):
+        """Сжатие brotli или gzip по Accept-Encoding, начиная с порога."""
+        plain = self.client.get(self.INGREDIENTS_URL)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        response = self.client.get(self.INGREDIENTS_URL,
+                                   HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+
+        response = self.client.get(self.INGREDIENTS_URL,
+                                   HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+        with override_settings(COMPRESSION_MIN_SIZE=len(plain.content) + 1):
+            response = self.client.get(self.INGREDIENTS_URL,
+                                       HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertNotIn('Content-Encoding', response)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class IngredientCatalogueTestCase(TestCase):
+
+    def setUp(self):
+        for number in range(3):
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+
+    def get_catalogue(self, **headers):
+        response = self.client.get('/api/ingredients/', **headers)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return response, b''.join(response.streaming_content)
+
+    def test_catalogue_snapshot(self):
+        """Каталог отдается из снимка, совпадающего с сериализацией."""
+        response, content = self.get_catalogue()
+        serialized = self.client.get('/api/ingredients/?name=Ингр').json()
+        self.assertEqual(json.loads(content), serialized)
+        self.assertEqual(
+            self.client.get('/api/ingredients/',
+                            HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+            HTTPStatus.NOT_MODIFIED)
+
+        response, content = self.get_catalogue(HTTP_ACCEPT_ENCODING='br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(json.loads(brotli.decompress(content)), serialized)
+        response, content = self.get_catalogue(HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(json.loads(gzip.decompress(content)), serialized)
+
+    def test_catalogue_rebuilt_after_change(self):
+        """Изменение каталога в обход админки дает новый снимок."""
+        response, _ = self.get_catalogue()
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='Соль', measurement_unit='г')
+        changed, content = self.get_catalogue()
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        self.assertIn('Соль', [ingredient['name']
+                               for ingredient in json.loads(content)])
+
+
+class SparseFieldsetTestCase(TestCase):
+
+    def setUp(self):
+        author = User.objects.create(
+            username='author', email='author@foodgram.ru')
+        Recipe.objects.create(
+            author=author, name='Рецепт', text='Описание', cooking_time=10,
+            image='recipes/images/temp.png')
+
+    def test_fields_and_omit(self):
+        """Выводятся поля из fields= без полей из omit=."""
+        response = self.client.get(
+            '/api/recipes/?fields=id,name,image,text&omit=text')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(list(response.json()['results'][0]),
+                         ['id', 'image', 'name'])
+
+        response = self.client.get('/api/users/?omit=is_subscribed,email')
+        self.assertEqual(list(response.json()['results'][0]),
+                         ['id', 'username', 'first_name', 'last_name'])
+
+    def test_unknown_field_rejected(self):
+        """Неизвестное поле в fields= - ошибка 400."""
+        response = self.client.get('/api/recipes/?fields=id,password')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+
+class RecipeMultiGetTestCase(TestCase):
+
+    def setUp(self):
+        author = User.objects.create(
+            username='author', email='author@foodgram.ru')
+        self.recipes = [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10, image='recipes/images/temp.png')
+            for number in range(3)]
+
+    def get_ids(self, query):
+        response = self.client.get(f'/api/recipes/?{query}')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [recipe['id'] for recipe in response.json()]
+
+    def test_recipes_in_requested_order(self):
+        """Рецепты выдаются в порядке ids, без повторов и отсутствующих."""
+        first, second, third = (recipe.pk for recipe in self.recipes)
+        self.assertEqual(self.get_ids(f'ids={third},0,{first},{third}'),
+                         [third, first])
+        response = self.client.get(
+            f'/api/recipes/?ids={second}&representation=short')
+        self.assertEqual(list(response.json()[0]),
+                         ['id', 'name', 'image', 'cooking_time'])
+
+    @override_settings(RECIPES_IDS_MAX=2)
+    def test_invalid_ids_rejected(self):
+        """Некорректный или слишком длинный список ids - ошибка 400."""
+        for query in ('ids=1,a', 'ids=', 'ids=1,2,3',
+                      'ids=1&representation=long'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/recipes/?{query}')
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.BAD_REQUEST)
+        response = self.client.get('/api/recipes/?representation=long')
+        self.assertEqual(response.json()['detail'],
+                         'Параметр representation: full, short, normalized')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class FastSerializersTestCase(TestCase):
+    """Golden-тест: api.fast_serializers выводят то же, что DRF."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user_pks = generate(users=6, recipes=20, favorites=30, carts=10,
+                            follows=10, seed=2)
+        cls.user = User.objects.get(pk=user_pks[0])
+        cls.token = Token.objects.create(user=cls.user)
+        authors = User.objects.exclude(pk=cls.user.pk).filter(
+            recipes__isnull=False).distinct()[:3]
+        for author in authors:
+            Follow.objects.get_or_create(user=cls.user, following=author)
+            backfill_feed(cls.user, author)
+        cls.recipe_ids = list(Recipe.objects.order_by('?').values_list(
+            'pk', flat=True)[:5])
+
+    def get_urls(self):
+        recipe = self.recipe_ids[0]
+        ids = ','.join(map(str, self.recipe_ids))
+        return (
+            '/api/recipes/',
+            '/api/recipes/?limit=7&page=2',
+            '/api/recipes/?is_favorited=1&facets=tags',
+            '/api/recipes/?fields=id,author,tags&omit=tags',
+            '/api/recipes/?fields=id&omit=id',
+            '/api/recipes/?representation=short',
+            f'/api/recipes/?ids={ids},0',
+            f'/api/recipes/?ids={ids}&representation=short',
+            f'/api/recipes/{recipe}/',
+            f'/api/recipes/{recipe}/?omit=text,is_favorited',
+            '/api/recipes/0/',
+            '/api/recipes/abc/',
+            '/api/recipes/feed/?limit=3',
+            '/api/recipes/feed/?fields=id,author,ingredients',
+            '/api/users/subscriptions/',
+            '/api/users/subscriptions/?limit=2&offset=1&recipes_limit=1',
+            '/api/users/subscriptions/?recipes_limit=x',
+            '/api/users/subscriptions/?fields=id,recipes,is_subscribed',
+            '/api/recipes/?user_flags=0',
+            f'/api/recipes/{recipe}/?user_flags=0&fields=id,author',
+            '/api/recipes/feed/?user_flags=false',
+            '/api/users/subscriptions/?user_flags=0',
+        )
+
+    def test_output_identical(self):
+        """Ответы совпадают байт в байт, в том числе в MessagePack."""
+        clients = (
+            Client(),
+            Client(HTTP_AUTHORIZATION=f'Token {self.token}'),
+            Client(HTTP_AUTHORIZATION=f'Token {self.token}',
+                   HTTP_ACCEPT='application/msgpack'),
+        )
+        for url in self.get_urls():
+            for client in clients:
+                with self.subTest(url=url, headers=client.defaults):
+                    with override_settings(FAST_SERIALIZERS=False):
+                        expected = client.get(url)
+                    response = client.get(url)
+                    self.assertEqual(response.status_code,
+                                     expected.status_code)
+                    self.assertEqual(response.content, expected.content)
+
+    def denormalize(self, recipes, included):
+        """Полное представление рецептов из нормализованного."""
+        users, tags, ingredients = (
+            {obj['id']: obj for obj in included[kind]}
+            for kind in ('users', 'tags', 'ingredients'))
+        return [{
+            **recipe,
+            'author': users[recipe['author']],
+            'tags': [tags[pk] for pk in recipe['tags']],
+            'ingredients': [{**ingredients[item['id']], **item}
+                            for item in recipe['ingredients']],
+        } for recipe in recipes]
+
+    def test_normalized_representation(self):
+        """Нормализованный ответ восстанавливается в полный."""
+        client = Client(HTTP_AUTHORIZATION=f'Token {self.token}')
+        ids = ','.join(map(str, self.recipe_ids))
+        for url in ('/api/recipes/?limit=20', f'/api/recipes/?ids={ids}',
+                    '/api/recipes/feed/?limit=5'):
+            for fast in (True, False):
+                with self.subTest(url=url, fast=fast), override_settings(
+                        FAST_SERIALIZERS=fast):
+                    expected = client.get(url).json()
+                    data = client.get(
+                        f'{url}&representation=normalized').json()
+                    if isinstance(expected, list):
+                        expected = {'results': expected}
+                    for kind in ('users', 'tags', 'ingredients'):
+                        pks = [obj['id'] for obj in data['included'][kind]]
+                        self.assertEqual(pks, sorted(set(pks)))
+                    self.assertEqual(
+                        self.denormalize(data['results'], data['included']),
+                        expected['results'])
+        data = client.get('/api/recipes/?representation=normalized'
+                          '&fields=id,tags').json()
+        self.assertEqual(list(data['included']), ['tags'])
+
+
+class ConditionalGetTestCase(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create(
+            username='author', email='author@foodgram.ru')
+        self.user = User.objects.create(
+            username='user', email='user@foodgram.ru')
+        token = Token.objects.create(user=self.user)
+        self.user_client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+        self.tag = Tag.objects.create(name='Обед', color='#49B64E',
+                                      slug='lunch')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/images/temp.png')
+        self.recipe.tags.add(self.tag)
+
+    def assert_etag_changed(self, client, url, change):
+        etag = client.get(url)['ETag']
+        self.assertEqual(
+            client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+            HTTPStatus.NOT_MODIFIED)
+        # версии увеличиваются после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_follows_changes(self):
+        """ETag меняется при изменении данных, попадающих в ответ."""
+        detail_url = f'/api/recipes/{self.recipe.pk}/'
+        for url, change in (
+                (detail_url, lambda: Tag.objects.filter(
+                    pk=self.tag.pk).first().save()),
+                (detail_url, lambda: Recipe.objects.filter(
+                    pk=self.recipe.pk).touch()),
+                ('/api/recipes/', lambda: self.author.save()),
+                ('/api/users/', lambda: Follow.objects.create(
+                    user=self.user, following=self.author)),
+                (detail_url, lambda: Favorite.objects.create(
+                    user=self.user, recipe=self.recipe))):
+            with self.subTest(url=url):
+                self.assert_etag_changed(self.user_client, url, change)
+
+    def test_versions_bumped_after_commit(self):
+        """Счетчик версий не блокируется до конца транзакции записи."""
+        key = get_model_key(Recipe)
+        version, = get_versions([key])
+        with self.captureOnCommitCallbacks() as callbacks, \
+                CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as ctx:
+            Recipe.objects.filter(pk=self.recipe.pk).touch()
+        self.assertFalse(any('core_version' in query['sql']
+                             for query in ctx.captured_queries))
+        self.assertEqual(get_versions([key]), [version])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(get_versions([key]), [version + 1])
+
+    def test_etag_per_user(self):
+        """Признаки пользователя не попадают в чужой ETag."""
+        url = f'/api/recipes/{self.recipe.pk}/'
+        etag = self.user_client.get(url)['ETag']
+        self.assertNotEqual(self.client.get(url)['ETag'], etag)
+        # избранное другого пользователя не меняет ETag
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.author, recipe=self.recipe)
+        self.assertEqual(
+            self.user_client.get(url, HTTP_IF_NONE_MATCH=f'W/{etag}')[
+                'ETag'], etag)
+
+
+class UserStateTestCase(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create(
+            username='author', email='author@foodgram.ru')
+        self.user = User.objects.create(
+            username='user', email='user@foodgram.ru')
+        token = Token.objects.create(user=self.user)
+        self.user_client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+        self.recipes = [
+            Recipe.objects.create(
+                author=self.author, name=f'Рецепт {index}', text='Описание',
+                cooking_time=10, image='recipes/images/temp.png')
+            for index in range(3)]
+        for recipe in self.recipes[::2]:
+            Favorite.objects.create(user=self.user, recipe=recipe)
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[1])
+        Follow.objects.create(user=self.user, following=self.author)
+
+    def test_state_encodings(self):
+        """Множества id в записи delta и bitset."""
+        expected = {
+            'favorites': [self.recipes[0].pk, self.recipes[2].pk],
+            'shopping_cart': [self.recipes[1].pk],
+            'subscriptions': [self.author.pk],
+        }
+        for encoding, decode in (('delta', decode_delta),
+                                 ('bitset', decode_bitset)):
+            with self.subTest(encoding=encoding):
+                data = self.user_client.get(
+                    f'/api/users/me/state/?encoding={encoding}').json()
+                self.assertEqual(data['encoding'], encoding)
+                self.assertEqual(
+                    {kind: decode(data[kind]) for kind in expected},
+                    expected)
+        self.assertEqual(
+            self.user_client.get(
+                '/api/users/me/state/?encoding=json').status_code,
+            HTTPStatus.BAD_REQUEST)
+        self.assertEqual(self.client.get('/api/users/me/state/').status_code,
+                         HTTPStatus.UNAUTHORIZED)
+
+    def test_state_etag(self):
+        """ETag состояния меняется только при изменении состояния."""
+        url = '/api/users/me/state/'
+        etag = self.user_client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.filter(pk=self.recipes[0].pk).touch()
+        self.assertEqual(
+            self.user_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+            HTTPStatus.NOT_MODIFIED)
+        with self.captureOnCommitCallbacks(execute=True):
+            ShoppingCart.objects.create(user=self.user,
+                                        recipe=self.recipes[0])
+        self.assertEqual(
+            self.user_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+            HTTPStatus.OK)
+
+    def test_user_flags_omitted(self):
+        """С user_flags=0 признаков пользователя нет и у авторов."""
+        recipe_url = f'/api/recipes/{self.recipes[0].pk}/?user_flags=0'
+        for fast in (True, False):
+            with self.subTest(fast=fast), override_settings(
+                    FAST_SERIALIZERS=fast):
+                recipe = self.user_client.get(recipe_url).json()
+                self.assertNotIn('is_favorited', recipe)
+                self.assertNotIn('is_in_shopping_cart', recipe)
+                self.assertNotIn('is_subscribed', recipe['author'])
+                users = self.user_client.get(
+                    '/api/users/?user_flags=0').json()['results']
+                self.assertNotIn('is_subscribed', users[0])
+
+
+@override_settings(CHANGES_COMMIT_WINDOW=0)
+class ChangesTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(
+            username='author', email='author@foodgram.ru')
+        self.user = User.objects.create(
+            username='user', email='user@foodgram.ru')
+        token = Token.objects.create(user=self.user)
+        self.user_client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+        self.tag = Tag.objects.create(name='Обед', color='#49B64E',
+                                      slug='lunch')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/images/temp.png')
+
+    def get_changes(self, client, since):
+        response = client.get(f'/api/changes/?since={since}')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        data = response.json()
+        changes = [(change['type'], change['id'], change['op'])
+                   for change in data['changes']]
+        return data['cursor'], changes
+
+    def test_changes_after_cursor(self):
+        """Изменения после курсора, личные - только владельцу."""
+        cursor = self.client.get('/api/changes/').json()['cursor']
+        self.assertEqual(self.get_changes(self.client, cursor),
+                         (cursor, []))
+        favorite_url = f'/api/recipes/{self.recipe.pk}/favorite/'
+        self.user_client.post(favorite_url)
+        Recipe.objects.filter(pk=self.recipe.pk).touch()
+        Follow.objects.create(user=self.author, following=self.user)
+        tag_id = self.tag.pk
+        self.tag.delete()
+
+        user_cursor, changes = self.get_changes(self.user_client, cursor)
+        self.assertEqual(changes, [
+            ('favorite', self.recipe.pk, 'upsert'),
+            ('recipe', self.recipe.pk, 'upsert'),
+            ('tag', tag_id, 'delete'),
+        ])
+        self.assertEqual(self.get_changes(self.client, cursor)[1], [
+            ('recipe', self.recipe.pk, 'upsert'),
+            ('tag', tag_id, 'delete'),
+        ])
+
+        # из нескольких записей об объекте выдается последняя
+        self.user_client.delete(favorite_url)
+        self.user_client.post(f'/api/recipes/{self.recipe.pk}/shopping_cart/')
+        self.user_client.post(favorite_url)
+        self.user_client.delete(favorite_url)
+        self.assertEqual(self.get_changes(self.user_client, user_cursor)[1], [
+            ('shopping_cart', self.recipe.pk, 'upsert'),
+            ('favorite', self.recipe.pk, 'delete'),
+        ])
+
+    @override_settings(CHANGES_PAGE_SIZE=2)
+    def test_changes_pages(self):
+        """Изменения выдаются страницами не больше CHANGES_PAGE_SIZE."""
+        cursor = self.client.get('/api/changes/').json()['cursor']
+        for index in range(3):
+            Tag.objects.create(name=f'Тег {index}', color=f'#00000{index}',
+                               slug=f'tag-{index}')
+        response = self.client.get(f'/api/changes/?since={cursor}')
+        self.assertTrue(response.json()['has_more'])
+        self.assertEqual(len(response.json()['changes']), 2)
+        response = self.client.get(
+            f'/api/changes/?since={response.json()["cursor"]}')
+        self.assertFalse(response.json()['has_more'])
+        self.assertEqual(len(response.json()['changes']), 1)
+        for since in ('abc', '-1'):
+            with self.subTest(since=since):
+                self.assertEqual(
+                    self.client.get(f'/api/changes/?since={since}')
+                    .status_code, HTTPStatus.BAD_REQUEST)
+
+    @override_settings(CHANGES_COMMIT_WINDOW=60)
+    def test_commit_window(self):
+        """Записи новее окна фиксации не выдаются и не входят в курсор."""
+        cursor = self.client.get('/api/changes/').json()['cursor']
+        self.assertFalse(Change.objects.filter(pk__lte=cursor).exists())
+        tag = Tag.objects.create(name='Ужин', color='#000000', slug='dinner')
+        self.assertEqual(self.get_changes(self.client, cursor),
+                         (cursor, []))
+
+        Change.objects.update(created=timezone.now() - timedelta(seconds=61))
+        new_cursor, changes = self.get_changes(self.client, cursor)
+        self.assertEqual(new_cursor, Change.objects.latest('pk').pk)
+        self.assertIn(('tag', tag.pk, 'upsert'), changes)
+
+    def test_empty_poll_single_query(self):
+        """Опрос без новых изменений - один запрос к БД."""
+        cursor = self.client.get('/api/changes/').json()['cursor']
+        self.get_changes(self.client, cursor)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_changes(self.client, cursor),
+                             (cursor, []))
+
+    def test_compaction(self):
+        """Сжатие удаляет перекрытые и устаревшие записи."""
+        for _ in range(2):
+            favorite = Favorite.objects.create(user=self.user,
+                                               recipe=self.recipe)
+            favorite.delete()
+        cursor = self.client.get('/api/changes/').json()['cursor']
+        compact_changes()
+        self.assertEqual(Change.objects.filter(kind='favorite').count(), 1)
+        self.assertEqual(self.get_changes(self.user_client, 0)[1][-1],
+                         ('favorite', self.recipe.pk, 'delete'))
+
+        Change.objects.update(
+            created=timezone.now() - timedelta(
+                days=settings.CHANGES_RETENTION_DAYS + 1))
+        compact_changes()
+        # записи удаляются при следующем сжатии, курсор устарел сразу
+        self.assertTrue(Change.objects.exists())
+        self.assertEqual(
+            self.client.get('/api/changes/?since=0').status_code,
+            HTTPStatus.GONE)
+        self.assertEqual(self.get_changes(self.client, cursor),
+                         (cursor, []))
+        compact_changes()
+        self.assertFalse(Change.objects.exists())
+        self.assertEqual(self.client.get('/api/changes/').json()['cursor'],
+                         0)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeSnapshotTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            username='user', email='user@foodgram.ru')
+        token = Token.objects.create(user=self.user)
+        self.auth_client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+        self.tags = [Tag.objects.create(name=slug, color=color, slug=slug)
+                     for slug, color in (('breakfast', '#E26C2D'),
+                                         ('lunch', '#49B64E'))]
+        self.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Сахар', 'Мука')]
+
+    def recipe_data(self, tags, amounts):
+        image = io.BytesIO()
+        Image.new('RGB', (1, 1)).save(image, 'PNG')
+        return json.dumps({
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': amount}
+                for ingredient, amount in zip(self.ingredients, amounts)],
+            'tags': [tag.pk for tag in tags],
+            'image': 'data:image/png;base64,{}'.format(
+                base64.b64encode(image.getvalue()).decode()),
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 5,
+        })
+
+    def get_recipe(self, recipe_id):
+        response = self.client.get(f'/api/recipes/{recipe_id}/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        data = response.json()
+        return ([tag['slug'] for tag in data['tags']],
+                [(ingredient['name'], ingredient['amount'])
+                 for ingredient in data['ingredients']])
+
+    def test_snapshot_follows_changes(self):
+        """Снимок обновляется при изменении рецепта, тегов, ингредиентов."""
+        response = self.auth_client.post(
+            '/api/recipes/', self.recipe_data(self.tags, (10, 20)),
+            'application/json')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        recipe_id = response.json()['id']
+        self.assertEqual(self.get_recipe(recipe_id), (
+            ['breakfast', 'lunch'], [('Мука', 20), ('Сахар', 10)]))
+
+        response = self.auth_client.patch(
+            f'/api/recipes/{recipe_id}/',
+            self.recipe_data(self.tags[1:], (30,)), 'application/json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(self.get_recipe(recipe_id),
+                         (['lunch'], [('Сахар', 30)]))
+
+        self.tags[1].slug = 'dinner'
+        self.tags[1].save()
+        recipe = Recipe.objects.get(pk=recipe_id)
+        recipe.ingredients.add(self.ingredients[1],
+                               through_defaults={'amount': 5})
+        self.ingredients[0].delete()
+        self.assertEqual(self.get_recipe(recipe_id),
+                         (['dinner'], [('Мука', 5)]))
+        self.assertEqual(Recipe.objects.stale_snapshots(), [])
+
+    def test_admin_relation_changes(self):
+        """Связи, измененные в админке, попадают в снимок."""
+        recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/images/temp.png')
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@foodgram.ru', password='admin')
+        self.client.force_login(admin)
+        response = self.client.post('/admin/recipes/tagrecipe/add/', {
+            'recipe': recipe.pk, 'tag': self.tags[0].pk})
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        response = self.client.post('/admin/recipes/ingredientrecipe/add/', {
+            'recipe': recipe.pk, 'ingredient': self.ingredients[0].pk,
+            'amount': 15})
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.assertEqual(self.get_recipe(recipe.pk),
+                         (['breakfast'], [('Сахар', 15)]))
+
+    def test_check_and_rebuild(self):
+        """Проверка находит расхождения, пересборка их устраняет."""
+        recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/images/temp.png')
+        # bulk_create не отправляет сигналов, снимок устаревает
+        TagRecipe.objects.bulk_create([
+            TagRecipe(recipe=recipe, tag=self.tags[0])])
+        self.assertEqual(Recipe.objects.stale_snapshots(), [recipe.pk])
+        with self.assertRaisesMessage(CommandError, str(recipe.pk)):
+            call_command('build_recipe_snapshots', '--check',
+                         stdout=io.StringIO())
+
+        call_command('build_recipe_snapshots', stdout=io.StringIO())
+        call_command('build_recipe_snapshots', '--check',
+                     stdout=io.StringIO())
+        self.assertEqual(self.get_recipe(recipe.pk), (['breakfast'], []))
+
+    def test_reads_skip_relation_tables(self):
+        """Выдача рецептов не обращается к таблицам связей."""
+        self.auth_client.post(
+            '/api/recipes/', self.recipe_data(self.tags, (10, 20)),
+            'application/json')
+        tables = (TagRecipe._meta.db_table, IngredientRecipe._meta.db_table)
+        for url in ('/api/recipes/', '/api/recipes/?representation=short'):
+            with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            for query in ctx.captured_queries:
+                for table in tables:
+                    self.assertNotIn(table, query['sql'])
+
+
+class PaginationTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(
+            username='author', email='author@foodgram.ru')
+        for number in range(3):
+            self.create_recipe(number)
+
+    def create_recipe(self, number):
+        return Recipe.objects.create(
+            author=self.author, name=f'Рецепт {number}', text='Описание',
+            cooking_time=10, image='recipes/images/temp.png')
+
+    def get_page(self, url):
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        data = response.json()
+        counted = any('COUNT(*)' in query['sql']
+                      for query in ctx.captured_queries)
+        return data['count'], data['next'], data['previous'], counted
+
+    def test_recipe_pages(self):
+        """Ссылки по лишней записи, count на последней странице - без
+        запроса, на остальных - из кэша до изменения данных."""
+        self.assertEqual(self.get_page('/api/recipes/?limit=2'), (
+            3, 'http://testserver/api/recipes/?limit=2&page=2', None, True))
+        self.assertEqual(self.get_page('/api/recipes/?limit=2&page=2'), (
+            3, None, 'http://testserver/api/recipes/?limit=2', False))
+        self.assertEqual(self.get_page('/api/recipes/?limit=2')[::3],
+                         (3, False))
+        response = self.client.get('/api/recipes/?limit=2&page=3')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_recipe(3)
+        self.assertEqual(self.get_page('/api/recipes/?limit=2')[::3],
+                         (4, True))
+        self.assertEqual(self.get_page('/api/recipes/?limit=2&count=0'), (
+            None, 'http://testserver/api/recipes/?count=0&limit=2&page=2',
+            None, False))
+
+    def test_user_pages(self):
+        """Пагинация пользователей по limit и offset."""
+        User.objects.create(username='user', email='user@foodgram.ru')
+        self.assertEqual(self.get_page('/api/users/?limit=2&offset=1'), (
+            2, None, 'http://testserver/api/users/?limit=2', False))
+        self.assertEqual(self.get_page('/api/users/?limit=2&offset=2')[::3],
+                         (2, True))
+        self.assertEqual(self.get_page('/api/users/?limit=1&count=0'), (
+            None, 'http://testserver/api/users/?count=0&limit=1&offset=1',
+            None, False))
+        self.assertEqual(self.get_page('/api/users/?limit=1')[:2], (
+            2, 'http://testserver/api/users/?limit=1&offset=1'))
+
+    @override_settings(PAGINATION_COUNT_ESTIMATE_THRESHOLD=1000)
+    @mock.patch('api.paginator.estimate_count')
+    def test_estimated_count(self, estimate_count):
+        """Большие выборки считаются по оценке планировщика."""
+        estimate_count.return_value = 5000
+        self.assertEqual(self.get_page('/api/recipes/?limit=2')[::3],
+                         (5000, False))
+        cache.clear()
+        estimate_count.return_value = 10
+        self.assertEqual(self.get_page('/api/recipes/?limit=2')[::3],
+                         (3, True))
+
+
+class BatchTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            username='user', email='user@foodgram.ru')
+        self.author = User.objects.create(
+            username='author', email='author@foodgram.ru')
+        Follow.objects.create(user=self.user, following=self.author)
+        token = Token.objects.create(user=self.user)
+        self.auth_client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+        Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+        Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/images/temp.png')
+
+    def post_batch(self, client, urls):
+        return client.post('/api/batch/', json.dumps(
+            {'requests': [{'url': url} for url in urls]}),
+            'application/json')
+
+    def test_batch_responses(self):
+        """Ответы подзапросов совпадают с ответами отдельных запросов."""
+        urls = ['/api/users/me/', '/api/tags/', '/api/recipes/?limit=1',
+                '/api/users/subscriptions/?recipes_limit=1']
+        response = self.post_batch(self.auth_client, urls)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.json()['responses'], [
+            {'status': HTTPStatus.OK, 'body': self.auth_client.get(url).json()}
+            for url in urls])
+
+        response = self.post_batch(self.client, [
+            '/api/users/me/', '/api/recipes/0/', '/api/missing/',
+            '/api/batch/', '/api/metrics'])
+        self.assertEqual(
+            [item['status'] for item in response.json()['responses']],
+            [HTTPStatus.UNAUTHORIZED, HTTPStatus.NOT_FOUND,
+             HTTPStatus.NOT_FOUND, HTTPStatus.BAD_REQUEST,
+             HTTPStatus.BAD_REQUEST])
+
+    def test_subrequest_authentication(self):
+        """Подзапросы выполняются от имени автора пакетного запроса,
+        анонимные - получают 401, как отдельные запросы."""
+        response = self.post_batch(self.auth_client, ['/api/users/me/'])
+        self.assertEqual(response.json()['responses'][0]['body']['id'],
+                         self.user.pk)
+        response = self.post_batch(Client(), ['/api/users/me/'])
+        self.assertEqual(response.json()['responses'][0]['status'],
+                         HTTPStatus.UNAUTHORIZED)
+        response = Client().get('/api/users/me/')
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+
+    def test_non_json_response(self):
+        """Подзапрос к файлу - 400 в ответе подзапроса, а не ошибка."""
+        response = self.post_batch(self.auth_client, [
+            '/api/recipes/download_shopping_cart/', '/api/tags/'])
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        responses = response.json()['responses']
+        self.assertEqual([item['status'] for item in responses],
+                         [HTTPStatus.BAD_REQUEST, HTTPStatus.OK])
+        self.assertIn('JSON', responses[0]['body']['detail'])
+
+    def test_shared_request_cache(self):
+        """Токен проверяется и подписки выбираются один раз на пакет."""
+        urls = ['/api/recipes/?limit=1', f'/api/users/{self.author.pk}/']
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as ctx:
+            response = self.post_batch(self.auth_client, urls)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        for table in ('authtoken_token', 'users_follow'):
+            self.assertEqual(
+                sum(f'FROM "{table}"' in query['sql']
+                    for query in ctx.captured_queries), 1, table)
+
+    @override_settings(BATCH_MAX_REQUESTS=2)
+    def test_invalid_batch(self):
+        """Пакет без запросов, больше лимита, с чужими адресами - 400."""
+        for data in ({}, {'requests': []}, {'requests': ['/api/tags/']},
+                     {'requests': [{'url': '/admin/'}]},
+                     {'requests': [{'url': '/api/tags/'}] * 3}):
+            with self.subTest(data=data):
+                response = self.client.post('/api/batch/', json.dumps(data),
+                                            'application/json')
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.BAD_REQUEST)
+
+
+class JobQueueTestCase(TestCase):
+
+    def setUp(self):
+        JOB_CALLS.clear()
+
+    def run_worker(self):
+        call_command('run_worker', burst=True,
+                     stdout=open(tempfile.mktemp(), 'w'))
+
+    def get_processed(self, func, status):
+        return REGISTRY.get_sample_value(
+            'foodgram_jobs_processed_total',
+            {'job': func.job_name, 'status': status}) or 0
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager_jobs(self):
+        """В режиме JOBS_EAGER задача выполняется при постановке."""
+        self.assertIsNone(record_call.delay(1))
+        self.assertEqual(JOB_CALLS, [1])
+        self.assertFalse(Job.objects.exists())
+        with self.assertRaises(ValueError):
+            failing_job.delay()
+
+    def test_worker_runs_jobs(self):
+        """Воркер выполняет задачи в порядке постановки и удаляет их."""
+        processed = self.get_processed(record_call, 'done')
+        record_call.delay(1)
+        record_call.delay(value=2)
+        self.assertEqual(Job.objects.count(), 2)
+        self.assertEqual(JOB_CALLS, [])
+        self.run_worker()
+        self.assertEqual(JOB_CALLS, [1, 2])
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(self.get_processed(record_call, 'done'),
+                         processed + 2)
+
+    @override_settings(JOBS_RETRY_BACKOFF=60)
+    def test_retry_and_failure(self):
+        """Ошибка откладывает повтор, после max_attempts - failed."""
+        queued = failing_job.delay()
+        self.run_worker()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.STATUS_PENDING)
+        self.assertEqual(queued.attempts, 1)
+        self.assertIn('Ошибка задачи', queued.last_error)
+        self.assertGreater(queued.run_at,
+                           timezone.now() + timedelta(seconds=50))
+        # до наступления run_at задача не выполняется
+        self.run_worker()
+        queued.refresh_from_db()
+        self.assertEqual(queued.attempts, 1)
+
+        Job.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        self.run_worker()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.STATUS_FAILED)
+        self.assertEqual(queued.attempts, 2)
+
+    def test_stale_jobs_requeued(self):
+        """Зависшие задачи возвращаются в очередь или завершаются."""
+        started_at = timezone.now() - timedelta(
+            seconds=settings.JOBS_TIMEOUT + 1)
+        stale, exhausted = (
+            Job.objects.create(name=record_call.job_name, args=[1],
+                               status=Job.STATUS_RUNNING, attempts=attempts,
+                               max_attempts=2, started_at=started_at)
+            for attempts in (1, 2))
+        requeue_stale_jobs()
+        stale.refresh_from_db()
+        exhausted.refresh_from_db()
+        self.assertEqual(stale.status, Job.STATUS_PENDING)
+        self.assertEqual(exhausted.status, Job.STATUS_FAILED)
+        self.run_worker()
+        self.assertEqual(JOB_CALLS, [1])
+
+    def test_recipe_change_job(self):
+        """Задача рецепта обновляет похожие рецепты и ленты."""
+        author = User.objects.create(
+            username='author', email='author@foodgram.ru')
+        follower = User.objects.create(
+            username='follower', email='follower@foodgram.ru')
+        Follow.objects.create(user=follower, following=author)
+        ingredient = Ingredient.objects.create(name='Соль',
+                                               measurement_unit='г')
+        recipes = [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10, image='recipes/images/temp.png')
+            for number in range(2)]
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe in recipes)
+        process_recipe_change.delay(recipes[1].pk, created=True)
+        self.assertFalse(FeedItem.objects.exists())
+        self.run_worker()
+        self.assertEqual(
+            list(FeedItem.objects.values_list('user', 'recipe')),
+            [(follower.pk, recipes[1].pk)])
+        self.assertEqual(
+            list(SimilarRecipe.objects.filter(
+                recipe=recipes[1]).values_list('similar', flat=True)),
+            [recipes[0].pk])
+
+    def test_feed_etag_changes_after_fan_out(self):
+        """После раскладки рецепта лента не отвечает 304 со старым ETag."""
+        author = User.objects.create(
+            username='author', email='author@foodgram.ru')
+        follower = User.objects.create(
+            username='follower', email='follower@foodgram.ru')
+        Follow.objects.create(user=follower, following=author)
+        token = Token.objects.create(user=follower)
+        client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+        recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Описание', cooking_time=10,
+            image='recipes/images/temp.png')
+        process_recipe_change.delay(recipe.pk, created=True)
+        response = client.get('/api/recipes/feed/')
+        self.assertEqual(response.json()['results'], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_worker()
+        response = client.get('/api/recipes/feed/',
+                              HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            [item['id'] for item in response.json()['results']], [recipe.pk])
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+@mock.patch.dict('core.db_routing._unhealthy_until')
+class ReplicaRouterTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    @mock.patch('core.db_routing.is_healthy', return_value=True)
+    def test_reads_routed_only_when_enabled(self, is_healthy):
+        """Чтение с реплики только внутри включенного блока."""
+        self.assertIsNone(self.router.db_for_read(Recipe))
+        with replica_routing() as routing:
+            self.assertIsNone(self.router.db_for_read(Recipe))
+            routing.enable()
+            self.assertEqual(self.router.db_for_read(Recipe), 'replica_0')
+            self.assertEqual(self.router.db_for_write(Recipe),
+                             DEFAULT_DB_ALIAS)
+        self.assertIsNone(self.router.db_for_read(Recipe))
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        """При недоступной реплике чтение идет с основной БД."""
+        mark_unhealthy('replica_0')
+        with replica_routing() as routing:
+            routing.enable()
+            self.assertEqual(self.router.db_for_read(Recipe),
+                             DEFAULT_DB_ALIAS)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+class ReplicaRoutingTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            username='user', email='user@foodgram.ru')
+        token = Token.objects.create(user=self.user)
+        self.auth_client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Текст',
+            image='recipes/images/temp.png', cooking_time=5)
+
+    @mock.patch.object(ReplicaRouting, 'enable')
+    def test_reads_sticky_to_primary_after_write(self, enable):
+        """После записи автор запроса читает с основной БД."""
+        self.auth_client.get('/api/recipes/')
+        self.assertEqual(enable.call_count, 1)
+
+        response = self.auth_client.post(
+            f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertIn(PIN_COOKIE_NAME, response.cookies)
+
+        self.auth_client.get('/api/recipes/')
+        self.assertEqual(enable.call_count, 1)
+
+        # привязка хранится только в cookie
+        self.auth_client.cookies.clear()
+        self.auth_client.get('/api/recipes/')
+        self.assertEqual(enable.call_count, 2)
+
+    @mock.patch.object(ReplicaRouting, 'enable')
+    def test_batch_reads_from_replica(self, enable):
+        """Пакет GET-запросов читает с реплики и не привязывает автора."""
+        response = self.auth_client.post('/api/batch/', json.dumps(
+            {'requests': [{'url': '/api/recipes/'}]}), 'application/json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotIn(PIN_COOKIE_NAME, response.cookies)
+        self.assertEqual(enable.call_count, 1)
+
+    @mock.patch('core.db_routing.mark_unhealthy')
+    @mock.patch('core.db_routing.choose_replica', return_value='replica_0')
+    @mock.patch.object(ReplicaRouter, 'db_for_read', autospec=True)
+    def test_replica_error_falls_back_to_primary(self, db_for_read,
+                                                 choose_replica,
+                                                 mark_unhealthy):
+        """Ошибка чтения с реплики - повтор запроса с основной БД."""
+        def read_from_replica(router, model, **hints):
+            routing = get_routing()
+            if routing and routing.enabled and (
+                    routing.get_alias() != DEFAULT_DB_ALIAS):
+                raise OperationalError('Реплика недоступна')
+            return None
+
+        db_for_read.side_effect = read_from_replica
+        response = self.auth_client.get('/api/recipes/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.json()['results'][0]['id'], self.recipe.pk)
+        mark_unhealthy.assert_called_once_with('replica_0')
+
+        response = self.auth_client.post('/api/batch/', json.dumps(
+            {'requests': [{'url': '/api/recipes/'}]}), 'application/json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.json()['responses'][0]['status'],
+                         HTTPStatus.OK)
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'Реплики не настроены')
+class ReplicaReadsTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def test_safe_request_reads_from_replica(self):
+        """Список рецептов читается с реплики."""
+        replica = connections[settings.DATABASE_REPLICAS[0]]
+        with CaptureQueriesContext(replica) as queries:
+            response = Client().get('/api/recipes/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(queries)
@@ -4,9 +4,11 @@ from django.urls import include, path
 from djoser.views import TokenDestroyView
 from rest_framework.routers import DefaultRouter
 
+from core.views import metrics_view
+
 from .views import (
-    FoodgramUserViewSet, APIObtainAuthToken, TagViewSet,
-    IngredientViewSet, RecipeViewSet
+    FoodgramUserViewSet, APIObtainAuthToken, BatchView, ChangesView,
+    TagViewSet, IngredientViewSet, RecipeViewSet
 )
 
 router = DefaultRouter()
@@ -17,8 +19,11 @@ router.register('recipes', RecipeViewSet, basename='recipes')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('batch/', BatchView.as_view()),
+    path('changes/', ChangesView.as_view()),
     path('auth/token/login/', APIObtainAuthToken.as_view()),
     path('auth/token/logout/', TokenDestroyView.as_view()),
+    path('metrics', metrics_view),
 ]
 
 if settings.DEBUG:
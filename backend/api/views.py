@@ -1,24 +1,35 @@
+import copy
 import csv
-from os.path import join
+import json
+from urllib.parse import urlsplit
 
-from django_filters.rest_framework import DjangoFilterBackend
 from django.conf import settings
+from django_filters.rest_framework import DjangoFilterBackend
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
-from django.db.models import F, Sum
-from django.http import FileResponse
+from django.db import transaction
+from django.db.models import Count, F, Sum, Value
+from django.core.exceptions import ValidationError
+from django.http import FileResponse, Http404, HttpResponse, QueryDict
+from django.utils.cache import parse_etags, patch_vary_headers
 from django.shortcuts import get_object_or_404
+from django.urls import Resolver404, resolve
 from rest_framework import status, viewsets
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.decorators import action
-from rest_framework.exceptions import ParseError
-from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.exceptions import APIException, NotFound, ParseError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
-
-from .filters import RecipeFilter, IngredientFilter
-from .paginator import RecipePagination
+from rest_framework.views import APIView
+
+from .conditional import ConditionalGetMixin
+from .fast_serializers import (FastRecipeSerializer,
+                               FastSubscriptionSerializer,
+                               NormalizedRecipeSerializer)
+from .filters import RecipeFilter, IngredientFilter, get_tag_version
+from .id_sets import ENCODERS
+from .paginator import FeedPagination, RecipePagination, UserPagination
 from .permissions import IsAuthorOrAdminOrReadOnly
 from .serializers import (
     APIUserSerializer, APIUserCreateSerializer,
@@ -26,33 +37,284 @@ from .serializers import (
     ShoppingCartAddSerializer, TagSerializer, IngredientSerializer,
     RecipeReadSerializer, RecipeCreateUpdateSerializer,
     RecipeShortenInfoSerializer, ResetPasswordeSerializer,
-    SubscriptionAddSerializer, UserSubscribeSerializer
+    SubscriptionAddSerializer, UserSubscribeSerializer, USER_FLAGS,
+    get_request_cache
 )
+from core.changes import get_changes, get_cursor, is_cursor_expired
+from core.middleware import get_accepted_encodings
+from core.versions import (get_model_key, get_user_state_key,
+                           get_version_subquery)
+from recipes.catalogue import get_catalogue
+from recipes.feed import get_feed_page, remove_from_feed
 from recipes.models import (
-    Ingredient, IngredientRecipe, Favorite, Recipe, ShoppingCart, Tag
+    Ingredient, IngredientRecipe, Favorite, Recipe, ShoppingCart,
+    SimilarRecipe, Tag, TrendingRecipe
 )
+from recipes.pantry import search as pantry_search
+from recipes.tag_bits import get_tag_bits
 
 User = get_user_model()
 
-
-class RecipeViewSet(viewsets.ModelViewSet):
+# представления рецепта в списке и ленте, параметр representation=;
+# normalized выводит NormalizedRecipeSerializer с полями RecipeReadSerializer
+RECIPE_REPRESENTATIONS = {
+    'full': RecipeReadSerializer,
+    'short': RecipeShortenInfoSerializer,
+    'normalized': RecipeReadSerializer,
+}
+
+
+class SparseFieldsetMixin:
+    """Выбор полей ответа параметрами fields= и omit= (через запятую).
+
+    Действия из sparse_actions выводят только выбранные поля, а
+    get_queryset не загружает связи и аннотации невыбранных полей.
+    Параметр user_flags=0 убирает признаки пользователя (USER_FLAGS), в
+    том числе is_subscribed автора рецепта.
+    """
+
+    sparse_actions = ()
+
+    def get_sparse_fields(self):
+        """Выбранные поля сериализатора, None - все поля."""
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = self.select_fields()
+        return self._sparse_fields
+
+    def select_fields(self):
+        params = self.request.query_params
+        if self.action not in self.sparse_actions:
+            return None
+        if 'fields' not in params and 'omit' not in params and (
+                self.user_flags_requested()):
+            return None
+        available = self.get_serializer_class().Meta.fields
+        requested = {
+            param: set(filter(None, params.get(param, '').split(',')))
+            for param in ('fields', 'omit')
+        }
+        unknown = (requested['fields'] | requested['omit']) - set(available)
+        if unknown:
+            raise ParseError('Неизвестные поля: {}'.format(
+                ', '.join(sorted(unknown))))
+        if not self.user_flags_requested():
+            requested['omit'].update(USER_FLAGS)
+        fields = requested['fields'] or set(available)
+        return tuple(name for name in available
+                     if name in fields and name not in requested['omit'])
+
+    def is_field_selected(self, name):
+        fields = self.get_sparse_fields()
+        if fields is None:
+            fields = self.get_serializer_class().Meta.fields
+        return name in fields
+
+    def user_flags_requested(self):
+        """False при user_flags=0: признаки пользователя не выводятся."""
+        return self.request.query_params.get('user_flags') not in (
+            '0', 'false')
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        if self.action in self.sparse_actions and (
+                not self.user_flags_requested()):
+            kwargs.setdefault('user_flags', False)
+        return super().get_serializer(*args, **kwargs)
+
+
+class RecipeViewSet(ConditionalGetMixin, SparseFieldsetMixin,
+                    viewsets.ModelViewSet):
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     pagination_class = RecipePagination
     ordering = ('-pub_date',)
+    sparse_actions = ('list', 'retrieve', 'feed', 'pantry', 'similar')
+    etag_actions = ('list', 'retrieve', 'feed')
+    etag_models = (Recipe, Tag, Ingredient, User)
+    # действия с выводом через api.fast_serializers
+    fast_actions = ('list', 'retrieve', 'feed')
+
+    def get_etag_keys(self):
+        keys = super().get_etag_keys()
+        if self.action == 'retrieve':
+            # рецепт отслеживается по своему updated_at
+            keys.remove(get_model_key(Recipe))
+        elif 'ordering' in self.request.query_params:
+            keys.append(get_model_key(TrendingRecipe))
+        return keys
+
+    def get_etag_versions(self, keys):
+        """Для рецепта - updated_at и версии одним запросом."""
+        if self.action != 'retrieve':
+            return super().get_etag_versions(keys)
+        versions = {f'version_{number}': get_version_subquery(key)
+                    for number, key in enumerate(keys)}
+        try:
+            return Recipe.objects.filter(pk=self.kwargs['pk']).annotate(
+                **versions).values_list('updated_at', *versions).first()
+        except ValueError:
+            return None
 
     def get_queryset(self):
-        """Добавление полей is_favorited и is_in_shopping_cart."""
-        queryset = Recipe.objects.prefetch_related('carts', 'favorites')
+        """Добавление полей is_favorited и is_in_shopping_cart.
+
+        Связи и аннотации загружаются только для выбранных полей.
+        """
+        queryset = Recipe.objects.all()
+        if self.action in {'list', 'retrieve', 'feed'}:
+            queryset = queryset.with_user_flags(
+                self.request.user,
+                [name for name in ('is_favorited', 'is_in_shopping_cart')
+                 if self.is_field_selected(name)]
+            )
+            if self.use_fast_serializer():
+                # связи загружает FastRecipeSerializer
+                return queryset
+            if self.is_field_selected('author'):
+                queryset = queryset.with_related()
+            if not self.is_field_selected('text'):
+                queryset = queryset.defer('text')
+            if not any(map(self.is_field_selected, ('tags', 'ingredients'))):
+                queryset = queryset.defer('snapshot')
         return queryset
 
+    def use_fast_serializer(self):
+        if self.action not in self.fast_actions:
+            return False
+        return settings.FAST_SERIALIZERS or self.is_normalized()
+
+    def is_normalized(self):
+        """Нормализованное представление: representation=normalized."""
+        return self.action in {'list', 'feed'} and (
+            self.request.query_params.get('representation') == 'normalized')
+
+    def get_fast_serializer(self):
+        """Сериализатор api.fast_serializers, один на запрос."""
+        if not hasattr(self, '_fast_serializer'):
+            fields = self.get_sparse_fields()
+            if fields is None:
+                fields = self.get_serializer_class().Meta.fields
+            serializer_class = FastRecipeSerializer
+            if self.is_normalized():
+                serializer_class = NormalizedRecipeSerializer
+            self._fast_serializer = serializer_class(
+                self.request, fields, self.user_flags_requested())
+        return self._fast_serializer
+
+    def add_included(self, data):
+        """Раздел included в ответе нормализованного представления."""
+        if self.is_normalized():
+            data['included'] = self.get_fast_serializer().get_included()
+        return data
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.use_fast_serializer():
+            return super().retrieve(request, *args, **kwargs)
+        serializer = self.get_fast_serializer()
+        # права на чтение рецепта есть у всех, как в get_object
+        try:
+            row = serializer.get_rows(
+                self.get_queryset().filter(pk=kwargs['pk'])).first()
+        except (TypeError, ValueError, ValidationError):
+            row = None
+        if row is None:
+            raise Http404
+        return Response(serializer.serialize([row])[0])
+
+    def list(self, request, *args, **kwargs):
+        """Список рецептов, с facets=tags - и с количеством по тегам."""
+        if 'ids' in request.query_params:
+            return self.multi_get(request)
+        facets = request.query_params.getlist('facets')
+        if set(facets) - {'tags'}:
+            raise ParseError('Поддерживается только facets=tags!')
+        if self.use_fast_serializer():
+            response = self.fast_list()
+        else:
+            response = super().list(request, *args, **kwargs)
+        if facets:
+            response.data['facets'] = {'tags': self.get_tag_facets()}
+        return response
+
+    def get_requested_ids(self):
+        """Id рецептов из параметра ids= в порядке запроса, без повторов."""
+        try:
+            ids = [int(pk)
+                   for pk in self.request.query_params['ids'].split(',')]
+        except ValueError:
+            raise ParseError(
+                'Укажите id рецептов через запятую: ?ids=1,2,3')
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > settings.RECIPES_IDS_MAX:
+            raise ParseError(
+                f'Не больше {settings.RECIPES_IDS_MAX} рецептов за запрос!')
+        return ids
+
+    def multi_get(self, request):
+        """Рецепты по списку id одним запросом, без пагинации.
+
+        Фильтры списка тоже применяются, несуществующие и не прошедшие
+        фильтры рецепты пропускаются.
+        """
+        data = self.get_recipes_by_ids(
+            self.filter_queryset(self.get_queryset()),
+            self.get_requested_ids())
+        if self.is_normalized():
+            data = self.add_included({'results': data})
+        return Response(data)
+
+    def fast_list(self):
+        serializer = self.get_fast_serializer()
+        rows = serializer.get_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(serializer.serialize(rows))
+        response = self.get_paginated_response(serializer.serialize(page))
+        self.add_included(response.data)
+        return response
+
+    def get_recipes_by_ids(self, queryset, ids):
+        """Рецепты (объекты или строки values) с id из ids по порядку.
+
+        Отсутствующие в queryset рецепты пропускаются.
+        """
+        if self.use_fast_serializer():
+            serializer = self.get_fast_serializer()
+            rows = serializer.get_rows(queryset.filter(pk__in=ids))
+            recipes = {row['id']: row for row in rows}
+            return serializer.serialize(
+                [recipes[pk] for pk in ids if pk in recipes])
+        recipes = queryset.in_bulk(ids)
+        return self.get_serializer(
+            [recipes[pk] for pk in ids if pk in recipes], many=True).data
+
+    def get_tag_facets(self):
+        """Количество рецептов по тегам при текущих фильтрах, кроме tags."""
+        data = self.request.query_params.copy()
+        data.pop('tags', None)
+        filterset = self.filterset_class(
+            data, Recipe.objects.all(), request=self.request)
+        counts = filterset.qs.tag_counts()
+        tag_bits = get_tag_bits(get_tag_version(self.request))
+        return {slug: counts.get(bit, 0) for slug, bit in tag_bits.items()}
+
     def get_serializer_class(self):
         if self.action in {'create', 'partial_update'}:
             return RecipeCreateUpdateSerializer
         if self.action in {'to_shopping_cart_add_delete',
-                           'to_favorite_add_delete'}:
+                           'to_favorite_add_delete', 'pantry', 'similar'}:
             return RecipeShortenInfoSerializer
+        if self.action in {'list', 'feed'}:
+            representation = self.request.query_params.get(
+                'representation', 'full')
+            try:
+                return RECIPE_REPRESENTATIONS[representation]
+            except KeyError:
+                raise ParseError('Параметр representation: {}'.format(
+                    ', '.join(RECIPE_REPRESENTATIONS)))
         return RecipeReadSerializer
 
     @action(('post', 'delete'), url_path='shopping_cart', detail=True,
@@ -72,10 +334,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
             pk__in=ingredient_recipe_pks
         ).values(name=F('ingredient__name')).annotate(amount=Sum('amount'))
 
-        path = join(settings.MEDIA_ROOT, 'shopping_cart', 'shopping-list.csv')
-        cart = open(path, "w+", newline='', encoding='utf-8')
-        cart.truncate()
-        csv_writer = csv.writer(cart)
+        response = HttpResponse(content_type='text/csv')
+        response[
+            'Content-Disposition'] = 'attachment; filename=shopping-list.csv'
+        csv_writer = csv.writer(response)
         csv_writer.writerow(('Список покупок',))
         csv_writer.writerow(('Ингредиент', 'Количество'))
 
@@ -83,15 +345,65 @@ class RecipeViewSet(viewsets.ModelViewSet):
         for ingredient in shopping_cart:
             csv_writer.writerow((ingredient['name'], ingredient['amount']))
 
-        response = FileResponse(cart, content_type='text/csv')
-        response[
-            'Content-Disposition'] = 'attachment; filename=shopping-list.csv'
+        return response
 
-        # Файл выгружается и заполняется данными локально, в пределах backend,
-        # но не выгружается на боевом сервере.
-        # Возможно, требуется дополнительная настройка фронта.
+    @action(url_path='feed', detail=False,
+            permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        """Лента рецептов авторов, на которых подписан пользователь."""
+        paginator = FeedPagination()
+        rows, next_cursor = get_feed_page(
+            request.user, paginator.get_cursor(request),
+            paginator.get_page_size(request))
+        data = self.get_recipes_by_ids(
+            self.get_queryset(), [recipe_id for _, recipe_id in rows])
+        response = paginator.get_paginated_response(
+            request, data, next_cursor)
+        self.add_included(response.data)
         return response
 
+    @action(url_path='pantry', detail=False)
+    def pantry(self, request):
+        """Рецепты по доле имеющихся ингредиентов: ?ingredients=1,5,9."""
+        try:
+            ingredient_ids = [
+                int(pk)
+                for pk in request.query_params['ingredients'].split(',')]
+        except (KeyError, ValueError):
+            raise ParseError(
+                'Укажите id ингредиентов через запятую: ?ingredients=1,5,9')
+        ingredient_ids = list(dict.fromkeys(ingredient_ids))
+        if len(ingredient_ids) > settings.PANTRY_INGREDIENTS_MAX:
+            raise ParseError(
+                f'Не больше {settings.PANTRY_INGREDIENTS_MAX} ингредиентов '
+                f'за запрос!')
+
+        recipe_ids = self.paginate_queryset(pantry_search(ingredient_ids))
+        recipe_ids = [int(recipe_id) for recipe_id in recipe_ids]
+        recipes = Recipe.objects.in_bulk(recipe_ids)
+        # удаленные после сборки индекса рецепты пропускаются
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id in recipe_ids
+             if recipe_id in recipes], many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(url_path='similar', detail=True)
+    def similar(self, request, pk):
+        """Рецепты, похожие по составу ингредиентов."""
+        try:
+            pk = int(pk)
+        except (TypeError, ValueError):
+            # как get_object: некорректный id - рецепт не найден
+            raise Http404
+        similar = SimilarRecipe.objects.filter(
+            recipe_id=pk).select_related('similar').order_by('position')
+        recipes = [item.similar for item in similar]
+        if not recipes:
+            # пустой список только у существующего рецепта
+            get_object_or_404(Recipe, pk=pk)
+        serializer = self.get_serializer(recipes, many=True)
+        return Response(serializer.data)
+
     @action(('post', 'delete'), url_path='favorite', detail=True,
             permission_classes=(IsAuthenticated,))
     def to_favorite_add_delete(self, request, pk):
@@ -117,7 +429,9 @@ class RecipeViewSet(viewsets.ModelViewSet):
         else:
             serializer = ShoppingCartAddSerializer(data=model_data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        # запись в журнал изменений - в той же транзакции
+        with transaction.atomic():
+            serializer.save()
 
         serializer_for_output = self.get_serializer(self.get_object())
         return Response(serializer_for_output.data,
@@ -131,16 +445,66 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        """Весь каталог в JSON - из файла снимка, см. recipes.catalogue."""
+        if request.query_params or request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+
+        snapshot = get_catalogue()
+        if snapshot.etag in parse_etags(
+                request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            encodings = get_accepted_encodings(
+                request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            encoding = next(
+                (encoding for encoding in ('br', 'gzip')
+                 if encoding in encodings), None)
+            response = FileResponse(
+                open(snapshot.get_path(encoding), 'rb'),
+                content_type='application/json', filename='ingredients.json')
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = snapshot.etag
+        response['Link'] = f'<{snapshot.url}>; rel="canonical"'
+        patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+        return response
+
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    etag_models = (Tag,)
+    etag_per_user = False
 
 
-class FoodgramUserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
-    pagination_class = LimitOffsetPagination
+class FoodgramUserViewSet(ConditionalGetMixin, SparseFieldsetMixin,
+                          viewsets.ModelViewSet):
+    pagination_class = UserPagination
+    sparse_actions = ('list', 'retrieve', 'get_self', 'subscriptions')
+    etag_actions = sparse_actions + ('state',)
+    etag_models = (User,)
+
+    def get_etag_keys(self):
+        if self.action == 'state':
+            return [get_user_state_key(self.request.user.pk)]
+        keys = super().get_etag_keys()
+        if self.action == 'subscriptions':
+            keys.append(get_model_key(Recipe))
+        return keys
+
+    def get_queryset(self):
+        queryset = User.objects.all()
+        if self.action in {'subscription_create_delete', 'subscriptions'}:
+            if self.is_field_selected('recipes_count'):
+                queryset = queryset.annotate(recipes_count=Count('recipes'))
+            # для subscriptions рецепты загружает FastSubscriptionSerializer
+            fast = settings.FAST_SERIALIZERS and (
+                self.action == 'subscriptions')
+            if self.is_field_selected('recipes') and not fast:
+                queryset = queryset.prefetch_related('recipes')
+        return queryset
 
     def get_permissions(self):
         if self.action in {'create', 'list', 'retrieve'}:
@@ -169,6 +533,37 @@ class FoodgramUserViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(request.user)
         return Response(serializer.data)
 
+    @action(url_path='me/state', detail=False,
+            permission_classes=(IsAuthenticated,))
+    def state(self, request):
+        """Id рецептов в избранном и списке покупок и id авторов подписок.
+
+        Клиент, закэшировавший ответ (по ETag), запрашивает списки с
+        user_flags=0 и отмечает рецепты и авторов сам.
+        """
+        encoding = request.query_params.get('encoding', 'delta')
+        if encoding not in ENCODERS:
+            raise ParseError('Параметр encoding: {}'.format(
+                ' или '.join(ENCODERS)))
+        user = request.user
+        ids = {'favorites': [], 'shopping_cart': [], 'subscriptions': []}
+        # три множества одним запросом
+        rows = Favorite.objects.filter(user=user).annotate(
+            kind=Value('favorites')
+        ).values_list('kind', 'recipe_id').union(
+            ShoppingCart.objects.filter(user=user).annotate(
+                kind=Value('shopping_cart')
+            ).values_list('kind', 'recipe_id'),
+            user.subscriber.annotate(
+                kind=Value('subscriptions')
+            ).values_list('kind', 'following_id'),
+            all=True)
+        for kind, pk in rows:
+            ids[kind].append(pk)
+        encode = ENCODERS[encoding]
+        return Response({'encoding': encoding, **{
+            kind: encode(values) for kind, values in ids.items()}})
+
     @action(('post',), url_path='set_password', detail=False,
             permission_classes=(IsAuthenticated,))
     def reset_password(self, request):
@@ -190,16 +585,19 @@ class FoodgramUserViewSet(viewsets.ModelViewSet):
         user = request.user
 
         if request.method == 'DELETE':
-            deletion_quantity, _ = user.subscriber.filter(
-                following=user_obj).delete()
-            if deletion_quantity == 0:
-                raise ParseError('Такой подписки нет!')
+            with transaction.atomic():
+                deletion_quantity, _ = user.subscriber.filter(
+                    following=user_obj).delete()
+                if deletion_quantity == 0:
+                    raise ParseError('Такой подписки нет!')
+                remove_from_feed(user, user_obj)
             return Response(status=status.HTTP_204_NO_CONTENT)
 
         serializer = SubscriptionAddSerializer(
             data={'user': user.pk, 'following': pk})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
 
         serializer_for_output = self.get_serializer(user_obj)
         return Response(serializer_for_output.data,
@@ -209,9 +607,16 @@ class FoodgramUserViewSet(viewsets.ModelViewSet):
             permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
         """Список подписок пользователя."""
-        subscribed_on = User.objects.filter(
+        subscribed_on = self.get_queryset().filter(
             following__in=request.user.subscriber.all()
-        )
+        ).order_by('pk')
+        if settings.FAST_SERIALIZERS:
+            fields = self.get_sparse_fields()
+            if fields is None:
+                fields = UserSubscribeSerializer.Meta.fields
+            serializer = FastSubscriptionSerializer(request, fields)
+            page = self.paginate_queryset(serializer.get_rows(subscribed_on))
+            return self.get_paginated_response(serializer.serialize(page))
         subscribed_on = self.paginate_queryset(subscribed_on)
 
         serializer = self.get_serializer(subscribed_on, many=True)
@@ -232,3 +637,148 @@ class APIObtainAuthToken(ObtainAuthToken):
         token, _ = Token.objects.get_or_create(user=user)
 
         return Response({'auth_token': token.key})
+
+
+class CursorExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = ('Курсор устарел: записи журнала удалены, '
+                      'требуется полная синхронизация.')
+    default_code = 'cursor_expired'
+
+
+class ChangesView(APIView):
+    """Журнал изменений после курсора since (core.changes).
+
+    Без since возвращается текущий курсор: клиент запоминает его перед
+    полной загрузкой данных. Измененные объекты клиент перечитывает,
+    например, через /api/recipes/?ids=.
+    """
+
+    def get_int_param(self, name):
+        try:
+            value = int(self.request.query_params[name])
+        except ValueError as exc:
+            raise ParseError(
+                f'Значение {name} должно быть числом!') from exc
+        if value < 0:
+            raise ParseError(f'Значение {name} не может быть отрицательным!')
+        return value
+
+    def get(self, request):
+        if 'since' not in request.query_params:
+            return Response(
+                {'cursor': get_cursor(), 'has_more': False, 'changes': []})
+        since = self.get_int_param('since')
+        limit = settings.CHANGES_PAGE_SIZE
+        if 'limit' in request.query_params:
+            limit = min(max(self.get_int_param('limit'), 1), limit)
+        if is_cursor_expired(since):
+            raise CursorExpired()
+        cursor, has_more, changes = get_changes(request.user, since, limit)
+        return Response({
+            'cursor': cursor,
+            'has_more': has_more,
+            'changes': [{'type': kind, 'id': object_id, 'op': op}
+                        for kind, object_id, op in changes],
+        })
+
+
+class BatchView(APIView):
+    """Несколько GET-запросов к API одним запросом.
+
+    Тело - {"requests": [{"url": "/api/users/me/"}, ...]}, ответ -
+    {"responses": [{"status": 200, "body": ...}, ...]} в порядке
+    запросов. Подзапросы выполняются в процессе представлениями API без
+    middleware и повторной проверки токена и делят кэш запроса
+    (get_request_cache), например id авторов в подписках.
+    """
+
+    # данные не изменяются: запрос не привязывает автора к основной БД
+    read_only = True
+    url_prefix = '/api/'
+    # заголовки пакетного запроса, не относящиеся к подзапросам
+    dropped_meta = ('CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_ACCEPT_ENCODING',
+                    'HTTP_IF_NONE_MATCH')
+
+    def get_urls(self):
+        items = self.request.data
+        if isinstance(items, dict):
+            items = items.get('requests')
+        if not isinstance(items, list) or not items:
+            raise ParseError('Передайте непустой список requests!')
+        if len(items) > settings.BATCH_MAX_REQUESTS:
+            raise ParseError(
+                f'Не больше {settings.BATCH_MAX_REQUESTS} запросов в пакете!')
+        urls = []
+        for item in items:
+            url = item.get('url') if isinstance(item, dict) else None
+            if not isinstance(url, str) or not url.startswith(
+                    self.url_prefix):
+                raise ParseError(
+                    f'Адрес запроса должен начинаться с {self.url_prefix}!')
+            urls.append(url)
+        return urls
+
+    def get_subrequest(self, parts):
+        """GET-запрос от имени автора пакетного запроса."""
+        request = self.request
+        subrequest = copy.copy(request._request)
+        subrequest.method = 'GET'
+        subrequest.path = subrequest.path_info = parts.path
+        subrequest.META = {key: value for key, value in request.META.items()
+                           if key not in self.dropped_meta}
+        subrequest.META.update(
+            REQUEST_METHOD='GET', PATH_INFO=parts.path,
+            QUERY_STRING=parts.query, HTTP_ACCEPT='application/json')
+        subrequest.GET = QueryDict(parts.query)
+        if request.user.is_authenticated:
+            # пользователь уже аутентифицирован пакетным запросом,
+            # см. api.authentication.BatchSubrequestAuthentication
+            subrequest.batch_auth = (request.user, request.auth)
+        subrequest.request_cache = get_request_cache(request)
+        return subrequest
+
+    def is_json(self, response):
+        content_type = response.get('Content-Type', '')
+        return content_type.split(';')[0].strip() == 'application/json'
+
+    def get_body(self, response):
+        if isinstance(response, Response):
+            return response.data
+        if response.streaming:
+            content = b''.join(response.streaming_content)
+        else:
+            content = response.content
+        return json.loads(content) if content else None
+
+    def dispatch_url(self, url):
+        """Статус и данные ответа на подзапрос url."""
+        parts = urlsplit(url)
+        try:
+            match = resolve(parts.path)
+        except Resolver404:
+            return (status.HTTP_404_NOT_FOUND,
+                    {'detail': str(NotFound.default_detail)})
+        view_class = getattr(match.func, 'cls', None)
+        if view_class is None or issubclass(view_class, BatchView):
+            return (status.HTTP_400_BAD_REQUEST,
+                    {'detail': 'Адрес недоступен в пакетном запросе.'})
+        response = match.func(
+            self.get_subrequest(parts), *match.args, **match.kwargs)
+        try:
+            if not isinstance(response, Response) and not self.is_json(
+                    response):
+                # файлы (например, список покупок) в JSON не передать
+                return (status.HTTP_400_BAD_REQUEST,
+                        {'detail': 'В пакетном запросе доступны только '
+                                   'ответы в формате JSON.'})
+            return response.status_code, self.get_body(response)
+        finally:
+            response.close()
+
+    def post(self, request):
+        responses = []
+        for url in self.get_urls():
+            status_code, body = self.dispatch_url(url)
+            responses.append({'status': status_code, 'body': body})
+        return Response({'responses': responses})
@@ -0,0 +1,4 @@
+"""Нагрузочные замеры горячих путей API.
+
+Запуск: python manage.py benchmark --help
+"""
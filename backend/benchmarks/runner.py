@@ -0,0 +1,191 @@
+"""Выполнение сценариев и сравнение результатов с эталоном."""
+import json
+import math
+import resource
+import time
+import uuid
+from collections import Counter
+from statistics import mean
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from core.datagen import PLACEHOLDER_IMAGE
+from recipes.models import Ingredient, Recipe, Tag
+
+from .scenarios import get_image_data
+
+
+class BenchmarkContext:
+    """Данные, на которые ссылаются запросы сценариев."""
+
+    def __init__(self, user):
+        self.run_id = uuid.uuid4().hex[:8]
+        self.user = user
+        self.token = Token.objects.get_or_create(user=user)[0].key
+        self.image_data = get_image_data()
+        self.recipe_ids = list(Recipe.objects.values_list('pk', flat=True))
+        self.toggle_recipe_ids = list(
+            Recipe.objects.exclude(favorites__user=user).exclude(
+                carts__user=user).values_list('pk', flat=True)
+        ) or self.recipe_ids
+        self.tag_ids = list(Tag.objects.values_list('pk', flat=True))
+        self.tag_slugs = list(Tag.objects.values_list('slug', flat=True))
+        self.ingredient_ids = list(
+            Ingredient.objects.values_list('pk', flat=True)[:50])
+        self.ingredient_names = list(
+            Ingredient.objects.values_list('name', flat=True)[:50])
+        followed = user.subscriber.values_list('following', flat=True)
+        self.author_id = followed.first() or user.pk
+        own_recipe = user.recipes.first()
+        if own_recipe is None:
+            # сценарий recipe_patch изменяет рецепт пользователя замера
+            own_recipe = Recipe.objects.create(
+                author=user, name=f'{self.run_id} свой рецепт',
+                text='Рецепт для замера', cooking_time=15,
+                image=PLACEHOLDER_IMAGE.format(0))
+        self.own_recipe_id = own_recipe.pk
+
+    def recipe_id(self, iteration):
+        return self.recipe_ids[iteration % len(self.recipe_ids)]
+
+    def toggle_recipe_id(self, iteration):
+        return self.toggle_recipe_ids[
+            iteration % len(self.toggle_recipe_ids)]
+
+    def ingredient_prefix(self, iteration):
+        name = self.ingredient_names[iteration % len(self.ingredient_names)]
+        return name[:3]
+
+
+class TestClientTransport:
+    """Запросы через тестовый клиент Django к текущему URLconf."""
+
+    counts_queries = True
+
+    def __init__(self):
+        self.client = Client(SERVER_NAME='localhost')
+
+    def request(self, method, path, data, token):
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        with CaptureQueriesContext(connection) as queries:
+            if data is None:
+                response = self.client.generic(method.upper(), path,
+                                               **headers)
+            else:
+                response = self.client.generic(
+                    method.upper(), path, json.dumps(data),
+                    'application/json', **headers)
+            if response.streaming:
+                body = b''.join(response.streaming_content)
+            else:
+                body = response.content
+        return response.status_code, len(body), len(queries)
+
+
+class HTTPTransport:
+    """Запросы к запущенному серверу, например локальному gunicorn."""
+
+    counts_queries = False
+
+    def __init__(self, base_url):
+        import requests
+
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method, path, data, token):
+        headers = {'Authorization': f'Token {token}'} if token else {}
+        response = self.session.request(method, self.base_url + path,
+                                        json=data, headers=headers)
+        return response.status_code, len(response.content), None
+
+
+def percentile(values, percent):
+    """Перцентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    rank = math.ceil(percent / 100 * len(ordered))
+    return ordered[max(rank - 1, 0)]
+
+
+def run_scenario(transport, scenario, context, iterations, warmup=1):
+    token = context.token if scenario.auth else None
+    for iteration in range(warmup):
+        for method, path, data in scenario.requests(context, iteration):
+            transport.request(method, path, data, token)
+
+    latencies = []
+    queries = []
+    response_bytes = []
+    status_codes = Counter()
+    started = time.perf_counter()
+    for iteration in range(warmup, warmup + iterations):
+        for method, path, data in scenario.requests(context, iteration):
+            start = time.perf_counter()
+            status_code, size, query_count = transport.request(
+                method, path, data, token)
+            latencies.append(time.perf_counter() - start)
+            status_codes[str(status_code)] += 1
+            response_bytes.append(size)
+            if query_count is not None:
+                queries.append(query_count)
+    elapsed = time.perf_counter() - started
+
+    return {
+        'requests': len(latencies),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'mean_ms': mean(latencies) * 1000,
+        'rps': len(latencies) / elapsed,
+        'queries_per_request': mean(queries) if queries else None,
+        'bytes_per_request': mean(response_bytes),
+        'status_codes': dict(status_codes),
+    }
+
+
+def peak_rss_mb():
+    """Пиковый объем резидентной памяти процесса (ru_maxrss в Кб)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(transport, scenarios, context, iterations, warmup=1):
+    results = {
+        scenario.name: run_scenario(transport, scenario, context,
+                                    iterations, warmup)
+        for scenario in scenarios
+    }
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'database': connection.vendor,
+        'iterations': iterations,
+        'peak_rss_mb': peak_rss_mb(),
+        'scenarios': results,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Регрессии относительно эталона.
+
+    Регрессия - рост p95 более чем на threshold (доля)
+    или рост количества SQL-запросов на запрос.
+    """
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+            regressions.append(
+                f'{name}: p95 {previous["p95_ms"]:.2f} -> '
+                f'{current["p95_ms"]:.2f} мс'
+            )
+        queries = current['queries_per_request']
+        previous_queries = previous['queries_per_request']
+        if None not in (queries, previous_queries) and (
+                queries > previous_queries):
+            regressions.append(
+                f'{name}: SQL-запросов {previous_queries} -> {queries}')
+    return regressions
@@ -0,0 +1,124 @@
+"""Сценарии замеров: набор запросов к горячим путям API."""
+import base64
+import itertools
+from pathlib import Path
+
+from django.conf import settings
+
+from core.datagen import PLACEHOLDER_IMAGE
+
+RECIPE_FILTERS = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+
+
+def get_image_data():
+    """Картинка рецепта в формате base64, как ее отправляет фронтенд."""
+    image = Path(settings.MEDIA_ROOT,
+                 PLACEHOLDER_IMAGE.format(0)).read_bytes()
+    return 'data:image/png;base64,' + base64.b64encode(image).decode()
+
+
+class Scenario:
+    """Сценарий - последовательность запросов одной итерации замера."""
+
+    def __init__(self, name, build_requests, auth=False):
+        self.name = name
+        self.build_requests = build_requests
+        self.auth = auth
+
+    def requests(self, context, iteration):
+        """Запросы итерации: кортежи (метод, адрес, тело запроса)."""
+        return self.build_requests(context, iteration)
+
+
+def recipe_list_filter_params(context, filters):
+    params = {
+        'author': f'author={context.author_id}',
+        'tags': '&'.join(f'tags={slug}' for slug in context.tag_slugs[:2]),
+        'is_favorited': 'is_favorited=1',
+        'is_in_shopping_cart': 'is_in_shopping_cart=1',
+    }
+    return '&'.join(params[name] for name in filters)
+
+
+def recipe_list_scenarios():
+    """Список рецептов со всеми сочетаниями фильтров RecipeFilter."""
+    for size in range(len(RECIPE_FILTERS) + 1):
+        for filters in itertools.combinations(RECIPE_FILTERS, size):
+            name = 'recipe_list[{}]'.format('+'.join(filters) or 'all')
+            yield Scenario(
+                name,
+                lambda context, iteration, filters=filters: [(
+                    'get',
+                    '/api/recipes/?{}'.format(
+                        recipe_list_filter_params(context, filters)),
+                    None,
+                )],
+                auth=bool(filters),
+            )
+
+
+def recipe_body(context, name):
+    return {
+        'ingredients': [{'id': pk, 'amount': 10}
+                        for pk in context.ingredient_ids[:5]],
+        'tags': context.tag_ids[:2],
+        'image': context.image_data,
+        'name': name,
+        'text': 'Рецепт для замера',
+        'cooking_time': 15,
+    }
+
+
+def toggle_requests(context, iteration, url_path):
+    """Добавление рецепта в избранное или список покупок и отмена."""
+    path = f'/api/recipes/{context.toggle_recipe_id(iteration)}/{url_path}/'
+    return [('post', path, None), ('delete', path, None)]
+
+
+def get_scenarios():
+    scenarios = list(recipe_list_scenarios())
+    scenarios += [
+        Scenario('recipe_list[facets=tags]', lambda context, iteration: [(
+            'get', '/api/recipes/?facets=tags', None,
+        )]),
+        Scenario('recipe_list[trending]', lambda context, iteration: [(
+            'get', '/api/recipes/?ordering=trending', None,
+        )]),
+        Scenario('recipe_detail', lambda context, iteration: [(
+            'get',
+            f'/api/recipes/{context.recipe_id(iteration)}/',
+            None,
+        )]),
+        Scenario('ingredient_list', lambda context, iteration: [(
+            'get', '/api/ingredients/', None,
+        )]),
+        Scenario('ingredient_search', lambda context, iteration: [(
+            'get',
+            f'/api/ingredients/?name={context.ingredient_prefix(iteration)}',
+            None,
+        )]),
+        Scenario('user_list', lambda context, iteration: [(
+            'get', '/api/users/', None,
+        )]),
+        Scenario('subscriptions', lambda context, iteration: [(
+            'get', '/api/users/subscriptions/?recipes_limit=3', None,
+        )], auth=True),
+        Scenario('favorite_toggle', lambda context, iteration: (
+            toggle_requests(context, iteration, 'favorite')
+        ), auth=True),
+        Scenario('shopping_cart_toggle', lambda context, iteration: (
+            toggle_requests(context, iteration, 'shopping_cart')
+        ), auth=True),
+        Scenario('recipe_create', lambda context, iteration: [(
+            'post', '/api/recipes/',
+            recipe_body(context, f'{context.run_id} новый {iteration}'),
+        )], auth=True),
+        Scenario('recipe_patch', lambda context, iteration: [(
+            'patch', f'/api/recipes/{context.own_recipe_id}/',
+            recipe_body(context, f'{context.run_id} изменен {iteration}'),
+        )], auth=True),
+        Scenario('shopping_cart_download', lambda context, iteration: [(
+            'get', '/api/recipes/download_shopping_cart/', None,
+        )], auth=True),
+    ]
+    return scenarios
@@ -0,0 +1,153 @@
+"""Замеры сериализации ответов.
+
+Рендереры: данные ответа получаются один раз через тестовый клиент,
+после чего каждым рендерером многократно сериализуются одни и те же
+данные - в замер не попадают запросы к БД и работа сериализаторов DRF.
+
+Сборка ответа: стоимость на строку выдачи у сериализаторов DRF и
+api.fast_serializers. Связи загружаются заранее, в замер попадает
+только сборка данных ответа.
+
+Нормализованное представление: время запроса и объем ответа списка
+рецептов с representation=full и normalized на нескольких размерах
+страницы.
+"""
+import time
+
+import brotli
+from django.contrib.auth import get_user_model
+from django.db.models import Count
+from django.test import Client, RequestFactory
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from api.fast_serializers import (FastRecipeSerializer,
+                                  FastSubscriptionSerializer)
+from api.renderers import MessagePackRenderer, ORJSONRenderer
+from api.serializers import RecipeReadSerializer, UserSubscribeSerializer
+from core.middleware import BROTLI_QUALITY
+from recipes.models import Recipe
+
+from .runner import percentile
+
+User = get_user_model()
+
+PATHS = {
+    'recipe_list': '/api/recipes/?limit=50',
+    # пустой фильтр: без параметров каталог отдается из файла снимка
+    'ingredient_list': '/api/ingredients/?name=',
+}
+ROWS_LIMIT = 50
+NORMALIZED_LIMITS = (6, 50, 200)
+RENDERERS = {
+    'json': JSONRenderer(),
+    'orjson': ORJSONRenderer(),
+    'msgpack': MessagePackRenderer(),
+}
+
+
+def measure_renderer(renderer, data, iterations):
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        content = renderer.render(data)
+        latencies.append(time.perf_counter() - start)
+    return {
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        **measure_content(content),
+    }
+
+
+def measure_content(content):
+    return {
+        'bytes': len(content),
+        'gzip_bytes': len(compress_string(content)),
+        'br_bytes': len(brotli.compress(content, quality=BROTLI_QUALITY)),
+    }
+
+
+def run_serialization(token, iterations):
+    """Результаты по ответам и рендерерам: {'ответ[рендерер]': {...}}."""
+    client = Client(SERVER_NAME='localhost',
+                    HTTP_AUTHORIZATION=f'Token {token}')
+    results = {}
+    for name, path in PATHS.items():
+        data = client.get(path).data
+        for renderer_name, renderer in RENDERERS.items():
+            results[f'{name}[{renderer_name}]'] = measure_renderer(
+                renderer, data, iterations)
+    return results
+
+
+def measure_rows(build, rows_count, iterations):
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        build()
+        latencies.append(time.perf_counter() - start)
+    per_row = 1e6 / max(rows_count, 1)
+    return {
+        'rows': rows_count,
+        'p50_us_per_row': percentile(latencies, 50) * per_row,
+        'p95_us_per_row': percentile(latencies, 95) * per_row,
+    }
+
+
+def run_row_serialization(user, iterations):
+    """Сборка ответа на строку: {'ответ[drf|fast]': {...}}."""
+    request = Request(RequestFactory().get('/', SERVER_NAME='localhost'))
+    request.user = user
+    context = {'request': request}
+
+    recipes = Recipe.objects.with_user_flags(user)[:ROWS_LIMIT]
+    recipe_objects = list(recipes.with_related())
+    fast_recipes = FastRecipeSerializer(request)
+    recipe_rows = list(fast_recipes.get_rows(recipes))
+    fast_recipes.load(recipe_rows)
+
+    users = User.objects.filter(
+        following__user=user).annotate(recipes_count=Count('recipes'))
+    user_objects = list(users.prefetch_related('recipes'))
+    fast_users = FastSubscriptionSerializer(request)
+    user_rows = list(fast_users.get_rows(users))
+    fast_users.load(user_rows)
+
+    builders = {
+        'recipe_list[drf]': (len(recipe_objects), lambda: RecipeReadSerializer(
+            recipe_objects, many=True, context=context).data),
+        'recipe_list[fast]': (len(recipe_rows),
+                              lambda: fast_recipes.build(recipe_rows)),
+        'subscriptions[drf]': (len(user_objects),
+                               lambda: UserSubscribeSerializer(
+                                   user_objects, many=True,
+                                   context=context).data),
+        'subscriptions[fast]': (len(user_rows),
+                                lambda: fast_users.build(user_rows)),
+    }
+    return {name: measure_rows(build, rows_count, iterations)
+            for name, (rows_count, build) in builders.items()}
+
+
+def run_normalized(token, iterations):
+    """Список рецептов: {'recipe_list[представление, limit=N]': {...}}."""
+    client = Client(SERVER_NAME='localhost',
+                    HTTP_AUTHORIZATION=f'Token {token}')
+    results = {}
+    for limit in NORMALIZED_LIMITS:
+        for representation in ('full', 'normalized'):
+            path = (f'/api/recipes/?limit={limit}'
+                    f'&representation={representation}')
+            latencies = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                response = client.get(path)
+                latencies.append(time.perf_counter() - start)
+            results[f'recipe_list[{representation}, limit={limit}]'] = {
+                'rows': len(response.data['results']),
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p95_ms': percentile(latencies, 95) * 1000,
+                **measure_content(response.content),
+            }
+    return results
@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html
+
+from .models import Job, RequestProfile
+
+PROFILE_FILE_FIELDS = ('profile_file', 'sql_file')
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created', 'method', 'path', 'user', 'status_code',
+                    'duration', 'query_count', 'mode', 'download_links')
+    list_filter = ('mode', 'method', 'status_code')
+    search_fields = ('path',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/download/<str:kind>/',
+                 self.admin_site.admin_view(self.download_view),
+                 name='core_requestprofile_download'),
+        ] + super().get_urls()
+
+    @admin.display(description='Файлы')
+    def download_links(self, profile):
+        return format_html(
+            '<a href="{}">профиль</a> / <a href="{}">SQL</a>',
+            *(reverse('admin:core_requestprofile_download',
+                      args=(profile.pk, kind))
+              for kind in PROFILE_FILE_FIELDS)
+        )
+
+    def download_view(self, request, pk, kind):
+        """Выгрузка файла профиля или списка SQL-запросов."""
+        if kind not in PROFILE_FILE_FIELDS:
+            raise Http404
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        filename = getattr(profile, kind)
+        try:
+            file = open(f'{settings.PROFILES_DIR}/{filename}', 'rb')
+        except FileNotFoundError as exc:
+            raise Http404 from exc
+        return FileResponse(file, as_attachment=True, filename=filename,
+                            content_type='text/plain')
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'max_attempts', 'run_at',
+                    'created')
+    list_filter = ('status', 'name')
+    actions = ('retry_jobs',)
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Повторить выбранные задачи')
+    def retry_jobs(self, request, queryset):
+        queryset.exclude(status=Job.STATUS_RUNNING).update(
+            status=Job.STATUS_PENDING, attempts=0, run_at=timezone.now())
+
+
+admin.site.register(Job, JobAdmin)
+admin.site.register(RequestProfile, RequestProfileAdmin)
@@ -0,0 +1,162 @@
+"""Журнал изменений для синхронизации клиентов (/api/changes/).
+
+Изменения рецептов, тегов и ингредиентов, а также избранного, списка
+покупок и подписок пользователя дописываются в таблицу Change в той же
+транзакции, что и сами изменения. Курсор клиента - id последней
+полученной записи: опрос без новых изменений - один запрос по
+первичному ключу с пустым результатом.
+
+Id записей выдаются при вставке, а видны записи после фиксации
+транзакции, поэтому запись с меньшим id может появиться позже записи
+с большим. Чтобы такая запись не оказалась до уже выданного клиенту
+курсора, клиенту выдаются только записи не новее последней записи,
+созданной больше CHANGES_COMMIT_WINDOW секунд назад: транзакции,
+пишущие в журнал, должны фиксироваться быстрее этого окна (а часы
+серверов приложения - быть синхронизированы). Общего счетчика и
+блокировки при записи нет.
+
+Сжатие (команда compact_changes) удаляет записи, перекрытые более
+поздней записью о том же объекте, и записи старше
+CHANGES_RETENTION_DAYS дней. Граница удаленных по возрасту записей
+хранится в счетчике CHANGES_COMPACTED_KEY; курсор меньше границы
+устарел - клиенту нужна полная синхронизация.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef, Q, Subquery
+from django.db.models.signals import post_delete
+from django.utils import timezone
+
+from .metrics import record_cache_access
+from .models import Change, Version
+from .versions import get_versions
+
+CHANGES_COMPACTED_KEY = 'changes:compacted'
+COMPACTED_CACHE_KEY = 'core:changes_compacted'
+# граница кэшируется локально для процесса; записи удаляются только
+# до границы предыдущего сжатия, которая давно попала во все кэши
+COMPACTED_CACHE_TIMEOUT = 60
+
+
+def record_changes(kind, object_ids, op=Change.OP_UPSERT, user_id=None):
+    """Запись в журнал изменений объектов kind с id из object_ids.
+
+    user_id - владелец личных изменений (избранное, список покупок,
+    подписки), для общих изменений - None.
+    """
+    object_ids = list(object_ids)
+    if not object_ids:
+        return
+    Change.objects.bulk_create(
+        Change(kind=kind, object_id=object_id, op=op, user_id=user_id)
+        for object_id in object_ids)
+
+
+def record_change(kind, object_id, op=Change.OP_UPSERT, user_id=None):
+    record_changes(kind, (object_id,), op, user_id)
+
+
+def get_change_op(signal):
+    """Операция записи журнала по сигналу post_save или post_delete."""
+    return Change.OP_DELETE if signal is post_delete else Change.OP_UPSERT
+
+
+def get_committed_changes():
+    """Записи, созданные раньше окна фиксации CHANGES_COMMIT_WINDOW.
+
+    Транзакции, вставившие записи с меньшими id, к этому моменту
+    зафиксированы, поэтому курсор до последней из них безопасен.
+    """
+    return Change.objects.filter(created__lte=timezone.now() - timedelta(
+        seconds=settings.CHANGES_COMMIT_WINDOW))
+
+
+def get_cursor():
+    """Текущий курсор: с него клиент начинает после полной загрузки."""
+    return get_committed_changes().aggregate(
+        cursor=Max('pk'))['cursor'] or 0
+
+
+def get_compacted_cursor():
+    """Граница удаленных по возрасту записей журнала."""
+    compacted = cache.get(COMPACTED_CACHE_KEY)
+    record_cache_access('changes_compacted', compacted is not None)
+    if compacted is None:
+        compacted, = get_versions((CHANGES_COMPACTED_KEY,))
+        cache.set(COMPACTED_CACHE_KEY, compacted, COMPACTED_CACHE_TIMEOUT)
+    return compacted
+
+
+def is_cursor_expired(since):
+    return since < get_compacted_cursor()
+
+
+def get_changes(user, since, limit):
+    """Изменения после курсора since, видимые пользователю user.
+
+    Возвращает (курсор, есть ли еще изменения, список записей
+    (kind, object_id, op)). Из нескольких записей об одном объекте
+    остается последняя: клиент перечитывает объект целиком.
+    """
+    visible = Q(user__isnull=True)
+    if not user.is_anonymous:
+        visible |= Q(user=user)
+    # граница чтения - подзапросом: пустой опрос остается одним запросом
+    read_limit = Subquery(
+        get_committed_changes().order_by('-pk').values('pk')[:1])
+    rows = list(Change.objects.filter(
+        visible, pk__gt=since, pk__lte=read_limit).order_by('pk').values_list(
+        'pk', 'kind', 'object_id', 'op')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    cursor = rows[-1][0] if rows else since
+    latest = {}
+    for _, kind, object_id, op in rows:
+        # повторно вставленный ключ переезжает в конец словаря
+        latest.pop((kind, object_id), None)
+        latest[kind, object_id] = op
+    return cursor, has_more, [
+        (kind, object_id, op) for (kind, object_id), op in latest.items()]
+
+
+def compact_changes(now=None):
+    """Сжатие журнала, возвращает количество удаленных записей.
+
+    По возрасту удаляются записи до границы предыдущего сжатия, а новой
+    границей становится последняя запись старше CHANGES_RETENTION_DAYS:
+    за время между запусками граница успевает обновиться в кэшах
+    get_compacted_cursor, и клиент с устаревшим курсором получает
+    отказ, а не ответ с пропущенными записями.
+    """
+    now = now or timezone.now()
+    deleted = 0
+    # перекрытые записи не нужны ни одному курсору: клиент, не
+    # получивший старую запись, получит более позднюю
+    later = Change.objects.filter(
+        kind=OuterRef('kind'), object_id=OuterRef('object_id'),
+        pk__gt=OuterRef('pk'))
+    for superseded in (
+            Change.objects.filter(user__isnull=True).filter(
+                Exists(later.filter(user__isnull=True))),
+            # user_id = NULL не совпадает ни с чем: общие записи здесь
+            # не удаляются
+            Change.objects.filter(Exists(later.filter(user=OuterRef('user'))))
+    ):
+        count, _ = superseded.delete()
+        deleted += count
+
+    with transaction.atomic():
+        compacted, = get_versions((CHANGES_COMPACTED_KEY,))
+        count, _ = Change.objects.filter(pk__lte=compacted).delete()
+        deleted += count
+        boundary = Change.objects.filter(
+            created__lt=now - timedelta(days=settings.CHANGES_RETENTION_DAYS)
+        ).aggregate(boundary=Max('pk'))['boundary']
+        if boundary is not None and boundary > compacted:
+            Version.objects.update_or_create(
+                key=CHANGES_COMPACTED_KEY, defaults={'value': boundary})
+    cache.delete(COMPACTED_CACHE_KEY)
+    return deleted
@@ -0,0 +1,335 @@
+"""Генерация синтетических данных для замеров производительности.
+
+Популярность рецептов, авторов и ингредиентов распределена по закону Ципфа,
+при одинаковом seed на пустой БД получается одинаковый набор данных.
+Записи вставляются пакетами через bulk_create, на PostgreSQL - через COPY.
+"""
+import csv
+import heapq
+import io
+import itertools
+import json
+import math
+import random
+import re
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+
+from .versions import bump_model_versions, bump_user_state
+from recipes.models import (FeedItem, Favorite, Ingredient, IngredientRecipe,
+                            Recipe, ShoppingCart, Tag, TagRecipe,
+                            empty_snapshot)
+from users.models import Follow
+
+User = get_user_model()
+
+DEFAULT_PASSWORD = 'benchmark-password'
+PLACEHOLDER_IMAGE = 'recipes/images/placeholder-{}.png'
+PLACEHOLDER_IMAGES_COUNT = 8
+PLACEHOLDER_IMAGE_SIZE = (64, 64)
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+BATCH_SIZE = 5000
+# доля от всех возможных пар, начиная с которой пары выбираются
+# перебором: выборка с отбрасыванием повторов почти не находит новых
+DENSE_PAIRS_SHARE = 0.1
+RECIPES_PERIOD = timedelta(days=365)
+# добавления в избранное и списки покупок - за последний месяц
+INTERACTIONS_PERIOD = timedelta(days=30)
+
+
+class ZipfSampler:
+    """Выбор элементов последовательности с вероятностью ~ 1 / rank^s."""
+
+    def __init__(self, items, exponent, rnd):
+        self.items = items
+        self.rnd = rnd
+        self.weights = [1 / rank ** exponent
+                        for rank in range(1, len(items) + 1)]
+        self.cum_weights = list(itertools.accumulate(self.weights))
+
+    def sample(self, count):
+        return self.rnd.choices(self.items, cum_weights=self.cum_weights,
+                                k=count)
+
+    def sample_unique(self, count):
+        """Несколько различных элементов, count не больше len(items)."""
+        chosen = set()
+        while len(chosen) < count:
+            chosen.update(self.sample(count - len(chosen)))
+        return chosen
+
+
+def insert_rows(model, fields, rows, batch_size=BATCH_SIZE):
+    """Пакетная вставка строк (кортежей значений полей fields)."""
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+        if connection.vendor == 'postgresql':
+            copy_rows(model, fields, batch)
+        else:
+            model.objects.bulk_create(
+                model(**dict(zip(fields, row))) for row in batch)
+
+
+def format_copy_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def copy_rows(model, fields, rows):
+    """Вставка строк в таблицу модели командой COPY.
+
+    Значения по умолчанию Django в БД не хранит: fields должны включать
+    все поля модели без null=True, кроме первичного ключа.
+    """
+    columns = [model._meta.get_field(field).column for field in fields]
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        map(format_copy_value, row) for row in rows)
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+                connection.ops.quote_name(model._meta.db_table),
+                ', '.join(map(connection.ops.quote_name, columns))),
+            buffer)
+
+
+@contextmanager
+def explicit_pub_date():
+    """Отключение auto_now_add, чтобы задать даты публикации рецептов."""
+    field = Recipe._meta.get_field('pub_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def ensure_reference_data():
+    """Наличие тегов и каталога ингредиентов."""
+    if not Tag.objects.exists():
+        Tag.objects.bulk_create(
+            Tag(name=name, color=color, slug=slug, bit=bit)
+            for bit, (name, color, slug) in enumerate(DEFAULT_TAGS)
+        )
+        bump_model_versions(Tag)
+    if not Ingredient.objects.exists():
+        call_command('load_ingredients', stdout=io.StringIO())
+
+
+def create_placeholder_images():
+    """Набор однотонных картинок для рецептов в MEDIA_ROOT."""
+    images = []
+    for number in range(PLACEHOLDER_IMAGES_COUNT):
+        name = PLACEHOLDER_IMAGE.format(number)
+        path = Path(settings.MEDIA_ROOT, name)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            color_rnd = random.Random(number)
+            color = tuple(color_rnd.randrange(256) for _ in range(3))
+            Image.new('RGB', PLACEHOLDER_IMAGE_SIZE, color).save(path)
+        images.append(name)
+    return images
+
+
+def generate_pairs(left_sampler, right_sampler, count, exclude_self=False):
+    """Различные пары (left, right) в количестве count.
+
+    Пары выбираются с отбрасыванием повторов, а при count больше
+    DENSE_PAIRS_SHARE от всех возможных пар - перебором всех пар с
+    весами (ключ log(u) / вес, выборка без возвращения).
+    """
+    total = len(left_sampler.items) * len(right_sampler.items)
+    if exclude_self:
+        total -= len(set(left_sampler.items) & set(right_sampler.items))
+    count = min(count, total)
+    if count > total * DENSE_PAIRS_SHARE:
+        rnd = left_sampler.rnd
+        keys = (
+            (math.log(1 - rnd.random()) / (left_weight * right_weight),
+             left, right)
+            for left, left_weight in zip(left_sampler.items,
+                                         left_sampler.weights)
+            for right, right_weight in zip(right_sampler.items,
+                                           right_sampler.weights)
+            if not exclude_self or left != right
+        )
+        return sorted((left, right) for _, left, right in heapq.nlargest(
+            count, keys))
+    pairs = set()
+    while len(pairs) < count:
+        missing = count - len(pairs)
+        pairs.update(
+            pair for pair in zip(left_sampler.sample(missing),
+                                 right_sampler.sample(missing))
+            if not exclude_self or pair[0] != pair[1]
+        )
+    return sorted(pairs)
+
+
+def get_feed_rows(follow_pairs, recipes):
+    """Записи лент подписчиков, как после подписки (backfill_feed).
+
+    follow_pairs - пары (подписчик, автор), recipes - рецепты авторов.
+    Возвращает авторов, ленты которых подмешиваются при чтении (больше
+    FEED_FANOUT_MAX_FOLLOWERS подписчиков), и строки FeedItem
+    (user_id, recipe_id, author_id, pub_date) для остальных.
+    """
+    followers = Counter(author_pk for _, author_pk in follow_pairs)
+    pull_authors = {
+        author_pk for author_pk, count in followers.items()
+        if count > settings.FEED_FANOUT_MAX_FOLLOWERS}
+    latest = defaultdict(list)
+    for author_pk, recipe_pk, pub_date in recipes.order_by(
+            '-pub_date', '-pk').values_list('author_id', 'pk', 'pub_date'):
+        author_recipes = latest[author_pk]
+        if len(author_recipes) < settings.FEED_BACKFILL_LIMIT:
+            author_recipes.append((recipe_pk, pub_date))
+    rows = (
+        (user_pk, recipe_pk, author_pk, pub_date)
+        for user_pk, author_pk in follow_pairs
+        if author_pk not in pull_authors
+        for recipe_pk, pub_date in latest[author_pk]
+    )
+    return pull_authors, rows
+
+
+def generate(users, recipes, favorites=0, carts=0, follows=0, seed=0,
+             exponent=1.1, prefix='bench', batch_size=BATCH_SIZE,
+             log=lambda message: None):
+    """Создание пользователей, рецептов, избранного, списков, подписок
+    и лент подписок.
+
+    Возвращает список первичных ключей созданных пользователей.
+    """
+    rnd = random.Random(seed)
+    pattern = re.escape(prefix)
+    existing = (
+        User.objects.filter(username__regex=rf'^{pattern}[0-9]+$'),
+        Recipe.objects.filter(name__regex=rf'^{pattern} рецепт [0-9]+$'),
+    )
+    if any(queryset.exists() for queryset in existing):
+        # повторная вставка тех же имен нарушила бы уникальность
+        raise ValueError(
+            f'Данные с префиксом {prefix} уже созданы, укажите другой.')
+    ensure_reference_data()
+    images = create_placeholder_images()
+    tag_pks = list(Tag.objects.order_by('pk').values_list('pk', flat=True))
+    ingredient_pks = list(
+        Ingredient.objects.order_by('pk').values_list('pk', flat=True))
+    # популярность ингредиентов не должна зависеть от алфавита
+    rnd.shuffle(ingredient_pks)
+    ingredient_sampler = ZipfSampler(ingredient_pks, exponent, rnd)
+    tag_sampler = ZipfSampler(tag_pks, exponent, rnd)
+
+    with transaction.atomic():
+        # созданные записи отличаются от существующих по первичному ключу
+        last_user_pk = User.objects.aggregate(pk=Max('pk'))['pk'] or 0
+        last_recipe_pk = Recipe.objects.aggregate(pk=Max('pk'))['pk'] or 0
+        password = make_password(DEFAULT_PASSWORD)
+        insert_rows(
+            User,
+            ('username', 'email', 'first_name', 'last_name', 'password',
+             'is_staff', 'is_superuser', 'is_active', 'date_joined',
+             'feed_pull'),
+            ((f'{prefix}{number}', f'{prefix}{number}@foodgram.ru', 'Имя',
+              'Фамилия', password, False, False, True, timezone.now(), False)
+             for number in range(users)),
+            batch_size,
+        )
+        user_pks = list(User.objects.filter(
+            pk__gt=last_user_pk).order_by('pk').values_list('pk', flat=True))
+        log(f'Пользователей: {len(user_pks)}')
+
+        author_sampler = ZipfSampler(user_pks, exponent, rnd)
+        now = timezone.now()
+        with explicit_pub_date():
+            insert_rows(
+                Recipe,
+                ('author_id', 'name', 'text', 'image', 'cooking_time',
+                 'pub_date', 'updated_at', 'tags_mask', 'snapshot'),
+                # маска тегов и снимок заполняются после вставки связей
+                ((author_pk, f'{prefix} рецепт {number}', 'Описание рецепта',
+                  rnd.choice(images), rnd.randint(5, 120),
+                  now - RECIPES_PERIOD * rnd.random(), now, 0,
+                  empty_snapshot())
+                 for number, author_pk in enumerate(
+                     author_sampler.sample(recipes))),
+                batch_size,
+            )
+        recipes = Recipe.objects.filter(pk__gt=last_recipe_pk)
+        recipe_pks = list(recipes.order_by('pk').values_list('pk', flat=True))
+        log(f'Рецептов: {len(recipe_pks)}')
+
+        insert_rows(
+            IngredientRecipe, ('recipe_id', 'ingredient_id', 'amount'),
+            ((recipe_pk, ingredient_pk, rnd.randint(1, 500))
+             for recipe_pk in recipe_pks
+             for ingredient_pk in ingredient_sampler.sample_unique(
+                 round(rnd.triangular(3, 15, 7)))),
+            batch_size,
+        )
+        insert_rows(
+            TagRecipe, ('recipe_id', 'tag_id'),
+            ((recipe_pk, tag_pk)
+             for recipe_pk in recipe_pks
+             for tag_pk in tag_sampler.sample_unique(
+                 rnd.randint(1, len(tag_pks)))),
+            batch_size,
+        )
+        recipes.update_tags_mask()
+        recipes.refresh_snapshots()
+
+        # пользователи выбираются равномерно, рецепты и авторы - по Ципфу
+        user_sampler = ZipfSampler(user_pks, 0, rnd)
+        recipe_sampler = ZipfSampler(recipe_pks, exponent, rnd)
+        for model, count in ((Favorite, favorites), (ShoppingCart, carts)):
+            count = min(count, len(user_pks) * len(recipe_pks))
+            insert_rows(
+                model, ('user_id', 'recipe_id', 'created'),
+                ((user_pk, recipe_pk, now - INTERACTIONS_PERIOD * rnd.random())
+                 for user_pk, recipe_pk in generate_pairs(
+                     user_sampler, recipe_sampler, count)),
+                batch_size,
+            )
+            log(f'{model._meta.verbose_name_plural}: {count}')
+
+        count = min(follows, len(user_pks) * (len(user_pks) - 1))
+        follow_pairs = generate_pairs(user_sampler, author_sampler, count,
+                                      exclude_self=True)
+        insert_rows(Follow, ('user_id', 'following_id'), follow_pairs,
+                    batch_size)
+        log(f'Подписок: {count}')
+
+        pull_authors, feed_rows = get_feed_rows(follow_pairs, recipes)
+        User.objects.filter(pk__in=pull_authors).update(feed_pull=True)
+        insert_rows(
+            FeedItem, ('user_id', 'recipe_id', 'author_id', 'pub_date'),
+            feed_rows, batch_size)
+        log(f'Авторов с подмешиванием в ленты: {len(pull_authors)}')
+        # записи вставлены без сигналов моделей
+        bump_model_versions(User, Recipe)
+        bump_user_state(*user_pks)
+
+    return user_pks
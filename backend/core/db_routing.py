@@ -0,0 +1,135 @@
+"""Распределение читающих запросов API между репликами БД.
+
+Реплики перечисляются в settings.DATABASE_REPLICAS. Чтение с реплики
+включается ReplicaRoutingMiddleware только для безопасных запросов
+к вьюсетам DRF и только если автор запроса недавно ничего не изменял,
+чтобы он сразу видел результат своих действий (is_favorited и т.п.).
+Недавняя запись отмечается cookie PIN_COOKIE_NAME: состояние хранится
+у клиента и одинаково для всех процессов сервера. Если чтение с
+реплики завершилось ошибкой, middleware повторяет запрос с основной
+БД (ReplicaRouting.fall_back).
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+PIN_COOKIE_NAME = 'use_primary_db'
+
+_state = threading.local()
+# время, до которого реплика считается недоступной
+_unhealthy_until = {}
+
+
+class ReplicaRouting:
+    """Состояние маршрутизации чтения на время обработки запроса."""
+
+    def __init__(self):
+        self.enabled = False
+        self.alias = None
+        # изменяющий по методу запрос к представлению с read_only = True
+        self.read_only = False
+        # представление и его аргументы для повтора запроса
+        self.view = None
+
+    def enable(self):
+        self.enabled = True
+
+    def get_alias(self):
+        """Реплика выбирается один раз на запрос."""
+        if self.alias is None:
+            self.alias = choose_replica()
+        return self.alias
+
+    def fall_back(self):
+        """Переход на основную БД после ошибки чтения с реплики.
+
+        Возвращает False, если запрос и так читал с основной БД.
+        """
+        if self.alias in (None, DEFAULT_DB_ALIAS):
+            return False
+        mark_unhealthy(self.alias)
+        self.alias = DEFAULT_DB_ALIAS
+        return True
+
+
+@contextmanager
+def replica_routing():
+    """Блок, в котором чтение можно перевести на реплику."""
+    routing = ReplicaRouting()
+    _state.routing = routing
+    try:
+        yield routing
+    finally:
+        _state.routing = None
+
+
+def get_routing():
+    """Состояние маршрутизации текущего запроса или None."""
+    return getattr(_state, 'routing', None)
+
+
+def is_healthy(alias):
+    """Проверка доступности реплики с запоминанием неудачи."""
+    if _unhealthy_until.get(alias, 0) > time.monotonic():
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        mark_unhealthy(alias)
+        return False
+    return True
+
+
+def mark_unhealthy(alias):
+    retry_at = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+    _unhealthy_until[alias] = retry_at
+
+
+def choose_replica():
+    """Доступная реплика или основная БД, если доступных реплик нет."""
+    replicas = list(settings.DATABASE_REPLICAS)
+    random.shuffle(replicas)
+    for alias in replicas:
+        if is_healthy(alias):
+            return alias
+    return DEFAULT_DB_ALIAS
+
+
+def pin_to_primary(response):
+    """Чтение с основной БД в течение REPLICA_STICKY_SECONDS после записи."""
+    response.set_cookie(PIN_COOKIE_NAME, '1',
+                        max_age=settings.REPLICA_STICKY_SECONDS,
+                        httponly=True, samesite='Lax')
+
+
+def is_pinned_to_primary(request):
+    return PIN_COOKIE_NAME in request.COOKIES
+
+
+class ReplicaRouter:
+    """Чтение с выбранной на время запроса реплики, запись - в default."""
+
+    def db_for_read(self, model, **hints):
+        routing = get_routing()
+        if routing is None or not routing.enabled:
+            return None
+        # внутри транзакции читаются в том числе ее незафиксированные данные
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return routing.get_alias()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
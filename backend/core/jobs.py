@@ -0,0 +1,212 @@
+"""Очередь фоновых задач в таблице БД (модель Job).
+
+Функция, объявленная задачей через декоратор @job, получает метод
+delay(): вызов сохраняет задачу в таблицу, а выполняет ее команда
+run_worker. Задача сохраняется в той же транзакции, что и данные
+запроса, поэтому воркер не увидит задачу раньше данных, а при откате
+запроса задача пропадет вместе с ними.
+
+Воркер забирает задачи через SELECT ... FOR UPDATE SKIP LOCKED там,
+где БД это поддерживает (PostgreSQL), иначе (SQLite) полагается на
+условный UPDATE статуса: из конкурирующих потоков задачу получает
+только один. Тело задачи выполняется в транзакции вместе с удалением
+записи задачи. Ошибка откладывает повтор с экспоненциально растущей
+паузой, после max_attempts попыток задача остается в статусе failed.
+
+При settings.JOBS_EAGER задачи выполняются сразу при вызове delay()
+(для тестов и разработки без воркера).
+"""
+import json
+import threading
+import time
+import traceback
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .metrics import (JOB_DURATION, JOB_QUEUE_DELAY, JOBS_ENQUEUED,
+                      JOBS_PROCESSED)
+from .models import Job
+
+_registry = {}
+
+
+def job(func=None, *, max_attempts=None):
+    """Объявление функции фоновой задачей.
+
+    Аргументы задачи должны сериализоваться в JSON: передаются id
+    объектов, а не сами объекты.
+    """
+    if func is None:
+        return lambda func: job(func, max_attempts=max_attempts)
+    name = f'{func.__module__}.{func.__qualname__}'
+    _registry[name] = func
+
+    def delay(*args, **kwargs):
+        return enqueue(name, args, kwargs, max_attempts)
+
+    func.job_name = name
+    func.delay = delay
+    return func
+
+
+def get_job_function(name):
+    """Функция задачи по имени, модуль при необходимости импортируется.
+
+    Выполняются только функции, объявленные через @job.
+    """
+    if name not in _registry:
+        try:
+            import_module(name.rsplit('.', 1)[0])
+        except ImportError:
+            pass
+    try:
+        return _registry[name]
+    except KeyError:
+        raise LookupError(f'Неизвестная задача {name}')
+
+
+def enqueue(name, args=(), kwargs=None, max_attempts=None):
+    """Постановка задачи в очередь, возвращает запись Job.
+
+    В режиме JOBS_EAGER задача выполняется сразу (ошибки не
+    перехватываются), и возвращается None.
+    """
+    # аргументы проходят через JSON и в режиме JOBS_EAGER, чтобы
+    # несериализуемые аргументы обнаруживались и в тестах
+    args, kwargs = json.loads(json.dumps(
+        [list(args), kwargs or {}], cls=DjangoJSONEncoder))
+    if settings.JOBS_EAGER:
+        get_job_function(name)(*args, **kwargs)
+        return None
+    created = Job.objects.create(
+        name=name, args=args, kwargs=kwargs,
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS)
+    JOBS_ENQUEUED.labels(name).inc()
+    return created
+
+
+def get_retry_delay(attempts):
+    """Пауза перед следующей попыткой: удваивается с каждой попыткой."""
+    return timedelta(seconds=min(
+        settings.JOBS_RETRY_BACKOFF * 2 ** (attempts - 1),
+        settings.JOBS_RETRY_BACKOFF_MAX))
+
+
+def mark_running(claimed, now):
+    """Перевод задачи в статус running, False - если ее уже забрали."""
+    if not Job.objects.filter(
+        pk=claimed.pk, status=Job.STATUS_PENDING
+    ).update(status=Job.STATUS_RUNNING, started_at=now,
+             attempts=F('attempts') + 1):
+        return False
+    claimed.status = Job.STATUS_RUNNING
+    claimed.started_at = now
+    claimed.attempts += 1
+    return True
+
+
+def claim_job():
+    """Захват очередной готовой к выполнению задачи, None - если нет."""
+    while True:
+        now = timezone.now()
+        pending = Job.objects.filter(
+            status=Job.STATUS_PENDING, run_at__lte=now
+        ).order_by('run_at', 'pk')
+        if connection.features.has_select_for_update_skip_locked:
+            # задачи, захваченные другими воркерами, пропускаются без
+            # ожидания их транзакций
+            with transaction.atomic():
+                claimed = pending.select_for_update(skip_locked=True).first()
+                if claimed is not None:
+                    mark_running(claimed, now)
+                return claimed
+        # без блокировки строк (SQLite) задачу мог уже забрать другой
+        # поток: условный UPDATE выполнится только в одном из них
+        claimed = pending.first()
+        if claimed is None or mark_running(claimed, now):
+            return claimed
+
+
+def run_job(claimed):
+    """Выполнение захваченной задачи, True - если успешно."""
+    started = time.perf_counter()
+    JOB_QUEUE_DELAY.labels(claimed.name).observe(
+        max((claimed.started_at - claimed.run_at).total_seconds(), 0))
+    try:
+        with transaction.atomic():
+            get_job_function(claimed.name)(*claimed.args, **claimed.kwargs)
+            Job.objects.filter(pk=claimed.pk).delete()
+    except Exception:
+        error = traceback.format_exc()
+        if claimed.attempts < claimed.max_attempts:
+            status = 'retry'
+            Job.objects.filter(pk=claimed.pk).update(
+                status=Job.STATUS_PENDING, last_error=error,
+                run_at=timezone.now() + get_retry_delay(claimed.attempts))
+        else:
+            status = Job.STATUS_FAILED
+            Job.objects.filter(pk=claimed.pk).update(
+                status=Job.STATUS_FAILED, last_error=error)
+    else:
+        status = 'done'
+    JOB_DURATION.labels(claimed.name).observe(time.perf_counter() - started)
+    JOBS_PROCESSED.labels(claimed.name, status).inc()
+    return status == 'done'
+
+
+def requeue_stale_jobs():
+    """Возврат в очередь задач, чей воркер завершился во время работы.
+
+    Задача считается зависшей через JOBS_TIMEOUT секунд после начала
+    попытки; исчерпавшие попытки задачи переводятся в failed.
+    """
+    stale = Job.objects.filter(
+        status=Job.STATUS_RUNNING,
+        started_at__lt=timezone.now() - timedelta(
+            seconds=settings.JOBS_TIMEOUT))
+    stale.filter(attempts__lt=F('max_attempts')).update(
+        status=Job.STATUS_PENDING, last_error='Превышено время выполнения')
+    return stale.update(status=Job.STATUS_FAILED,
+                        last_error='Превышено время выполнения')
+
+
+def work(stop, burst=False, poll_interval=1.0):
+    """Цикл воркера, возвращает количество обработанных задач.
+
+    stop - threading.Event для остановки. В режиме burst цикл
+    завершается, как только готовых к выполнению задач не остается.
+    """
+    processed = 0
+    while not stop.is_set():
+        claimed = claim_job()
+        if claimed is None:
+            if burst:
+                break
+            requeue_stale_jobs()
+            stop.wait(poll_interval)
+            continue
+        run_job(claimed)
+        processed += 1
+    return processed
+
+
+class WorkerThread(threading.Thread):
+    """Поток воркера со своим соединением с БД."""
+
+    def __init__(self, stop, **options):
+        super().__init__(daemon=True)
+        self.stop = stop
+        self.options = options
+        self.processed = 0
+
+    def run(self):
+        try:
+            self.processed = work(self.stop, **self.options)
+        finally:
+            connection.close()
@@ -0,0 +1,170 @@
+import json
+import tempfile
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from benchmarks.runner import (BenchmarkContext, HTTPTransport,
+                               TestClientTransport, compare, run)
+from benchmarks.scenarios import get_scenarios
+from benchmarks.serialization import (run_normalized,
+                                      run_row_serialization,
+                                      run_serialization)
+from core.datagen import generate
+from recipes.trending import rebuild_trending
+
+User = get_user_model()
+
+FAVORITES_PER_USER = 10
+CARTS_PER_USER = 3
+FOLLOWS_PER_USER = 5
+
+
+class Command(BaseCommand):
+    help = 'Замер производительности горячих путей API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50,
+                            help='Количество пользователей в наборе данных')
+        parser.add_argument('--recipes', type=int, default=500,
+                            help='Количество рецептов в наборе данных')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--iterations', type=int, default=20,
+                            help='Количество итераций каждого сценария')
+        parser.add_argument('--warmup', type=int, default=1)
+        parser.add_argument('-s', '--scenario', action='append', default=[],
+                            help='Запускать только сценарии, имя которых '
+                                 'содержит подстроку')
+        parser.add_argument('--base-url',
+                            help='Адрес запущенного сервера, например '
+                                 'http://127.0.0.1:8000; по умолчанию '
+                                 'запросы идут через тестовый клиент')
+        parser.add_argument('--use-current-db', action='store_true',
+                            default=False,
+                            help='Не создавать временную тестовую БД')
+        parser.add_argument('--serialization', action='store_true',
+                            default=False,
+                            help='Сравнить время сериализации и объем '
+                                 'ответов разными рендерерами')
+        parser.add_argument('-o', '--output',
+                            help='Файл для сохранения результатов в JSON')
+        parser.add_argument('--baseline',
+                            help='Файл эталонных результатов для сравнения')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Допустимый рост p95 относительно эталона')
+
+    def handle(self, *args, **options):
+        # сервер работает с основной БД, поэтому данные создаются в ней
+        use_test_db = not (options['use_current_db'] or options['base_url'])
+        if options['serialization'] and options['base_url']:
+            raise CommandError('Сериализация замеряется только без '
+                               '--base-url')
+        if use_test_db:
+            old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True)
+        try:
+            results = self.run_benchmark(options)
+        finally:
+            if use_test_db:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.print_results(results)
+        if options['output']:
+            Path(options['output']).write_text(
+                json.dumps(results, indent=2, ensure_ascii=False),
+                encoding='utf-8')
+        if options['baseline']:
+            baseline = json.loads(
+                Path(options['baseline']).read_text(encoding='utf-8'))
+            regressions = compare(results, baseline, options['threshold'])
+            if regressions:
+                raise CommandError(
+                    'Регрессии относительно эталона:\n{}'.format(
+                        '\n'.join(regressions)))
+            self.stdout.write('Регрессий относительно эталона нет')
+
+    def run_benchmark(self, options):
+        users = options['users']
+        try:
+            user_pks = generate(users, options['recipes'],
+                                favorites=users * FAVORITES_PER_USER,
+                                carts=users * CARTS_PER_USER,
+                                follows=users * FOLLOWS_PER_USER,
+                                seed=options['seed'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        rebuild_trending()
+        user = User.objects.get(pk=user_pks[0])
+        context = BenchmarkContext(user)
+
+        scenarios = [
+            scenario for scenario in get_scenarios()
+            if not options['scenario'] or any(
+                name in scenario.name for name in options['scenario'])
+        ]
+        if options['base_url']:
+            return run(HTTPTransport(options['base_url']), scenarios,
+                       context, options['iterations'], options['warmup'])
+
+        # картинки создаваемых рецептов не попадают в MEDIA_ROOT
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                results = run(TestClientTransport(), scenarios, context,
+                              options['iterations'], options['warmup'])
+        if options['serialization']:
+            results['serialization'] = run_serialization(
+                context.token, options['iterations'])
+            results['row_serialization'] = run_row_serialization(
+                user, options['iterations'])
+            results['normalized'] = run_normalized(
+                context.token, options['iterations'])
+        return results
+
+    def print_results(self, results):
+        self.stdout.write(
+            f'{"сценарий":<60}{"p50":>9}{"p95":>9}{"p99":>9}'
+            f'{"rps":>9}{"SQL":>7}'
+        )
+        for name, result in results['scenarios'].items():
+            queries = result['queries_per_request']
+            self.stdout.write(
+                f'{name:<60}{result["p50_ms"]:>9.2f}{result["p95_ms"]:>9.2f}'
+                f'{result["p99_ms"]:>9.2f}{result["rps"]:>9.1f}'
+                f'{"-" if queries is None else f"{queries:.1f}":>7}'
+            )
+        self.stdout.write(f'Пиковый RSS: {results["peak_rss_mb"]:.1f} Мб')
+        if 'serialization' not in results:
+            return
+        self.stdout.write(
+            f'\n{"ответ[рендерер]":<40}{"p50":>9}{"p95":>9}'
+            f'{"байт":>10}{"gzip":>10}{"br":>10}'
+        )
+        for name, result in results['serialization'].items():
+            self.stdout.write(
+                f'{name:<40}{result["p50_ms"]:>9.2f}{result["p95_ms"]:>9.2f}'
+                f'{result["bytes"]:>10}{result["gzip_bytes"]:>10}'
+                f'{result["br_bytes"]:>10}'
+            )
+        self.stdout.write(
+            f'\n{"ответ[сборка]":<40}{"строк":>7}'
+            f'{"p50, мкс/строка":>17}{"p95, мкс/строка":>17}'
+        )
+        for name, result in results['row_serialization'].items():
+            self.stdout.write(
+                f'{name:<40}{result["rows"]:>7}'
+                f'{result["p50_us_per_row"]:>17.1f}'
+                f'{result["p95_us_per_row"]:>17.1f}'
+            )
+        self.stdout.write(
+            f'\n{"ответ[представление]":<40}{"строк":>7}{"p50":>9}'
+            f'{"p95":>9}{"байт":>10}{"gzip":>10}{"br":>10}'
+        )
+        for name, result in results['normalized'].items():
+            self.stdout.write(
+                f'{name:<40}{result["rows"]:>7}{result["p50_ms"]:>9.2f}'
+                f'{result["p95_ms"]:>9.2f}{result["bytes"]:>10}'
+                f'{result["gzip_bytes"]:>10}{result["br_bytes"]:>10}'
+            )
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.pantry import build_index
+
+
+class Command(BaseCommand):
+    help = ('Пересборка индекса поиска рецептов по ингредиентам '
+            '(/api/recipes/pantry/)')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = build_index()
+        self.stdout.write(
+            f'Рецептов в индексе: {count}, '
+            f'сборка за {time.perf_counter() - start:.1f} с')
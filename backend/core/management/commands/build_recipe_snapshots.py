@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import SNAPSHOT_BATCH_SIZE, Recipe
+
+
+class Command(BaseCommand):
+    help = ('Пересборка снимков тегов и ингредиентов рецептов '
+            '(Recipe.snapshot) по таблицам связей')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить снимки, ошибка при расхождениях')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options['check']:
+            stale = Recipe.objects.stale_snapshots()
+            if stale:
+                raise CommandError(
+                    f'Снимки расходятся со связями у {len(stale)} '
+                    f'рецептов: {", ".join(map(str, stale[:20]))}')
+            self.stdout.write(
+                f'Снимки совпадают, проверка за '
+                f'{time.perf_counter() - start:.1f} с')
+            return
+        pks = list(Recipe.objects.order_by('pk').values_list('pk', flat=True))
+        count = 0
+        for batch in range(0, len(pks), SNAPSHOT_BATCH_SIZE):
+            with transaction.atomic():
+                count += Recipe.objects.filter(
+                    pk__in=pks[batch:batch + SNAPSHOT_BATCH_SIZE]
+                ).refresh_snapshots()
+        self.stdout.write(
+            f'Пересобрано снимков: {count} за '
+            f'{time.perf_counter() - start:.1f} с')
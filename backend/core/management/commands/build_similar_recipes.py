@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import rebuild_similar
+
+
+class Command(BaseCommand):
+    help = ('Полный пересчет похожих рецептов '
+            '(/api/recipes/{id}/similar/)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            help='Рецептов в пачке (по умолчанию - по '
+                                 'размеру плотного блока сходств)')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = rebuild_similar(options['batch_size'])
+        self.stdout.write(
+            f'Записей о похожих рецептах: {count}, '
+            f'пересчет за {time.perf_counter() - start:.1f} с')
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.changes import compact_changes
+
+
+class Command(BaseCommand):
+    help = ('Сжатие журнала изменений (/api/changes/): удаление '
+            'перекрытых и устаревших записей')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        deleted = compact_changes()
+        self.stdout.write(
+            f'Удалено записей журнала: {deleted}, '
+            f'сжатие за {time.perf_counter() - start:.1f} с')
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.trending import rebuild_trending
+
+
+class Command(BaseCommand):
+    help = ('Пересчет рейтинга популярных рецептов '
+            '(/api/recipes/?ordering=trending)')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = rebuild_trending()
+        self.stdout.write(
+            f'Рецептов в рейтинге: {count}, '
+            f'пересчет за {time.perf_counter() - start:.1f} с')
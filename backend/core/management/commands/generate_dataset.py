@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.datagen import BATCH_SIZE, generate
+
+
+class Command(BaseCommand):
+    help = ('Генерация синтетического набора данных: пользователи, рецепты, '
+            'избранное, списки покупок и подписки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--favorites', type=int, default=100000)
+        parser.add_argument('--carts', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Зерно генератора случайных чисел')
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='Показатель распределения Ципфа')
+        parser.add_argument('--prefix', default='gen',
+                            help='Префикс имен пользователей и рецептов')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            generate(
+                options['users'], options['recipes'],
+                favorites=options['favorites'], carts=options['carts'],
+                follows=options['follows'], seed=options['seed'],
+                exponent=options['zipf'], prefix=options['prefix'],
+                batch_size=options['batch_size'], log=self.stdout.write,
+            )
+        except ValueError as exc:
+            raise CommandError(exc)
+        self.stdout.write(
+            f'Набор данных создан за {time.perf_counter() - start:.1f} с')
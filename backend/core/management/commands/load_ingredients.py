@@ -3,6 +3,7 @@ import csv
 from pathlib import Path
 from django.core.management.base import BaseCommand
 from django.db import IntegrityError
+from recipes.catalogue import build_catalogue
 from recipes.models import Ingredient
 
 DIR_DATA = Path(__file__).resolve().parent.parent.parent.parent.parent / 'data'
@@ -39,6 +40,8 @@ class Command(BaseCommand):
             if kwargs.get('erase'):
                 model.objects.all().delete()
             self.load_obj(filename, model, fields)
+        snapshot = build_catalogue()
+        self.stdout.write(f'Снимок каталога ингредиентов: {snapshot.url}')
 
     def add_arguments(self, parser):
         parser.add_argument(
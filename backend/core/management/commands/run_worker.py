@@ -0,0 +1,65 @@
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from prometheus_client import start_http_server
+
+from core.jobs import WorkerThread, work
+
+
+class Command(BaseCommand):
+    help = 'Выполнение фоновых задач из очереди (core.jobs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Количество потоков, выполняющих задачи')
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Пауза в секундах между проверками пустой очереди')
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Выполнить готовые задачи и завершиться')
+        parser.add_argument(
+            '--metrics-port', type=int, default=0,
+            help='Порт для выдачи метрик Prometheus воркера')
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        if concurrency < 1:
+            raise CommandError('--concurrency должно быть положительным')
+        if concurrency > 1 and (
+                not connection.features.has_select_for_update_skip_locked):
+            self.stderr.write(
+                'БД без SELECT ... FOR UPDATE SKIP LOCKED: параллельные '
+                'задачи будут конфликтовать и уходить на повтор')
+        if options['metrics_port']:
+            start_http_server(options['metrics_port'])
+
+        stop = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                # текущие задачи дорабатывают, новые не берутся
+                signal.signal(signum, lambda *args: stop.set())
+
+        worker_options = {'burst': options['burst'],
+                          'poll_interval': options['poll_interval']}
+        start = time.perf_counter()
+        if concurrency == 1:
+            processed = work(stop, **worker_options)
+        else:
+            threads = [WorkerThread(stop, **worker_options)
+                       for _ in range(concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                # join с таймаутом не мешает обработке сигналов
+                while thread.is_alive():
+                    thread.join(0.5)
+            processed = sum(thread.processed for thread in threads)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'Обработано задач: {processed} за {elapsed:.1f} с '
+            f'({processed / elapsed:.1f} в секунду)')
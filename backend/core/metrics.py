@@ -0,0 +1,86 @@
+"""Метрики приложения в формате Prometheus.
+
+При запуске под gunicorn с несколькими воркерами метрики агрегируются
+через файлы в каталоге из переменной окружения PROMETHEUS_MULTIPROC_DIR
+(см. gunicorn.conf.py), иначе используется реестр текущего процесса.
+"""
+import os
+
+from prometheus_client import (REGISTRY, CollectorRegistry, Counter,
+                               Histogram, generate_latest, multiprocess)
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233)
+
+REQUEST_LATENCY = Histogram(
+    'foodgram_request_duration_seconds',
+    'Время обработки запроса',
+    ('view', 'method'),
+)
+REQUEST_COUNT = Counter(
+    'foodgram_requests_total',
+    'Количество обработанных запросов',
+    ('view', 'method', 'status'),
+)
+DB_QUERY_COUNT = Histogram(
+    'foodgram_db_queries_per_request',
+    'Количество SQL-запросов за один запрос',
+    ('view',),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+DB_QUERY_DURATION = Histogram(
+    'foodgram_db_duration_seconds',
+    'Суммарное время SQL-запросов за один запрос',
+    ('view',),
+)
+CACHE_HITS = Counter(
+    'foodgram_cache_hits_total',
+    'Попадания в кэш',
+    ('cache',),
+)
+CACHE_MISSES = Counter(
+    'foodgram_cache_misses_total',
+    'Промахи кэша',
+    ('cache',),
+)
+JOBS_ENQUEUED = Counter(
+    'foodgram_jobs_enqueued_total',
+    'Поставлено фоновых задач в очередь',
+    ('job',),
+)
+JOBS_PROCESSED = Counter(
+    'foodgram_jobs_processed_total',
+    'Обработано фоновых задач: done, retry (будет повтор) или failed',
+    ('job', 'status'),
+)
+JOB_DURATION = Histogram(
+    'foodgram_job_duration_seconds',
+    'Время выполнения фоновой задачи',
+    ('job',),
+)
+JOB_QUEUE_DELAY = Histogram(
+    'foodgram_job_queue_delay_seconds',
+    'Ожидание фоновой задачи в очереди после назначенного времени',
+    ('job',),
+)
+
+
+def record_cache_access(cache_name, hit):
+    """Учет обращения к кэшу с именем cache_name."""
+    if hit:
+        CACHE_HITS.labels(cache_name).inc()
+    else:
+        CACHE_MISSES.labels(cache_name).inc()
+
+
+def get_registry():
+    """Реестр метрик: общий для всех воркеров или текущего процесса."""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render_metrics():
+    """Выгрузка метрик в текстовом формате Prometheus."""
+    return generate_latest(get_registry())
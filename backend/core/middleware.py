@@ -0,0 +1,263 @@
+import re
+import time
+from contextlib import ExitStack
+
+import brotli
+from django.conf import settings
+from django.db import OperationalError, connections
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from .db_routing import (is_pinned_to_primary, pin_to_primary,
+                         replica_routing)
+from .metrics import (DB_QUERY_COUNT, DB_QUERY_DURATION, REQUEST_COUNT,
+                      REQUEST_LATENCY)
+from .models import RequestProfile
+from .profiling import SQLRecorder, get_profiler, save_profile
+
+UNMATCHED_VIEW_NAME = 'unmatched'
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = '_profile'
+# типы содержимого, которые имеет смысл сжимать
+COMPRESSIBLE_CONTENT_TYPES = ('text/', 'application/json',
+                              'application/msgpack')
+# средний уровень: максимальный (11) слишком медленный для ответов API
+BROTLI_QUALITY = 5
+
+
+def get_view_name(view_func, method):
+    """Имя представления для метки метрик.
+
+    Для вьюсетов DRF имя имеет вид RecipeViewSet.list,
+    RecipeViewSet.to_favorite_add_delete и т.п.
+    """
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+
+    actions = getattr(view_func, 'actions', None)
+    if actions:
+        action = actions.get(method.lower(), method.lower())
+        return f'{view_class.__name__}.{action}'
+    return view_class.__name__
+
+
+class QueryCounter:
+    """Обертка execute_wrapper для подсчета SQL-запросов и их времени."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """Сбор метрик длительности запросов, статусов ответов и нагрузки на БД."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        queries = QueryCounter()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        view_name = getattr(request, 'metrics_view_name', UNMATCHED_VIEW_NAME)
+        REQUEST_LATENCY.labels(view_name, request.method).observe(duration)
+        REQUEST_COUNT.labels(
+            view_name, request.method, response.status_code).inc()
+        DB_QUERY_COUNT.labels(view_name).observe(queries.count)
+        DB_QUERY_DURATION.labels(view_name).observe(queries.duration)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view_name = get_view_name(view_func, request.method)
+
+
+class ProfilingMiddleware:
+    """Профилирование запроса по заголовку X-Profile или параметру _profile.
+
+    Доступно только staff-пользователям, остальные запросы
+    обрабатываются без каких-либо дополнительных действий.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = self.get_profiling_mode(request)
+        if mode is None:
+            return self.get_response(request)
+
+        profiler = get_profiler(mode)
+        sql_recorder = SQLRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(sql_recorder))
+            profiler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.stop()
+        duration = time.perf_counter() - start
+
+        profile = save_profile(request, response, mode, duration,
+                               profiler, sql_recorder)
+        response['X-Profile-Id'] = profile.pk
+        return response
+
+    def get_profiling_mode(self, request):
+        mode = request.META.get(PROFILE_HEADER)
+        if mode is None:
+            # разбор строки запроса только при наличии в ней параметра
+            if PROFILE_PARAM not in request.META.get('QUERY_STRING', ''):
+                return None
+            mode = request.GET.get(PROFILE_PARAM)
+            if mode is None:
+                return None
+
+        user = self.get_staff_user(request)
+        if user is None:
+            return None
+        request.profiling_user = user
+
+        if mode == RequestProfile.MODE_CPROFILE:
+            return RequestProfile.MODE_CPROFILE
+        return RequestProfile.MODE_SAMPLE
+
+    def get_staff_user(self, request):
+        """Пользователь из сессии или из токена, если он staff."""
+        user = request.user
+        if not user.is_authenticated:
+            try:
+                user_auth_tuple = TokenAuthentication().authenticate(request)
+            except AuthenticationFailed:
+                return None
+            if user_auth_tuple is None:
+                return None
+            user, _ = user_auth_tuple
+        return user if user.is_staff else None
+
+
+class ReplicaRoutingMiddleware:
+    """Чтение с реплик для безопасных запросов к вьюсетам DRF.
+
+    После успешного изменяющего запроса автор запроса на время
+    REPLICA_STICKY_SECONDS читает только с основной БД. POST-запросы
+    к представлениям с атрибутом read_only = True (пакетные GET-запросы)
+    считаются безопасными. При OperationalError во время чтения с
+    реплики представление выполняется повторно с основной БД.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        with replica_routing() as routing:
+            request.replica_routing = routing
+            response = self.get_response(request)
+        if request.method not in SAFE_METHODS and not routing.read_only:
+            if response.status_code < 400:
+                pin_to_primary(response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        routing = getattr(request, 'replica_routing', None)
+        view_class = getattr(view_func, 'cls', None)
+        if routing is None or view_class is None:
+            return
+        if request.method not in SAFE_METHODS:
+            if not getattr(view_class, 'read_only', False):
+                return
+            routing.read_only = True
+            # тело читается заранее, чтобы его можно было разобрать
+            # повторно при переходе на основную БД
+            request.body
+        if not is_pinned_to_primary(request):
+            routing.view = (view_func, view_args, view_kwargs)
+            routing.enable()
+
+    def process_exception(self, request, exception):
+        routing = getattr(request, 'replica_routing', None)
+        if routing is None or not isinstance(exception, OperationalError):
+            return None
+        if not routing.fall_back():
+            return None
+        view_func, view_args, view_kwargs = routing.view
+        return view_func(request, *view_args, **view_kwargs)
+
+
+def get_accepted_encodings(header):
+    """Кодировки из Accept-Encoding, кроме явно запрещенных (q=0)."""
+    encodings = set()
+    for item in header.split(','):
+        encoding, _, params = item.partition(';')
+        quality = re.search(r'q=([0-9.]+)', params)
+        if quality is None or float(quality[1]) > 0:
+            encodings.add(encoding.strip().lower())
+    return encodings
+
+
+class CompressionMiddleware:
+    """Сжатие ответов brotli или gzip по заголовку Accept-Encoding.
+
+    Сжимаются ответы не короче COMPRESSION_MIN_SIZE байт: на маленьких
+    ответах сжатие почти не уменьшает объем, но тратит процессор.
+    Brotli выбирается, если клиент его принимает.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        content_type = response.get('Content-Type', '')
+        if response.streaming or response.has_header('Content-Encoding') or (
+                not content_type.startswith(COMPRESSIBLE_CONTENT_TYPES)):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        encodings = get_accepted_encodings(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if 'br' in encodings:
+            encoding = 'br'
+            content = brotli.compress(response.content,
+                                      quality=BROTLI_QUALITY)
+        elif 'gzip' in encodings:
+            encoding = 'gzip'
+            content = compress_string(response.content)
+        else:
+            return response
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        # сжатое представление не совпадает побайтно с исходным
+        if response.has_header('ETag'):
+            response['ETag'] = re.sub(r'^"', 'W/"', response['ETag'])
+        response['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,38 @@
+# Generated by Django 3.2 on 2026-10-19 10:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата')),
+                ('method', models.CharField(max_length=10, verbose_name='Метод')),
+                ('path', models.CharField(max_length=2048, verbose_name='Адрес')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='Статус ответа')),
+                ('duration', models.FloatField(verbose_name='Длительность, с')),
+                ('query_count', models.PositiveIntegerField(verbose_name='Количество SQL-запросов')),
+                ('mode', models.CharField(choices=[('sample', 'Сэмплирование стеков'), ('cprofile', 'cProfile')], max_length=10, verbose_name='Профилировщик')),
+                ('profile_file', models.CharField(max_length=255, verbose_name='Файл профиля')),
+                ('sql_file', models.CharField(max_length=255, verbose_name='Файл SQL-запросов')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'профиль запроса',
+                'verbose_name_plural': 'Профили запросов',
+                'ordering': ('-created',),
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2 on 2026-10-19 11:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Version',
+            fields=[
+                ('key', models.CharField(max_length=150, primary_key=True, serialize=False, verbose_name='Ключ')),
+                ('value', models.BigIntegerField(default=0, verbose_name='Версия')),
+            ],
+            options={
+                'verbose_name': 'версия данных',
+                'verbose_name_plural': 'Версии данных',
+            },
+        ),
+    ]
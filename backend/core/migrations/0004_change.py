@@ -0,0 +1,36 @@
+# Generated by Django 3.2 on 2026-10-19 11:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0003_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('recipe', 'Рецепт'), ('tag', 'Тег'), ('ingredient', 'Ингредиент'), ('favorite', 'Избранное'), ('shopping_cart', 'Список покупок'), ('follow', 'Подписка')], max_length=20, verbose_name='Тип объекта')),
+                ('object_id', models.BigIntegerField(verbose_name='Id объекта')),
+                ('op', models.CharField(choices=[('upsert', 'Создание или изменение'), ('delete', 'Удаление')], max_length=10, verbose_name='Операция')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'изменение',
+                'verbose_name_plural': 'Журнал изменений',
+                'ordering': ('pk',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['kind', 'object_id'], name='core_change_kind_8e9fca_idx'),
+        ),
+    ]
@@ -0,0 +1,138 @@
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+class RequestProfile(models.Model):
+    """Модель снятого профиля запроса.
+
+    Сами данные профиля хранятся в файлах каталога PROFILES_DIR,
+    в модели - только описание запроса и имена файлов.
+    """
+
+    MODE_SAMPLE = 'sample'
+    MODE_CPROFILE = 'cprofile'
+    MODE_CHOICES = (
+        (MODE_SAMPLE, 'Сэмплирование стеков'),
+        (MODE_CPROFILE, 'cProfile'),
+    )
+
+    created = models.DateTimeField('Дата', auto_now_add=True, db_index=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True,
+        verbose_name='Пользователь')
+    method = models.CharField('Метод', max_length=10)
+    path = models.CharField('Адрес', max_length=2048)
+    status_code = models.PositiveSmallIntegerField('Статус ответа')
+    duration = models.FloatField('Длительность, с')
+    query_count = models.PositiveIntegerField('Количество SQL-запросов')
+    mode = models.CharField('Профилировщик', max_length=10,
+                            choices=MODE_CHOICES)
+    profile_file = models.CharField('Файл профиля', max_length=255)
+    sql_file = models.CharField('Файл SQL-запросов', max_length=255)
+
+    class Meta:
+        verbose_name = 'профиль запроса'
+        verbose_name_plural = 'Профили запросов'
+        ordering = ('-created',)
+
+    def __str__(self):
+        return f'{self.method} {self.path}'
+
+
+class Version(models.Model):
+    """Счетчик версии данных, см. core.versions."""
+
+    key = models.CharField('Ключ', max_length=150, primary_key=True)
+    value = models.BigIntegerField('Версия', default=0)
+
+    class Meta:
+        verbose_name = 'версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.key}: {self.value}'
+
+
+class Job(models.Model):
+    """Фоновая задача, см. core.jobs.
+
+    Выполненные задачи удаляются, в таблице остаются ожидающие,
+    выполняемые и окончательно завершившиеся ошибкой.
+    """
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Ожидает'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField('Задача', max_length=255)
+    args = models.JSONField('Аргументы', default=list)
+    kwargs = models.JSONField('Именованные аргументы', default=dict)
+    status = models.CharField('Статус', max_length=10,
+                              choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveSmallIntegerField('Максимум попыток')
+    run_at = models.DateTimeField('Запуск не раньше', default=timezone.now)
+    created = models.DateTimeField('Дата', auto_now_add=True)
+    started_at = models.DateTimeField('Начало попытки', null=True,
+                                      blank=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+
+    class Meta:
+        verbose_name = 'фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        ordering = ('run_at', 'pk')
+        indexes = (models.Index(fields=('status', 'run_at')),)
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
+
+
+class Change(models.Model):
+    """Запись журнала изменений, см. core.changes."""
+
+    KIND_RECIPE = 'recipe'
+    KIND_TAG = 'tag'
+    KIND_INGREDIENT = 'ingredient'
+    KIND_FAVORITE = 'favorite'
+    KIND_SHOPPING_CART = 'shopping_cart'
+    KIND_FOLLOW = 'follow'
+    KIND_CHOICES = (
+        (KIND_RECIPE, 'Рецепт'),
+        (KIND_TAG, 'Тег'),
+        (KIND_INGREDIENT, 'Ингредиент'),
+        (KIND_FAVORITE, 'Избранное'),
+        (KIND_SHOPPING_CART, 'Список покупок'),
+        (KIND_FOLLOW, 'Подписка'),
+    )
+    OP_UPSERT = 'upsert'
+    OP_DELETE = 'delete'
+    OP_CHOICES = (
+        (OP_UPSERT, 'Создание или изменение'),
+        (OP_DELETE, 'Удаление'),
+    )
+
+    kind = models.CharField('Тип объекта', max_length=20,
+                            choices=KIND_CHOICES)
+    object_id = models.BigIntegerField('Id объекта')
+    op = models.CharField('Операция', max_length=10, choices=OP_CHOICES)
+    # изменения избранного, списка покупок и подписок видны только
+    # их владельцу
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True,
+        blank=True, related_name='+', verbose_name='Пользователь')
+    created = models.DateTimeField('Дата', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'изменение'
+        verbose_name_plural = 'Журнал изменений'
+        ordering = ('pk',)
+        indexes = (models.Index(fields=('kind', 'object_id')),)
+
+    def __str__(self):
+        return f'{self.kind} {self.object_id}: {self.op}'
@@ -0,0 +1,145 @@
+"""Профилирование отдельных запросов по требованию администратора.
+
+Профиль снимается только для запросов staff-пользователей, передавших
+заголовок X-Profile или параметр _profile со значением sample (по умолчанию)
+или cprofile. Результат - свернутые стеки (формат flamegraph.pl/speedscope)
+или текстовый отчет cProfile и список выполненных SQL-запросов.
+"""
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+
+from .models import RequestProfile
+
+
+class SamplingProfiler:
+    """Сэмплирующий профилировщик стека одного потока."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self._thread_id = None
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._sampler.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._sampler.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} '
+                             f'({code.co_filename}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def report(self):
+        """Свернутые стеки: по строке 'кадр;кадр;кадр количество'."""
+        return ''.join(
+            f'{stack} {count}\n' for stack, count in self.stacks.items()
+        )
+
+
+class CProfileProfiler:
+    """Обертка над cProfile с тем же интерфейсом."""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def report(self):
+        stream = io.StringIO()
+        pstats.Stats(self.profile, stream=stream).sort_stats(
+            'cumulative').print_stats()
+        return stream.getvalue()
+
+
+class SQLRecorder:
+    """Обертка execute_wrapper, запоминающая SQL-запросы и их время."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((time.perf_counter() - start, sql, params))
+
+    def report(self):
+        return ''.join(
+            f'{duration * 1000:.3f} ms\t{sql}\t{params!r}\n'
+            for duration, sql, params in self.queries
+        )
+
+
+def get_profiler(mode):
+    if mode == RequestProfile.MODE_CPROFILE:
+        return CProfileProfiler()
+    return SamplingProfiler(settings.PROFILING_SAMPLE_INTERVAL)
+
+
+def get_profiles_dir():
+    profiles_dir = Path(settings.PROFILES_DIR)
+    profiles_dir.mkdir(parents=True, exist_ok=True)
+    return profiles_dir
+
+
+def save_profile(request, response, mode, duration, profiler, sql_recorder):
+    """Сохранение профиля на диск и удаление устаревших профилей."""
+    profiles_dir = get_profiles_dir()
+    name = uuid.uuid4().hex
+    suffix = 'collapsed' if mode == RequestProfile.MODE_SAMPLE else 'pstats'
+    profile_file = f'{name}.{suffix}.txt'
+    sql_file = f'{name}.sql.txt'
+    (profiles_dir / profile_file).write_text(profiler.report(),
+                                             encoding='utf-8')
+    (profiles_dir / sql_file).write_text(sql_recorder.report(),
+                                         encoding='utf-8')
+
+    profile = RequestProfile.objects.create(
+        user=request.profiling_user,
+        method=request.method,
+        path=request.get_full_path()[:2048],
+        status_code=response.status_code,
+        duration=duration,
+        query_count=len(sql_recorder.queries),
+        mode=mode,
+        profile_file=profile_file,
+        sql_file=sql_file,
+    )
+    delete_old_profiles()
+    return profile
+
+
+def delete_old_profiles():
+    """Хранение не более PROFILES_MAX_COUNT последних профилей."""
+    outdated = RequestProfile.objects.all()[settings.PROFILES_MAX_COUNT:]
+    profiles_dir = get_profiles_dir()
+    for profile in outdated:
+        for filename in (profile.profile_file, profile.sql_file):
+            (profiles_dir / filename).unlink(missing_ok=True)
+        profile.delete()
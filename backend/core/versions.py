@@ -0,0 +1,68 @@
+"""Счетчики версий данных для условных GET-запросов (ETag).
+
+Версия модели увеличивается при каждом изменении ее записей, версия
+состояния пользователя - при изменении его избранного, списка покупок
+и подписок. ETag ответа строится из версий данных, от которых ответ
+зависит, поэтому для проверки If-None-Match достаточно одного запроса
+к таблице версий. Значения только растут и не повторяются и
+увеличиваются после фиксации транзакции, изменившей данные.
+"""
+from django.db import transaction
+from django.db.models import F, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Version
+
+
+def get_model_key(model):
+    return model._meta.label_lower
+
+
+def get_user_state_key(user_id):
+    return f'user-state:{user_id}'
+
+
+def increment_versions(keys):
+    updated = Version.objects.filter(key__in=keys).update(
+        value=F('value') + 1)
+    if updated < len(keys):
+        # первое изменение: счетчика еще нет
+        Version.objects.bulk_create(
+            (Version(key=key, value=1) for key in keys),
+            ignore_conflicts=True)
+
+
+def bump_versions(*keys):
+    """Увеличение версий keys после фиксации текущей транзакции.
+
+    Строка счетчика модели общая для всех ее изменений: обновление
+    внутри транзакции блокировало бы ее до конца транзакции, и все
+    изменяющие запросы выполнялись бы по очереди. После фиксации
+    обновление выполняется в автокоммите и блокирует строку на время
+    одного UPDATE. Версия меняется не раньше данных: ответ, прочитанный
+    между фиксацией и обновлением, получает старый ETag и будет
+    перечитан клиентом после обновления.
+    """
+    keys = set(keys)
+    transaction.on_commit(lambda: increment_versions(keys))
+
+
+def bump_model_versions(*models):
+    bump_versions(*map(get_model_key, models))
+
+
+def bump_user_state(*user_ids):
+    bump_versions(*map(get_user_state_key, user_ids))
+
+
+def get_versions(keys):
+    """Значения версий в порядке keys, отсутствующие - 0."""
+    versions = dict(Version.objects.filter(key__in=keys).values_list(
+        'key', 'value'))
+    return [versions.get(key, 0) for key in keys]
+
+
+def get_version_subquery(key):
+    """Версия для аннотации запроса: ETag объекта за один запрос."""
+    return Coalesce(Subquery(Version.objects.filter(key=key).values('value')),
+                    0)
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from .metrics import render_metrics
+
+
+def metrics_view(request):
+    """Выдача метрик для сборщика Prometheus.
+
+    Сборщик передает METRICS_TOKEN в заголовке Authorization: Bearer
+    <token>. Без заданного METRICS_TOKEN метрики не выдаются: адрес
+    /api/metrics доступен снаружи через nginx.
+    """
+    token = settings.METRICS_TOKEN
+    if not token or (
+            request.headers.get('Authorization') != f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
@@ -41,6 +41,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.CompressionMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -85,6 +89,74 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения: хосты через запятую, остальные параметры как у default
+DATABASE_REPLICAS = []
+for number, host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(','))):
+    alias = f'replica_{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.db_routing.ReplicaRouter']
+# сколько секунд после записи пользователь читает только с основной БД
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+# через сколько секунд повторно проверять недоступную реплику
+REPLICA_RETRY_SECONDS = int(os.getenv('REPLICA_RETRY_SECONDS', 30))
+
+# Лента подписок: рецепты авторов с большим числом подписчиков
+# подмешиваются в ленту при чтении вместо раскладки по лентам
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 1000))
+# число последних рецептов автора, добавляемых в ленту при подписке
+FEED_BACKFILL_LIMIT = int(os.getenv('FEED_BACKFILL_LIMIT', 50))
+
+# Рейтинг популярных рецептов (команда compute_trending)
+TRENDING_WINDOW_DAYS = int(os.getenv('TRENDING_WINDOW_DAYS', 7))
+TRENDING_HALF_LIFE_HOURS = float(os.getenv('TRENDING_HALF_LIFE_HOURS', 48))
+TRENDING_SIZE = int(os.getenv('TRENDING_SIZE', 1000))
+
+# Количество похожих рецептов (команда build_similar_recipes)
+SIMILAR_RECIPES_COUNT = int(os.getenv('SIMILAR_RECIPES_COUNT', 10))
+
+# Каталог индекса поиска рецептов по ингредиентам (общий для воркеров)
+PANTRY_INDEX_DIR = os.getenv('PANTRY_INDEX_DIR', BASE_DIR / 'pantry_index')
+# Больше стольких измененных после сборки индекса рецептов поиск не
+# пересчитывает по БД, а ставит в очередь пересборку индекса
+PANTRY_REBUILD_THRESHOLD = int(os.getenv('PANTRY_REBUILD_THRESHOLD', 500))
+# Максимум ингредиентов в одном запросе /api/recipes/pantry/
+PANTRY_INGREDIENTS_MAX = int(os.getenv('PANTRY_INGREDIENTS_MAX', 100))
+
+# Ответы короче этого размера (в байтах) не сжимаются
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+
+# Максимум id рецептов в одном запросе /api/recipes/?ids=
+RECIPES_IDS_MAX = int(os.getenv('RECIPES_IDS_MAX', 100))
+
+# Вывод рецептов и подписок через api.fast_serializers вместо
+# сериализаторов DRF (вывод совпадает)
+FAST_SERIALIZERS = os.getenv('FAST_SERIALIZERS', 'True') == 'True'
+
+# Количество записей в ответах со страницами: срок кэширования в
+# секундах и порог, начиная с которого берется оценка планировщика
+# PostgreSQL вместо COUNT(*)
+PAGINATION_COUNT_CACHE_TIMEOUT = int(
+    os.getenv('PAGINATION_COUNT_CACHE_TIMEOUT', 60))
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = int(
+    os.getenv('PAGINATION_COUNT_ESTIMATE_THRESHOLD', 100000))
+
+# Максимум подзапросов в одном пакетном запросе /api/batch/
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', 10))
+
+# Журнал изменений /api/changes/: записей в ответе и срок хранения
+# записей в днях (команда compact_changes)
+CHANGES_PAGE_SIZE = int(os.getenv('CHANGES_PAGE_SIZE', 500))
+CHANGES_RETENTION_DAYS = int(os.getenv('CHANGES_RETENTION_DAYS', 30))
+# Записи журнала новее окна в секундах клиентам еще не выдаются: окно
+# должно быть больше времени транзакций, пишущих в журнал
+CHANGES_COMMIT_WINDOW = int(os.getenv('CHANGES_COMMIT_WINDOW', 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -131,8 +203,20 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'api.authentication.BatchSubrequestAuthentication',
         'rest_framework.authentication.TokenAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'api.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.ORJSONParser',
+        'api.parsers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
 }
@@ -141,3 +225,22 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=10),
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
+
+# Метрики Prometheus, выдаются по адресу /api/metrics только с токеном
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Профилирование запросов staff-пользователей (заголовок X-Profile)
+PROFILES_DIR = os.getenv('PROFILES_DIR', BASE_DIR / 'profiles')
+PROFILES_MAX_COUNT = int(os.getenv('PROFILES_MAX_COUNT', 50))
+PROFILING_SAMPLE_INTERVAL = 0.002
+
+# Фоновые задачи (core.jobs, команда run_worker). При JOBS_EAGER задачи
+# выполняются сразу при постановке в очередь, без воркера
+JOBS_EAGER = os.getenv('JOBS_EAGER', 'False') == 'True'
+JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', 5))
+# пауза перед повтором в секундах, удваивается с каждой попыткой
+JOBS_RETRY_BACKOFF = float(os.getenv('JOBS_RETRY_BACKOFF', 10))
+JOBS_RETRY_BACKOFF_MAX = float(os.getenv('JOBS_RETRY_BACKOFF_MAX', 3600))
+# через сколько секунд выполняемая задача считается зависшей
+JOBS_TIMEOUT = int(os.getenv('JOBS_TIMEOUT', 600))
@@ -0,0 +1,19 @@
+import os
+import shutil
+
+# Каталог должен быть задан до импорта prometheus_client: тип значений
+# метрик выбирается при импорте и наследуется воркерами от мастера.
+# Через каталог метрики всех воркеров сводятся в одну выдачу /api/metrics
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', '/tmp/foodgram-prometheus')
+
+
+def on_starting(server):
+    shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
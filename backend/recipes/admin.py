@@ -1,5 +1,7 @@
 from django.contrib import admin
+from django.db.models import Count
 
+from .jobs import process_recipe_change, refresh_catalogue
 from .models import (Favorite, Ingredient, IngredientRecipe,
                      Recipe, ShoppingCart, Tag, TagRecipe)
 
@@ -9,6 +11,18 @@ class IngredientAdmin(admin.ModelAdmin):
     list_filter = ('name',)
     search_fields = ('^name',)
 
+    def save_model(self, request, ingredient, form, change):
+        super().save_model(request, ingredient, form, change)
+        refresh_catalogue.delay()
+
+    def delete_model(self, request, ingredient):
+        super().delete_model(request, ingredient)
+        refresh_catalogue.delay()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        refresh_catalogue.delay()
+
 
 class IngredientsInline(admin.TabularInline):
 
@@ -32,8 +46,55 @@ class RecipeAdmin(admin.ModelAdmin):
     search_fields = ('name', 'author__email', 'tags__slug', 'tags__name')
     inlines = (IngredientsInline, TagsInline)
 
+    def get_queryset(self, request):
+        # счетчик избранного одним запросом на страницу списка
+        return super().get_queryset(request).annotate(
+            favorites_count=Count('favorites', distinct=True))
+
+    @admin.display(description='В избранном',
+                   ordering='favorites_count')
     def in_favorite_count(self, recipe):
-        return Favorite.objects.filter(recipe=recipe).count()
+        return recipe.favorites_count
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        recipe = Recipe.objects.filter(pk=form.instance.pk)
+        recipe.update_tags_mask()
+        recipe.refresh_snapshots()
+        process_recipe_change.delay(form.instance.pk, created=not change)
+
+
+class RecipeRelationAdmin(admin.ModelAdmin):
+    """Записи связей рецепта: после изменения рецепт отмечается."""
+
+    def save_model(self, request, relation, form, change):
+        recipe_ids = {relation.recipe_id}
+        if change:
+            recipe_ids.add(
+                self.model.objects.get(pk=relation.pk).recipe_id)
+        super().save_model(request, relation, form, change)
+        self.recipes_changed(recipe_ids)
+
+    def delete_model(self, request, relation):
+        super().delete_model(request, relation)
+        self.recipes_changed({relation.recipe_id})
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        self.recipes_changed(recipe_ids)
+
+    def recipes_changed(self, recipe_ids):
+        recipes = Recipe.objects.filter(pk__in=recipe_ids)
+        recipes.refresh_snapshots()
+        recipes.touch()
+
+
+class TagRecipeAdmin(RecipeRelationAdmin):
+
+    def recipes_changed(self, recipe_ids):
+        Recipe.objects.filter(pk__in=recipe_ids).update_tags_mask()
+        super().recipes_changed(recipe_ids)
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -42,8 +103,8 @@ class TagAdmin(admin.ModelAdmin):
 
 admin.site.register(Favorite)
 admin.site.register(Ingredient, IngredientAdmin)
-admin.site.register(IngredientRecipe)
+admin.site.register(IngredientRecipe, RecipeRelationAdmin)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(ShoppingCart)
 admin.site.register(Tag, TagAdmin)
-admin.site.register(TagRecipe)
+admin.site.register(TagRecipe, TagRecipeAdmin)
@@ -0,0 +1,114 @@
+"""Снимок каталога ингредиентов для /api/ingredients/ без фильтров.
+
+Каталог целиком сериализуется один раз в файл ingredients.<хэш>.json
+в MEDIA_ROOT/catalogue вместе со сжатыми копиями .gz и .br. Имя файла
+зависит от содержимого, поэтому nginx может отдавать его с бессрочным
+кэшированием (immutable), а API отдает поток подходящей по
+Accept-Encoding копии без сериализации.
+
+Снимок пересобирается командой load_ingredients и при изменении
+ингредиентов в админке. Вместе с ним запоминается версия модели
+Ingredient (core.versions): если каталог изменили иначе, снимок
+пересобирается при следующем запросе.
+"""
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import brotli
+import orjson
+from django.conf import settings
+
+from .models import Ingredient
+from core.versions import get_model_key, get_versions
+
+CATALOGUE_DIR = 'catalogue'
+POINTER_FILE = 'ingredients.current'
+# старый снимок остается доступным клиентам, получившим его адрес
+KEEP_SNAPSHOTS = 2
+ENCODINGS = {'br': '.br', 'gzip': '.gz', None: ''}
+
+
+def get_catalogue_dir():
+    return Path(settings.MEDIA_ROOT, CATALOGUE_DIR)
+
+
+class Snapshot:
+    """Собранный снимок каталога."""
+
+    def __init__(self, name, version):
+        self.name = name
+        self.version = version
+
+    @property
+    def etag(self):
+        return '"{}"'.format(self.name.split('.')[1])
+
+    @property
+    def url(self):
+        return f'{settings.MEDIA_URL}{CATALOGUE_DIR}/{self.name}'
+
+    def get_path(self, encoding=None):
+        return get_catalogue_dir() / (self.name + ENCODINGS[encoding])
+
+
+def write_file(path, content):
+    """Запись файла целиком: читатели не видят его недописанным."""
+    temporary = path.with_name(f'{path.name}.tmp{os.getpid()}')
+    temporary.write_bytes(content)
+    os.replace(temporary, path)
+
+
+def get_catalogue_version():
+    return get_versions([get_model_key(Ingredient)])[0]
+
+
+def build_catalogue():
+    """Сборка снимка и переключение на него."""
+    # версия читается до данных: снимок не старее своей версии
+    version = get_catalogue_version()
+    content = orjson.dumps(list(Ingredient.objects.order_by(
+        'name', 'pk').values('id', 'name', 'measurement_unit')))
+    name = 'ingredients.{}.json'.format(
+        hashlib.sha256(content).hexdigest()[:16])
+    snapshot = Snapshot(name, version)
+
+    catalogue_dir = get_catalogue_dir()
+    catalogue_dir.mkdir(parents=True, exist_ok=True)
+    if not snapshot.get_path().exists():
+        write_file(snapshot.get_path('gzip'),
+                   gzip.compress(content, compresslevel=9, mtime=0))
+        write_file(snapshot.get_path('br'),
+                   brotli.compress(content, quality=11))
+        write_file(snapshot.get_path(), content)
+    write_file(catalogue_dir / POINTER_FILE,
+               json.dumps({'name': name, 'version': version}).encode())
+    delete_old_snapshots(catalogue_dir, name)
+    return snapshot
+
+
+def delete_old_snapshots(catalogue_dir, current_name):
+    snapshots = sorted(catalogue_dir.glob('ingredients.*.json'),
+                       key=lambda path: path.stat().st_mtime, reverse=True)
+    keep = {current_name} | {path.name
+                             for path in snapshots[:KEEP_SNAPSHOTS]}
+    for path in snapshots:
+        if path.name not in keep:
+            for suffix in ENCODINGS.values():
+                path.with_name(path.name + suffix).unlink(missing_ok=True)
+
+
+def get_catalogue():
+    """Актуальный снимок каталога, при необходимости - пересобранный."""
+    try:
+        pointer = json.loads(
+            (get_catalogue_dir() / POINTER_FILE).read_bytes())
+    except FileNotFoundError:
+        return build_catalogue()
+    snapshot = Snapshot(pointer['name'], pointer['version'])
+    if snapshot.version != get_catalogue_version() or (
+            not snapshot.get_path().exists()):
+        return build_catalogue()
+    return snapshot
@@ -0,0 +1,121 @@
+"""Лента подписок: рецепты авторов, на которых подписан пользователь.
+
+Рецепт при публикации раскладывается по лентам подписчиков (таблица
+FeedItem), поэтому чтение ленты - один запрос по индексу
+(user, -pub_date, -recipe). Для авторов с числом подписчиков больше
+FEED_FANOUT_MAX_FOLLOWERS раскладка не выполняется: такой автор
+помечается флагом feed_pull, и его рецепты подмешиваются в ленту при
+чтении. Флаг не снимается, иначе рецепты, опубликованные в режиме
+подмешивания, пропали бы из лент.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+
+from .models import FeedItem, Recipe
+from core.versions import bump_model_versions, bump_user_state
+from users.models import Follow
+
+User = get_user_model()
+
+
+def fan_out_recipe(recipe):
+    """Добавление нового рецепта в ленты подписчиков автора.
+
+    Вызывается в транзакции задачи process_recipe_change: версии
+    данных для ETag ленты меняются вместе с ее записями.
+    """
+    author = recipe.author
+    if not author.feed_pull:
+        follower_ids = list(Follow.objects.filter(
+            following=author).values_list('user_id', flat=True))
+        if len(follower_ids) <= settings.FEED_FANOUT_MAX_FOLLOWERS:
+            FeedItem.objects.bulk_create(
+                (FeedItem(user_id=follower_id, recipe=recipe, author=author,
+                          pub_date=recipe.pub_date)
+                 for follower_id in follower_ids),
+                ignore_conflicts=True
+            )
+            # ETag ленты строится из версии состояния пользователя
+            bump_user_state(*follower_ids)
+            return
+        User.objects.filter(pk=author.pk).update(feed_pull=True)
+        author.feed_pull = True
+        # update() не вызывает сигналы: версия меняется явно, иначе
+        # ленты подписчиков отвечали бы 304 без подмешанного рецепта
+        bump_model_versions(User)
+
+
+def backfill_feed(user, author):
+    """Заполнение ленты последними рецептами автора после подписки."""
+    if author.feed_pull:
+        return
+    recipes = author.recipes.order_by('-pub_date', '-pk').values_list(
+        'pk', 'pub_date')[:settings.FEED_BACKFILL_LIMIT]
+    FeedItem.objects.bulk_create(
+        (FeedItem(user=user, recipe_id=recipe_id, author=author,
+                  pub_date=pub_date)
+         for recipe_id, pub_date in recipes),
+        ignore_conflicts=True
+    )
+
+
+def remove_from_feed(user, author):
+    """Удаление рецептов автора из ленты после отписки."""
+    FeedItem.objects.filter(user=user, author=author).delete()
+
+
+def encode_cursor(pub_date, recipe_id):
+    value = f'{pub_date.isoformat()}|{recipe_id}'
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Разбор курсора в пару (pub_date, recipe_id)."""
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode()).decode()
+        pub_date, recipe_id = value.split('|')
+        return datetime.fromisoformat(pub_date), int(recipe_id)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ParseError('Некорректный курсор!')
+
+
+def get_feed_page(user, cursor=None, limit=None):
+    """Страница ленты пользователя.
+
+    Возвращает список пар (pub_date, recipe_id) в порядке убывания даты
+    публикации и курсор следующей страницы (None, если страница
+    последняя). Пагинация по ключу (pub_date, recipe_id) не зависит
+    от глубины листания.
+    """
+    limit = limit or settings.REST_FRAMEWORK['PAGE_SIZE']
+    items = FeedItem.objects.filter(user=user)
+    pulled = Recipe.objects.filter(
+        author__in=Follow.objects.filter(
+            user=user, following__feed_pull=True).values('following'))
+    if cursor is not None:
+        pub_date, recipe_id = decode_cursor(cursor)
+        before = Q(pub_date__lt=pub_date)
+        items = items.filter(
+            before | Q(pub_date=pub_date, recipe_id__lt=recipe_id))
+        pulled = pulled.filter(
+            before | Q(pub_date=pub_date, pk__lt=recipe_id))
+
+    # одна лишняя запись из каждого источника показывает наличие
+    # следующей страницы
+    rows = set(items.order_by('-pub_date', '-recipe_id').values_list(
+        'pub_date', 'recipe_id')[:limit + 1])
+    rows.update(pulled.order_by('-pub_date', '-pk').values_list(
+        'pub_date', 'pk')[:limit + 1])
+    rows = sorted(rows, reverse=True)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*rows[-1])
+    return rows, next_cursor
@@ -0,0 +1,34 @@
+"""Фоновые задачи рецептов (см. core.jobs)."""
+from .catalogue import build_catalogue
+from .feed import fan_out_recipe
+from .models import Recipe
+from .pantry import build_index, get_current_generation
+from .similarity import refresh_similar
+from core.jobs import job
+
+
+@job
+def process_recipe_change(recipe_id, created=False):
+    """Пересчет похожих рецептов и раскладка нового рецепта по лентам."""
+    recipe = Recipe.objects.select_related('author').filter(
+        pk=recipe_id).first()
+    if recipe is None:
+        # рецепт удален до выполнения задачи
+        return
+    refresh_similar(recipe)
+    if created:
+        fan_out_recipe(recipe)
+
+
+@job
+def refresh_catalogue():
+    """Пересборка снимка каталога ингредиентов после правок в админке."""
+    build_catalogue()
+
+
+@job
+def rebuild_pantry_index(generation):
+    """Пересборка индекса pantry, если он еще собран из generation."""
+    # задачу могли поставить несколько воркеров
+    if get_current_generation() == generation:
+        build_index()
@@ -0,0 +1,38 @@
+# Generated by Django 3.2 on 2026-10-19 10:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_feeditem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+        ),
+        migrations.CreateModel(
+            name='TrendingRecipe',
+            fields=[
+                ('position', models.PositiveIntegerField(primary_key=True, serialize=False, verbose_name='Место')),
+                ('score', models.FloatField(verbose_name='Оценка')),
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='trending', to='recipes.recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'популярный рецепт',
+                'verbose_name_plural': 'Популярные рецепты',
+                'ordering': ('position',),
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations, models
+
+
+def fill_bits(apps, schema_editor):
+    Tag = apps.get_model('recipes', 'Tag')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    TagRecipe = apps.get_model('recipes', 'TagRecipe')
+    for bit, tag in enumerate(Tag.objects.order_by('pk')):
+        if bit >= 63:
+            raise ValueError('Тегов больше 63, маска тегов невозможна')
+        tag.bit = bit
+        tag.save(update_fields=('bit',))
+
+    masks = {}
+    for recipe_id, bit in TagRecipe.objects.filter(
+            recipe__isnull=False, tag__isnull=False).values_list(
+                'recipe_id', 'tag__bit'):
+        masks[recipe_id] = masks.get(recipe_id, 0) | 1 << bit
+    for recipe_id, mask in masks.items():
+        Recipe.objects.filter(pk=recipe_id).update(tags_mask=mask)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_trending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(
+                editable=False, null=True,
+                verbose_name='Бит в маске тегов рецепта'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(
+                default=0, editable=False, verbose_name='Маска тегов'),
+        ),
+        migrations.RunPython(fill_bits, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(
+                editable=False, unique=True,
+                verbose_name='Бит в маске тегов рецепта'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations, models
+
+import recipes.models
+
+
+def fill_snapshots(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    TagRecipe = apps.get_model('recipes', 'TagRecipe')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    snapshots = {pk: {'tags': [], 'ingredients': []}
+                 for pk in Recipe.objects.values_list('pk', flat=True)}
+    for recipe_id, *values in TagRecipe.objects.filter(
+            recipe__isnull=False, tag__isnull=False
+    ).order_by('tag_id').values_list(
+            'recipe_id', 'tag_id', 'tag__name', 'tag__color', 'tag__slug'):
+        snapshots[recipe_id]['tags'].append(values)
+    for recipe_id, *values in IngredientRecipe.objects.filter(
+            recipe__isnull=False
+    ).order_by('ingredient__name', 'pk').values_list(
+            'recipe_id', 'ingredient_id', 'ingredient__name',
+            'ingredient__measurement_unit', 'amount'):
+        snapshots[recipe_id]['ingredients'].append(values)
+    for recipe_id, snapshot in snapshots.items():
+        Recipe.objects.filter(pk=recipe_id).update(snapshot=snapshot)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='snapshot',
+            field=models.JSONField(
+                default=recipes.models.empty_snapshot, editable=False,
+                verbose_name='Снимок тегов и ингредиентов'),
+        ),
+        migrations.RunPython(fill_snapshots, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,152 @@
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+
+from core.changes import record_changes
+from core.models import Change
+from core.versions import bump_model_versions
 
 User = get_user_model()
 MAX_LENGTH_HEX_COLOR = 7
+# биты знакового 64-битного tags_mask, кроме знакового
+MAX_TAGS = 63
+# поля тега и ингредиента в выдаче рецепта; в Recipe.snapshot хранятся
+# списки значений этих полей: порядок ключей объекта jsonb не сохраняет
+SNAPSHOT_TAG_FIELDS = ('id', 'name', 'color', 'slug')
+SNAPSHOT_INGREDIENT_FIELDS = ('id', 'name', 'measurement_unit', 'amount')
+SNAPSHOT_BATCH_SIZE = 500
+
+
+def empty_snapshot():
+    """Снимок рецепта без тегов и ингредиентов."""
+    return {'tags': [], 'ingredients': []}
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Выборки рецептов для вывода без дополнительных запросов на строку."""
+
+    def with_related(self):
+        """Автор рецепта в том же запросе.
+
+        Теги и ингредиенты выводятся из Recipe.snapshot без запросов к
+        таблицам связей.
+        """
+        return self.select_related('author')
+
+    def render_snapshots(self):
+        """Снимки тегов и ингредиентов по таблицам связей.
+
+        Словарь {id рецепта: снимок}, запрос на связь. Порядок как у
+        прежнего вывода: теги по id, ингредиенты по названию.
+        """
+        recipes = self.order_by().values('pk')
+        snapshots = {pk: empty_snapshot()
+                     for pk in recipes.values_list('pk', flat=True)}
+        tags = TagRecipe.objects.filter(
+            recipe__in=recipes, tag__isnull=False
+        ).order_by('tag_id').values_list(
+            'recipe_id', 'tag_id', 'tag__name', 'tag__color', 'tag__slug')
+        for recipe_id, *values in tags:
+            snapshots[recipe_id]['tags'].append(values)
+        ingredients = IngredientRecipe.objects.filter(
+            recipe__in=recipes
+        ).order_by('ingredient__name', 'pk').values_list(
+            'recipe_id', 'ingredient_id', 'ingredient__name',
+            'ingredient__measurement_unit', 'amount')
+        for recipe_id, *values in ingredients:
+            snapshots[recipe_id]['ingredients'].append(values)
+        return snapshots
+
+    def refresh_snapshots(self):
+        """Перезапись Recipe.snapshot, возвращает количество рецептов.
+
+        Вызывается в транзакции изменения связей рецепта: выдача
+        рецептов не обращается к таблицам связей.
+        """
+        snapshots = self.render_snapshots()
+        Recipe.objects.bulk_update(
+            [Recipe(pk=pk, snapshot=snapshot)
+             for pk, snapshot in snapshots.items()],
+            ('snapshot',), batch_size=SNAPSHOT_BATCH_SIZE)
+        return len(snapshots)
+
+    def stale_snapshots(self):
+        """id рецептов, у которых Recipe.snapshot расходится со связями."""
+        stale = []
+        pks = list(self.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(pks), SNAPSHOT_BATCH_SIZE):
+            batch = Recipe.objects.filter(
+                pk__in=pks[start:start + SNAPSHOT_BATCH_SIZE])
+            snapshots = batch.render_snapshots()
+            stale.extend(
+                pk for pk, snapshot in batch.values_list('pk', 'snapshot')
+                if snapshot != snapshots[pk])
+        return sorted(stale)
+
+    def with_user_flags(self, user,
+                        flags=('is_favorited', 'is_in_shopping_cart')):
+        """Аннотация полей is_favorited и is_in_shopping_cart из flags."""
+        if user.is_anonymous:
+            return self
+        annotations = {
+            'is_favorited': Favorite,
+            'is_in_shopping_cart': ShoppingCart,
+        }
+        return self.annotate(**{
+            flag: models.Exists(model.objects.filter(
+                user=user, recipe=models.OuterRef('pk')))
+            for flag, model in annotations.items() if flag in flags
+        })
+
+    def with_any_tag(self, mask):
+        """Рецепты хотя бы с одним из тегов маски mask."""
+        return self.alias(tags_match=models.ExpressionWrapper(
+            models.F('tags_mask').bitand(mask),
+            output_field=models.BigIntegerField()
+        )).exclude(tags_match=0)
+
+    def tag_counts(self):
+        """Количество рецептов с каждым тегом: словарь {бит: количество}.
+
+        Один запрос с группировкой по маске тегов: различных масок не
+        больше, чем сочетаний тегов у рецептов.
+        """
+        counts = {}
+        masks = self.order_by().values_list('tags_mask').annotate(
+            count=models.Count('pk'))
+        for mask, count in masks:
+            for bit in range(MAX_TAGS):
+                if mask >> bit & 1:
+                    counts[bit] = counts.get(bit, 0) + count
+        return counts
+
+    def touch(self):
+        """Отметка изменения рецептов без сохранения модели.
+
+        Нужна при изменении связанных записей (теги, ингредиенты), от
+        updated_at зависят ETag рецепта и поиск по ингредиентам.
+        """
+        bump_model_versions(Recipe)
+        record_changes(Change.KIND_RECIPE, self.values_list('pk', flat=True))
+        return self.update(updated_at=timezone.now())
+
+    def update_tags_mask(self):
+        """Пересчет tags_mask по записям TagRecipe одним запросом."""
+        tag_bit = models.ExpressionWrapper(
+            Cast(models.Value(1), models.BigIntegerField()).bitleftshift(
+                models.F('tag__bit')),
+            output_field=models.BigIntegerField()
+        )
+        # биты разных тегов не пересекаются, поэтому сумма равна OR
+        mask = TagRecipe.objects.filter(
+            recipe=models.OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            mask=models.Sum(tag_bit)).values('mask')
+        return self.update(tags_mask=Coalesce(
+            models.Subquery(mask), 0, output_field=models.BigIntegerField()))
 
 
 class Tag(models.Model):
@@ -13,6 +156,8 @@ class Tag(models.Model):
     color = models.CharField('Цвет', max_length=MAX_LENGTH_HEX_COLOR,
                              unique=True)
     slug = models.SlugField('Слаг', unique=True)
+    bit = models.PositiveSmallIntegerField('Бит в маске тегов рецепта',
+                                           unique=True, editable=False)
 
     class Meta:
         verbose_name = 'тег'
@@ -22,6 +167,18 @@ class Tag(models.Model):
     def __str__(self):
         return self.slug
 
+    def clean(self):
+        if self.bit is None and Tag.objects.count() >= MAX_TAGS:
+            raise ValidationError(
+                f'Тегов не может быть больше {MAX_TAGS}!')
+
+    def save(self, *args, **kwargs):
+        """Назначение новому тегу свободного бита маски."""
+        if self.bit is None:
+            used_bits = set(Tag.objects.values_list('bit', flat=True))
+            self.bit = min(set(range(MAX_TAGS)) - used_bits)
+        super().save(*args, **kwargs)
+
 
 class Ingredient(models.Model):
     """Модель для ингредиента."""
@@ -61,12 +218,27 @@ class Recipe(models.Model):
         'Время приготовления, мин', validators=[MinValueValidator(1)])
     pub_date = models.DateTimeField(auto_now_add=True,
                                     verbose_name='Дата публикации')
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True,
+                                      db_index=True)
+    # теги рецепта в виде битов Tag.bit: фильтр по тегам без соединений
+    tags_mask = models.BigIntegerField('Маска тегов', default=0,
+                                       editable=False)
+    # теги и ингредиенты рецепта для выдачи, см. refresh_snapshots:
+    # {'tags': [[значения SNAPSHOT_TAG_FIELDS], ...], 'ingredients': ...}
+    snapshot = models.JSONField('Снимок тегов и ингредиентов',
+                                default=empty_snapshot, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
         default_related_name = 'recipes'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=('author', '-pub_date'),
+                         name='recipe_author_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -126,6 +298,8 @@ class UserRecipeModel(models.Model):
                              verbose_name='Пользователь')
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
                                verbose_name='Рецепт в избранном')
+    created = models.DateTimeField('Дата добавления', default=timezone.now,
+                                   db_index=True)
 
     class Meta:
         abstract = True
@@ -162,3 +336,82 @@ class ShoppingCart(UserRecipeModel):
                 name='unique_key_user_recipe_shopcart'
             )
         ]
+
+
+class FeedItem(models.Model):
+    """Модель ленты подписок: рецепт автора в ленте подписчика."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             verbose_name='Подписчик')
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               verbose_name='Рецепт')
+    # автор и дата публикации дублируются из рецепта для удаления
+    # записей при отписке и чтения ленты по индексу без соединений
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name='+', verbose_name='Автор')
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'запись ленты'
+        verbose_name_plural = 'Лента подписок'
+        default_related_name = 'feed_items'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'), name='unique_key_user_recipe_feed'
+            )
+        ]
+        indexes = [
+            models.Index(fields=('user', '-pub_date', '-recipe'),
+                         name='feed_user_pub_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.recipe}'
+
+
+class TrendingRecipe(models.Model):
+    """Модель рейтинга популярных рецептов.
+
+    Заполняется командой compute_trending, место в рейтинге - первичный ключ.
+    """
+
+    position = models.PositiveIntegerField('Место', primary_key=True)
+    recipe = models.OneToOneField(Recipe, on_delete=models.CASCADE,
+                                  related_name='trending',
+                                  verbose_name='Рецепт')
+    score = models.FloatField('Оценка')
+
+    class Meta:
+        verbose_name = 'популярный рецепт'
+        verbose_name_plural = 'Популярные рецепты'
+        ordering = ('position',)
+
+    def __str__(self):
+        return f'{self.position}. {self.recipe}'
+
+
+class SimilarRecipe(models.Model):
+    """Модель похожих рецептов: ближайшие по составу ингредиентов."""
+
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               related_name='similar_recipes',
+                               verbose_name='Рецепт')
+    similar = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                                related_name='+',
+                                verbose_name='Похожий рецепт')
+    score = models.FloatField('Сходство')
+    position = models.PositiveSmallIntegerField('Место')
+
+    class Meta:
+        verbose_name = 'похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        ordering = ('recipe', 'position')
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'position'),
+                name='unique_key_recipe_similar_position'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} - {self.similar}'
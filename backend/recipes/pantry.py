@@ -0,0 +1,191 @@
+"""Поиск рецептов по имеющимся ингредиентам («что приготовить»).
+
+Инвертированный индекс ингредиент -> массив id рецептов строится из
+IngredientRecipe и хранится в файлах .npy каталога PANTRY_INDEX_DIR.
+Воркеры открывают их через mmap, поэтому страницы индекса в памяти
+общие. Каждая сборка пишется в новый подкаталог, после чего атомарно
+подменяется файл current с именем подкаталога: воркеры видят либо
+старый, либо новый индекс целиком.
+
+Рецепты, измененные после сборки индекса (Recipe.updated_at), при поиске
+оцениваются по данным из БД, удаленные - пропускаются при выдаче
+страницы, поэтому выдача не отстает от правок. Если измененных рецептов
+больше PANTRY_REBUILD_THRESHOLD (например, после переименования тега
+в админке), поиск не пересчитывает их, а ставит в очередь задачу
+пересборки индекса и до ее выполнения ранжирует по индексу. Полная
+пересборка - также команда build_pantry_index (по расписанию).
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .models import IngredientRecipe, Recipe
+
+ARRAYS = ('ingredients', 'offsets', 'postings', 'recipes', 'sizes')
+CURRENT_FILE = 'current'
+
+_lock = threading.Lock()
+_loaded = {}
+# сборки, пересборка которых уже поставлена в очередь этим процессом
+_rebuild_requested = set()
+
+
+def get_index_dir():
+    return Path(settings.PANTRY_INDEX_DIR)
+
+
+def build_index():
+    """Сборка индекса в новый подкаталог и переключение на него."""
+    # изменения во время сборки попадут в поиск через updated_at
+    built_at = timezone.now()
+    pairs = np.array(
+        IngredientRecipe.objects.filter(recipe__isnull=False).order_by(
+            'ingredient_id', 'recipe_id').values_list(
+                'ingredient_id', 'recipe_id'),
+        dtype=np.int64
+    ).reshape(-1, 2)
+    ingredients, starts = np.unique(pairs[:, 0], return_index=True)
+    recipes, sizes = np.unique(pairs[:, 1], return_counts=True)
+    arrays = {
+        'ingredients': ingredients,
+        'offsets': np.append(starts, len(pairs)),
+        'postings': pairs[:, 1],
+        'recipes': recipes,
+        'sizes': sizes,
+    }
+
+    index_dir = get_index_dir()
+    index_dir.mkdir(parents=True, exist_ok=True)
+    generation = Path(tempfile.mkdtemp(prefix='generation-', dir=index_dir))
+    for name, array in arrays.items():
+        np.save(generation / f'{name}.npy', array)
+    (generation / 'meta.json').write_text(
+        json.dumps({'built_at': built_at.isoformat()}))
+    current = index_dir / f'{CURRENT_FILE}.tmp{os.getpid()}'
+    current.write_text(generation.name)
+    os.replace(current, index_dir / CURRENT_FILE)
+    delete_old_generations(index_dir, generation.name)
+    return len(recipes)
+
+
+def delete_old_generations(index_dir, current_name):
+    """Удаление прежних сборок: открытые mmap остаются валидными."""
+    for path in index_dir.glob('generation-*'):
+        if path.name != current_name:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class PantryIndex:
+    """Открытая через mmap сборка индекса."""
+
+    def __init__(self, path):
+        self.generation = path.name
+        for name in ARRAYS:
+            setattr(self, name, np.load(path / f'{name}.npy', mmap_mode='r'))
+        meta = json.loads((path / 'meta.json').read_text())
+        self.built_at = datetime.fromisoformat(meta['built_at'])
+
+    def count_owned(self, ingredient_ids):
+        """Рецепты с хотя бы одним из ингредиентов и число совпадений."""
+        positions = np.searchsorted(self.ingredients, ingredient_ids)
+        found = positions < len(self.ingredients)
+        positions = positions[found]
+        positions = positions[
+            self.ingredients[positions] == ingredient_ids[found]]
+        postings = [self.postings[self.offsets[position]:
+                                  self.offsets[position + 1]]
+                    for position in positions]
+        if not postings:
+            return np.empty(0, np.int64), np.empty(0, np.int64)
+        return np.unique(np.concatenate(postings), return_counts=True)
+
+    def get_sizes(self, recipe_ids):
+        return self.sizes[np.searchsorted(self.recipes, recipe_ids)]
+
+
+def get_index():
+    """Текущая сборка индекса, при отсутствии - собирается."""
+    current = get_index_dir() / CURRENT_FILE
+    if not current.exists():
+        build_index()
+    path = get_index_dir() / get_current_generation()
+    with _lock:
+        index = _loaded.get(path)
+        if index is None:
+            try:
+                index = PantryIndex(path)
+            except FileNotFoundError:
+                # сборку удалил другой процесс сразу после переключения
+                path = get_index_dir() / get_current_generation()
+                index = PantryIndex(path)
+            _loaded.clear()
+            _loaded[path] = index
+    return index
+
+
+def get_current_generation():
+    return (get_index_dir() / CURRENT_FILE).read_text()
+
+
+def request_rebuild(index):
+    """Постановка пересборки индекса в очередь (раз на сборку)."""
+    # recipes.jobs импортирует этот модуль
+    from .jobs import rebuild_pantry_index
+
+    with _lock:
+        if index.generation in _rebuild_requested:
+            return
+        _rebuild_requested.add(index.generation)
+    rebuild_pantry_index.delay(index.generation)
+
+
+def search(ingredient_ids):
+    """Id рецептов по убыванию доли имеющихся ингредиентов.
+
+    При равной доле выше рецепты с меньшим числом недостающих
+    ингредиентов, затем более новые.
+    """
+    ingredient_ids = np.unique(np.asarray(ingredient_ids, dtype=np.int64))
+    index = get_index()
+    recipe_ids, owned = index.count_owned(ingredient_ids)
+    sizes = index.get_sizes(recipe_ids)
+
+    threshold = settings.PANTRY_REBUILD_THRESHOLD
+    changed = set(Recipe.objects.filter(
+        updated_at__gte=index.built_at).values_list(
+            'pk', flat=True)[:threshold + 1])
+    if len(changed) > threshold:
+        # пересчет по БД стоил бы каждому запросу просмотра части
+        # каталога: до пересборки выдача идет по индексу
+        request_rebuild(index)
+        changed = set()
+    if changed:
+        fresh = ~np.isin(recipe_ids, list(changed))
+        recipe_ids, owned, sizes = (
+            recipe_ids[fresh], owned[fresh], sizes[fresh])
+        pantry = set(ingredient_ids.tolist())
+        changed_owned = {recipe_id: [0, 0] for recipe_id in changed}
+        for recipe_id, ingredient_id in IngredientRecipe.objects.filter(
+                recipe_id__in=changed).values_list(
+                    'recipe_id', 'ingredient_id'):
+            changed_owned[recipe_id][0] += ingredient_id in pantry
+            changed_owned[recipe_id][1] += 1
+        changed_owned = np.array(
+            [(recipe_id, owned_count, size)
+             for recipe_id, (owned_count, size) in changed_owned.items()
+             if owned_count], dtype=np.int64).reshape(-1, 3)
+        recipe_ids = np.concatenate((recipe_ids, changed_owned[:, 0]))
+        owned = np.concatenate((owned, changed_owned[:, 1]))
+        sizes = np.concatenate((sizes, changed_owned[:, 2]))
+
+    coverage = owned / sizes
+    missing = sizes - owned
+    return recipe_ids[np.lexsort((-recipe_ids, missing, -coverage))]
@@ -0,0 +1,78 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from .models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from core.changes import get_change_op, record_change
+from core.models import Change
+from core.versions import bump_model_versions, bump_user_state
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, created, **kwargs):
+    if not created:
+        Recipe.objects.with_any_tag(1 << instance.bit).refresh_snapshots()
+    bump_model_versions(Tag)
+    record_change(Change.KIND_TAG, instance.pk)
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    """Снятие бита удаленного тега с рецептов, бит станет свободным."""
+    recipes = Recipe.objects.with_any_tag(1 << instance.bit)
+    recipes.refresh_snapshots()
+    recipes.update_tags_mask()
+    bump_model_versions(Tag)
+    record_change(Change.KIND_TAG, instance.pk, Change.OP_DELETE)
+
+
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_deleting(sender, instance, **kwargs):
+    # после удаления записи связей рецептов с ингредиентом уже удалены
+    instance.recipe_ids = list(Recipe.objects.filter(
+        ingredient_recipe__ingredient=instance).values_list('pk', flat=True))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, instance, signal, **kwargs):
+    if signal is post_delete:
+        Recipe.objects.filter(pk__in=instance.recipe_ids).refresh_snapshots()
+    elif not kwargs['created']:
+        Recipe.objects.filter(
+            ingredient_recipe__ingredient=instance).refresh_snapshots()
+    bump_model_versions(Ingredient)
+    record_change(Change.KIND_INGREDIENT, instance.pk, get_change_op(signal))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, signal, **kwargs):
+    bump_model_versions(Recipe)
+    record_change(Change.KIND_RECIPE, instance.pk, get_change_op(signal))
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def user_recipe_changed(sender, instance, signal, **kwargs):
+    """Изменение is_favorited и is_in_shopping_cart для пользователя."""
+    bump_user_state(instance.user_id)
+    kind = (Change.KIND_FAVORITE if sender is Favorite
+            else Change.KIND_SHOPPING_CART)
+    record_change(kind, instance.recipe_id, get_change_op(signal),
+                  instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relations_changed(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    """Снимок рецепта после recipe.tags.add(), set() и т.п.
+
+    Связи, созданные bulk_create и update, требуют явного вызова
+    RecipeQuerySet.refresh_snapshots.
+    """
+    if action not in {'post_add', 'post_remove', 'post_clear'}:
+        return
+    if not reverse:
+        Recipe.objects.filter(pk=instance.pk).refresh_snapshots()
+    elif pk_set:
+        Recipe.objects.filter(pk__in=pk_set).refresh_snapshots()
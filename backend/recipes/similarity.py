@@ -0,0 +1,179 @@
+"""Похожие рецепты по составу ингредиентов.
+
+Сходство рецептов - коэффициент Жаккара множеств их ингредиентов:
+|A ∩ B| / |A ∪ B|. Для каждого рецепта хранятся SIMILAR_RECIPES_COUNT
+ближайших (таблица SimilarRecipe), поэтому /api/recipes/{id}/similar/
+отвечает одним запросом.
+
+Полный пересчет (команда build_similar_recipes) строит разреженную
+матрицу рецепт x ингредиент в формате CSR и считает пересечения
+произведением матриц пачками рецептов, без самосоединения
+IngredientRecipe в SQL. После создания и изменения рецепта фоновая
+задача (recipes.jobs) пересчитывает только его соседей и списки
+рецептов, в которые он входит.
+"""
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from scipy import sparse
+
+from .models import IngredientRecipe, SimilarRecipe
+from core.datagen import insert_rows
+
+# ячеек в плотном блоке сходств пачки рецептов со всеми рецептами:
+# из-за популярных ингредиентов (соль, вода) произведение почти плотное
+BATCH_CELLS = 2 ** 24
+# во сколько раз больше ближайших рецептов проверяется при
+# инкрементальном пересчете на возможность добавить в их списки
+# измененный рецепт
+REFRESH_CANDIDATES_FACTOR = 10
+
+
+def build_matrix():
+    """Бинарная матрица рецепт x ингредиент и id рецептов ее строк."""
+    # после clear() в сериализаторе у старых записей recipe_id = NULL
+    pairs = np.array(
+        IngredientRecipe.objects.filter(recipe__isnull=False).values_list(
+            'recipe_id', 'ingredient_id'),
+        dtype=np.int64
+    ).reshape(-1, 2)
+    recipe_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    _, columns = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32),
+         (rows.ravel(), columns.ravel())),
+        shape=(len(recipe_ids), columns.max() + 1 if len(pairs) else 0)
+    )
+    return recipe_ids, matrix
+
+
+def top_neighbours(rows, columns, scores, count):
+    """Отбор count лучших пар для каждой строки.
+
+    Пары сортируются по строке, убыванию сходства и столбцу, место пары
+    внутри своей строки считается без цикла по строкам.
+    """
+    order = np.lexsort((columns, -scores, rows))
+    rows, columns, scores = rows[order], columns[order], scores[order]
+    _, first = np.unique(rows, return_index=True)
+    positions = np.arange(len(rows)) - np.repeat(
+        first, np.diff(np.append(first, len(rows))))
+    keep = positions < count
+    return rows[keep], columns[keep], scores[keep], positions[keep]
+
+
+def compute_similar(recipe_ids, matrix, count, batch_size=None):
+    """Строки таблицы SimilarRecipe для всех рецептов матрицы.
+
+    Сходства пачки рецептов со всеми рецептами считаются плотным блоком,
+    порог count-го по величине сходства в каждой строке находится
+    np.partition, и сортируются только пары не ниже порога.
+    """
+    recipes_count = matrix.shape[0]
+    if recipes_count < 2:
+        return
+    count = min(count, recipes_count - 1)
+    batch_size = batch_size or max(1, BATCH_CELLS // recipes_count)
+    sizes = np.asarray(matrix.sum(axis=1)).ravel()
+    for start in range(0, recipes_count, batch_size):
+        # разреженная матрица на плотную пачку столбцов быстрее
+        # произведения двух разреженных с почти плотным результатом
+        batch = matrix[start:start + batch_size].T.toarray()
+        scores = np.ascontiguousarray((matrix @ batch).T)
+        batch_rows = np.arange(start, start + batch.shape[1])
+        # |A ∪ B| = |A| + |B| - |A ∩ B|, без лишних временных массивов
+        union = sizes[batch_rows, None] + sizes
+        union -= scores
+        scores /= union
+        scores[batch_rows - start, batch_rows] = 0
+        threshold = np.partition(scores, -count, axis=1)[:, -count]
+        rows, columns = np.nonzero(
+            (scores >= threshold[:, None]) & (scores > 0))
+        rows, columns, scores, positions = top_neighbours(
+            rows, columns, scores[rows, columns], count)
+        yield from zip(recipe_ids[rows + start].tolist(),
+                       recipe_ids[columns].tolist(),
+                       scores.tolist(), positions.tolist())
+
+
+def rebuild_similar(batch_size=None):
+    """Полный пересчет похожих рецептов, возвращает число записей."""
+    recipe_ids, matrix = build_matrix()
+    rows = list(compute_similar(recipe_ids, matrix,
+                                settings.SIMILAR_RECIPES_COUNT, batch_size))
+    with transaction.atomic():
+        SimilarRecipe.objects.all().delete()
+        insert_rows(SimilarRecipe,
+                    ('recipe_id', 'similar_id', 'score', 'position'), rows)
+    return len(rows)
+
+
+def get_recipe_neighbours(recipe, count):
+    """Ближайшие count рецептов: список пар (id, сходство).
+
+    Пересечения считаются одним запросом с группировкой по рецептам,
+    у которых есть хотя бы один общий ингредиент.
+    """
+    ingredient_ids = IngredientRecipe.objects.filter(
+        recipe=recipe).values('ingredient_id')
+    sizes = IngredientRecipe.objects.filter(
+        recipe_id=OuterRef('recipe_id')
+    ).order_by().values('recipe_id').annotate(size=Count('pk')).values('size')
+    candidates = np.array(
+        IngredientRecipe.objects.filter(
+            ingredient_id__in=ingredient_ids, recipe__isnull=False
+        ).order_by().values('recipe_id').annotate(
+            common=Count('pk'), size=Subquery(sizes)
+        ).values_list('recipe_id', 'common', 'size'),
+        dtype=np.int64
+    ).reshape(-1, 3)
+    own = candidates[:, 0] == recipe.pk
+    if not own.any():
+        return []
+    size = candidates[own, 2][0]
+    candidates = candidates[~own]
+    recipe_ids, common, sizes = candidates.T
+    scores = common / (size + sizes - common)
+    _, recipe_ids, scores, _ = top_neighbours(
+        np.zeros(len(recipe_ids), dtype=np.int64), recipe_ids, scores, count)
+    return list(zip(recipe_ids.tolist(), scores.tolist()))
+
+
+def refresh_similar(recipe):
+    """Пересчет соседей рецепта после его создания или изменения.
+
+    Рецепт также добавляется в списки ближайших к нему рецептов (если
+    проходит по сходству) и убирается из списков, где его сходство
+    устарело. Списки более далеких рецептов уточняются полным пересчетом.
+    """
+    count = settings.SIMILAR_RECIPES_COUNT
+    candidates = get_recipe_neighbours(
+        recipe, count * REFRESH_CANDIDATES_FACTOR)
+    neighbours = candidates[:count]
+    new_scores = dict(candidates)
+    affected_ids = set(new_scores) | set(SimilarRecipe.objects.filter(
+        similar=recipe).values_list('recipe_id', flat=True))
+
+    lists = {recipe_id: [] for recipe_id in affected_ids}
+    for recipe_id, similar_id, score in SimilarRecipe.objects.filter(
+            recipe_id__in=affected_ids).exclude(similar=recipe).values_list(
+                'recipe_id', 'similar_id', 'score'):
+        lists[recipe_id].append((similar_id, score))
+    for recipe_id, score in new_scores.items():
+        lists[recipe_id].append((recipe.pk, score))
+    lists[recipe.pk] = neighbours
+
+    rows = []
+    for recipe_id, similar in lists.items():
+        similar.sort(key=lambda item: (-item[1], item[0]))
+        rows += [(recipe_id, similar_id, score, position)
+                 for position, (similar_id, score)
+                 in enumerate(similar[:count])]
+    with transaction.atomic():
+        SimilarRecipe.objects.filter(recipe_id__in=lists).delete()
+        SimilarRecipe.objects.bulk_create(
+            SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                          score=score, position=position)
+            for recipe_id, similar_id, score, position in rows
+        )
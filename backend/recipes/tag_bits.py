@@ -0,0 +1,42 @@
+"""Кэш соответствия слагов тегов битам маски Recipe.tags_mask."""
+from django.core.cache import cache
+
+from .models import Tag
+from core.metrics import record_cache_access
+from core.versions import get_model_key, get_versions
+
+TAG_BITS_CACHE_KEY = 'recipes:tag_bits:{version}'
+# кэш по умолчанию локален для процесса, поэтому ключ содержит версию
+# тегов (core.versions): изменение тегов на одном воркере меняет ключ
+# для всех. Время хранения только вытесняет записи старых версий
+TAG_BITS_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def get_tag_version():
+    return get_versions([get_model_key(Tag)])[0]
+
+
+def get_tag_bits(version=None):
+    """Словарь {слаг тега: бит}.
+
+    version - версия тегов, уже прочитанная запросом (например, для
+    ETag), None - версия читается отдельным запросом.
+    """
+    if version is None:
+        version = get_tag_version()
+    key = TAG_BITS_CACHE_KEY.format(version=version)
+    tag_bits = cache.get(key)
+    record_cache_access('tag_bits', tag_bits is not None)
+    if tag_bits is None:
+        tag_bits = dict(Tag.objects.values_list('slug', 'bit'))
+        cache.set(key, tag_bits, TAG_BITS_CACHE_TIMEOUT)
+    return tag_bits
+
+
+def get_tags_mask(slugs, version=None):
+    """Маска тегов по их слагам."""
+    tag_bits = get_tag_bits(version)
+    mask = 0
+    for slug in slugs:
+        mask |= 1 << tag_bits[slug]
+    return mask
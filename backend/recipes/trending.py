@@ -0,0 +1,69 @@
+"""Рейтинг популярных рецептов за последние дни.
+
+Оценка рецепта - сумма добавлений в избранное и в списки покупок за
+TRENDING_WINDOW_DAYS дней, каждое с весом, убывающим вдвое за
+TRENDING_HALF_LIFE_HOURS часов, плюс бонус за новизну рецепта.
+Рейтинг пересчитывается командой compute_trending (например, из cron)
+и целиком заменяется в одной транзакции, поэтому при выдаче
+?ordering=trending нет агрегаций - только чтение по месту в рейтинге.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import Favorite, Recipe, ShoppingCart, TrendingRecipe
+from core.versions import bump_model_versions
+
+FAVORITE_WEIGHT = 1.0
+# добавление в список покупок - более сильный сигнал, чем в избранное
+CART_WEIGHT = 2.0
+RECENCY_WEIGHT = 1.0
+
+
+def compute_scores(now=None):
+    """Оценки рецептов: словарь {id рецепта: оценка}."""
+    now = now or timezone.now()
+    since = now - timedelta(days=settings.TRENDING_WINDOW_DAYS)
+    half_life = timedelta(hours=settings.TRENDING_HALF_LIFE_HOURS)
+
+    def decay(moment):
+        return 0.5 ** ((now - moment) / half_life)
+
+    scores = defaultdict(float)
+    for model, weight in ((Favorite, FAVORITE_WEIGHT),
+                          (ShoppingCart, CART_WEIGHT)):
+        # добавления группируются по часам: строк не больше, чем
+        # рецептов на число часов в окне
+        rows = model.objects.filter(created__gte=since).annotate(
+            hour=TruncHour('created')
+        ).values('recipe_id', 'hour').annotate(
+            count=Count('pk')).values_list('recipe_id', 'hour', 'count')
+        for recipe_id, hour, count in rows.order_by():
+            scores[recipe_id] += weight * count * decay(hour)
+
+    recent = Recipe.objects.filter(pub_date__gte=since).values_list(
+        'pk', 'pub_date')
+    for recipe_id, pub_date in recent.order_by():
+        scores[recipe_id] += RECENCY_WEIGHT * decay(pub_date)
+    return scores
+
+
+def rebuild_trending(now=None):
+    """Пересчет рейтинга, возвращает количество рецептов в нем."""
+    scores = compute_scores(now)
+    ranking = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+    ranking = ranking[:settings.TRENDING_SIZE]
+    with transaction.atomic():
+        TrendingRecipe.objects.all().delete()
+        TrendingRecipe.objects.bulk_create(
+            TrendingRecipe(position=position, recipe_id=recipe_id,
+                           score=score)
+            for position, (recipe_id, score) in enumerate(ranking, 1)
+        )
+        bump_model_versions(TrendingRecipe)
+    return len(ranking)
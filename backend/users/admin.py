@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.contrib.auth import get_user_model
 
 from .models import Follow
+from recipes.feed import backfill_feed, remove_from_feed
 
 User = get_user_model()
 
@@ -9,6 +10,21 @@ User = get_user_model()
 class FollowAdmin(admin.ModelAdmin):
     list_display = ('user', 'following')
 
+    def save_model(self, request, follow, form, change):
+        if change:
+            old_follow = Follow.objects.get(pk=follow.pk)
+            remove_from_feed(old_follow.user, old_follow.following)
+        super().save_model(request, follow, form, change)
+        backfill_feed(follow.user, follow.following)
+
+    def delete_model(self, request, follow):
+        super().delete_model(request, follow)
+        remove_from_feed(follow.user, follow.following)
+
+    def delete_queryset(self, request, queryset):
+        for follow in queryset:
+            self.delete_model(request, follow)
+
 
 class UserAdmin(admin.ModelAdmin):
     list_display = ('username', 'first_name', 'last_name', 'email')
@@ -12,6 +12,9 @@ class FoodgramUser(AbstractUser):
 
     # по умолчанию для EmailField max_length=254
     email = models.EmailField('Почта', unique=True)
+    # рецепты автора с большим числом подписчиков не раскладываются
+    # по лентам подписчиков, а подмешиваются в ленту при ее чтении
+    feed_pull = models.BooleanField('Лента по запросу', default=False)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username',)
@@ -0,0 +1,31 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Follow
+from core.changes import get_change_op, record_change
+from core.models import Change
+from core.versions import bump_model_versions, bump_user_state
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # вход в админку меняет только last_login, которого нет в API
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    bump_model_versions(User)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    bump_model_versions(User)
+
+
+@receiver((post_save, post_delete), sender=Follow)
+def follow_changed(sender, instance, signal, **kwargs):
+    """Изменение is_subscribed и ленты подписок для подписчика."""
+    bump_user_state(instance.user_id)
+    record_change(Change.KIND_FOLLOW, instance.following_id,
+                  get_change_op(signal), instance.user_id)